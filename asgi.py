@@ -0,0 +1,202 @@
+import io
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import render_template, request, session, redirect, url_for
+
+from main import (app as flask_app, search_page_key, results_search_args, load_results, render_results_page,
+                  place_search_args, load_place_search, render_flight_search_customers_page, render_flight_search_customers_layout,
+                  render_flight_search_guest_page, fare_calendar_window, history_filter, load_history, render_history,
+                  ticket_lookup_args, render_tickets, load_seat_selection, render_seat_map, start_app)
+from utils import get_active_reservations_for_guest
+from utils_async import run_db
+from utils_cache import fragment_cache
+
+# Run with any ASGI server, for example: uvicorn asgi:app
+# The read heavy pages below are served by coroutines that wait for sqlite on the database executor (utils_async),
+# so a slow query does not hold a request thread. Every other route goes to the regular Flask app on a bounded thread pool.
+WSGI_WORKERS = 16
+
+_wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_WORKERS, thread_name_prefix="wsgi")
+
+
+async def _cached_search_page(route: str, render) -> str: #Async twin of main.cached_search_page, render is a coroutine function
+    key = search_page_key(route)
+    html = fragment_cache.get(key)
+    if html is None:
+        html, flight_numbers = await render()
+        fragment_cache.put(key, html, flight_numbers)
+    return html
+
+
+# Each page below is its Flask view split in two: the database part from main.py awaited on the database executor,
+# then main.py's render function on the event loop. Only the awaiting lives here.
+async def _render_results():
+    args = results_search_args()
+    return render_results_page(await run_db(load_results, *args), *args)
+
+
+async def results():
+    return await _cached_search_page("results", _render_results)
+
+
+async def _render_flight_search_customers():
+    return render_flight_search_customers_page(await run_db(load_place_search, *place_search_args()))
+
+
+async def flight_search_customers():
+    return render_flight_search_customers_layout(await _cached_search_page("flight_search_customers", _render_flight_search_customers))
+
+
+async def _render_flight_search_guest():
+    return render_flight_search_guest_page(await run_db(load_place_search, *place_search_args(), fare_calendar_window()))
+
+
+async def flight_search_guest():
+    return await _cached_search_page("flight_search_guest", _render_flight_search_guest)
+
+
+async def history():
+    if not session.get('user_email'):
+        return redirect(url_for('login'))
+    status_filter = history_filter()
+    return render_history(await run_db(load_history, session['user_email'], status_filter), status_filter)
+
+
+async def sign_in_show_tickets():
+    if request.method == "GET":
+        return render_template("sign_in_show_tickets.html")
+    email, reservation_code = ticket_lookup_args()
+    if reservation_code is None:
+        return render_template("sign_in_show_tickets.html", error="קוד לא תקין")
+    return render_tickets(await run_db(get_active_reservations_for_guest, email, reservation_code), email)
+
+
+def _seat_map_page(template: str):
+    async def page():
+        flight_number = int(request.form.get("flight_number"))
+        return render_seat_map(template, *await run_db(load_seat_selection, flight_number, session.get("seat_hold_token")))
+    return page
+
+
+ASYNC_ROUTES = {
+    ("GET", "/results"): results,
+    ("GET", "/flight_search_customers"): flight_search_customers,
+    ("GET", "/flight_search_guest"): flight_search_guest,
+    ("GET", "/history"): history,
+    ("GET", "/sign_in_show_tickets"): sign_in_show_tickets,
+    ("POST", "/sign_in_show_tickets"): sign_in_show_tickets,
+    ("POST", "/select_seats_guest"): _seat_map_page("select_seats_guest.html"),
+    ("POST", "/select_seats_customer"): _seat_map_page("select_seats_customer.html"),
+}
+
+
+def _build_environ(scope, body: bytes) -> dict: #Translate an ASGI http scope into a WSGI environ so Flask can parse the request
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin1").upper().replace("-", "_")
+        value = raw_value.decode("latin1")
+        if name == "CONTENT_LENGTH":
+            continue
+        if name != "CONTENT_TYPE":
+            name = "HTTP_" + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_response(send, status: int, headers, body: bytes):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _call_async_route(handler, environ, send):
+    with flask_app.request_context(environ):
+        try:
+            rv = flask_app.preprocess_request()
+            if rv is None:
+                rv = await handler()
+        except Exception as e:
+            rv = flask_app.handle_user_exception(e)
+        response = flask_app.finalize_request(rv)
+        await _send_response(send, response.status_code, response.headers.to_wsgi_list(), response.get_data())
+
+
+def _run_wsgi(environ): #Run the Flask app for one request and collect the status, headers and body
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured["status"] = int(status.split(" ", 1)[0])
+        captured["headers"] = headers
+        return lambda data: None
+
+    result = flask_app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return captured["status"], captured["headers"], body
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            start_app()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            _wsgi_executor.shutdown(wait=True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send): #ASGI entry point: async handlers for the read heavy pages, the Flask app for the rest
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    environ = _build_environ(scope, await _read_body(receive))
+    handler = ASYNC_ROUTES.get((scope["method"], scope["path"]))
+    if handler is not None:
+        await _call_async_route(handler, environ, send)
+        return
+
+    loop = asyncio.get_running_loop()
+    status, headers, body = await loop.run_in_executor(_wsgi_executor, _run_wsgi, environ)
+    await _send_response(send, status, headers, body)
+
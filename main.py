@@ -1,15 +1,20 @@
 from flask import Flask, render_template, request, jsonify, session, url_for, redirect
+from markupsafe import Markup
 from flask_session import Session
 import json
+import os
+import hashlib
+import secrets
+import threading
 from datetime import datetime,timedelta
-from utils import (db_conn, get_active_reservations_for_guest, cancel_reservation_for_guest,
+from utils import (db_conn, db_tx, publish, configure_db_pool, get_db_pool_stats, refresh_snapshot, get_snapshot_age, get_snapshot_stats, get_reference_stats, start_snapshot_refresher, reset_lock_wait, get_lock_wait_ms, set_sql_trace, start_sql_trace, stop_sql_trace, get_active_reservations_for_guest, cancel_reservation_for_guest,
                    get_all_flights_with_hours, cancel_flight_and_linked_reservations, get_flight_duration_minutes, is_long_flight,
     get_available_aircraft, get_available_pilots, get_available_attendants,
-    required_crew_counts, create_flight_with_crew_and_prices, generate_unique_flight_number, authenticate_user, signup_user, get_airport_countries, authenticate_manager, get_flight_with_aircraft,
-    get_classes_for_aircraft, is_card_exp_valid,
-    get_seats_for_flight_class,
-    get_taken_seats_for_flight,
-    create_reservation_with_seats, get_all_flights_with_hours_and_occupancy, get_all_airports, get_seats_for_aircraft_class, create_reservation_with_seats_with_customer_details, create_pilot, crew_member_exists_in_any_table,create_attendant,create_aircraft_with_classes_and_seats)
+    required_crew_counts, create_flight_with_crew_and_prices, generate_unique_flight_number, authenticate_user, signup_user, authenticate_manager, get_flight_with_aircraft,
+    is_card_exp_valid, seat_key, get_seat_prices,
+    get_classes_for_aircraft, get_seats_left,
+    acquire_seat_holds, get_own_held_seats, start_seat_hold_sweeper, SEAT_HOLD_SECONDS, SeatTakenError, SeatHeldError,
+    create_reservation_with_seats, get_all_flights_with_hours_and_occupancy, create_reservation_with_seats_with_customer_details, create_pilot, crew_member_exists_in_any_table,create_attendant,create_aircraft_with_classes_and_seats)
 
 from utils_reports import (
     report_avg_occupancy,
@@ -17,6 +22,10 @@ from utils_reports import (
     report_staff_hours,
     report_cancellation_rate,
     report_aircraft_monthly_summary)
+from utils_migrations import apply_migrations
+from utils_queries import HISTORY_FILTERS, query_all, query_one, execute, get_query_stats
+from utils_cache import fragment_cache, seat_map_cache
+from utils_search import search_index, airport_resolver, fare_calendar, connection_graph, place_trie, departure_board, keyset_page
 
 app = Flask(__name__)
 app.config.update(
@@ -25,10 +34,116 @@ app.config.update(
     SESSION_PERMANENT=True,
     PERMANENT_SESSION_LIFETIME=timedelta(minutes=60),
     SESSION_REFRESH_EACH_REQUEST=True,
-    SESSION_COOKIE_SECURE=False
+    SESSION_COOKIE_SECURE=False,
+    DB_POOL_SIZE=8,
+    DB_PRAGMAS={"cache_size": -16000, "mmap_size": 268435456, "temp_store": "MEMORY"},
+    DB_CONCURRENCY_MODE=os.environ.get("FLYTAU_DB_MODE", "pool"),
+    DB_AUTO_MIGRATE=True,
+    SQL_PROFILING=os.environ.get("FLYTAU_SQL_PROFILE", "0") == "1",
+    SQL_REPEAT_THRESHOLD=5,
+    REPORT_SNAPSHOT_INTERVAL=int(os.environ.get("FLYTAU_SNAPSHOT_INTERVAL", "0")),
+    FLIGHTS_PAGE_SIZE=50,
+    FLIGHTS_PAGE_SIZE_MAX=200,
+    FARE_CALENDAR_MAX_DAYS=15,
+    CONNECTION_MAX_LEGS=3,
+    CONNECTION_MIN_MINUTES=60,
+    CONNECTION_MAX_MINUTES=1440,
+    CONNECTIONS_SHOWN=5,
+    AUTOCOMPLETE_LIMIT=8,
+    DEPARTURE_BOARD_REFRESH=60,
+    DEPARTURE_BOARD_SIZE=20,
+    SEAT_HOLD_SWEEP_INTERVAL=60
 )
 Session(app)
 
+# Importing main only builds the app. The database setup and the background threads start in start_app,
+# called by `python main.py`, by the ASGI lifespan startup (asgi.py) or else by the first request.
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_app(): #Configure the pool, apply migrations and start the background refreshers, once per process
+    global _started
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        configure_db_pool(
+            size=app.config["DB_POOL_SIZE"],
+            pragmas=app.config["DB_PRAGMAS"],
+            mode=app.config["DB_CONCURRENCY_MODE"]
+        )
+        if app.config["DB_AUTO_MIGRATE"]:
+            apply_migrations()
+        set_sql_trace(app.config["SQL_PROFILING"])
+        if app.config["REPORT_SNAPSHOT_INTERVAL"] > 0:
+            start_snapshot_refresher(app.config["REPORT_SNAPSHOT_INTERVAL"])
+        departure_board.start_refresher(app.config["DEPARTURE_BOARD_REFRESH"])
+        start_seat_hold_sweeper(app.config["SEAT_HOLD_SWEEP_INTERVAL"])
+        _started = True
+
+
+@app.before_request
+def ensure_started(): #A WSGI server imports app without calling start_app, so the first request runs it
+    start_app()
+
+
+@app.before_request
+def start_lock_wait_timer(): #Reset the per request lock wait counter
+    reset_lock_wait()
+
+
+@app.after_request
+def report_lock_wait(response): #Report how long this request waited for database locks
+    waited_ms = get_lock_wait_ms()
+    response.headers["X-DB-Lock-Wait-ms"] = str(waited_ms)
+    if waited_ms > 0:
+        app.logger.info("db lock wait %s ms on %s %s", waited_ms, request.method, request.path)
+    return response
+
+
+@app.before_request
+def start_sql_profile(): #Start recording the SQL statements of this request when profiling is on
+    start_sql_trace()
+
+
+@app.after_request
+def report_sql_profile(response): #Add the request's SQL profile to a debug header and warn about repeated statements
+    trace = stop_sql_trace()
+    if trace is None:
+        return response
+    summary = trace.summary(app.config["SQL_REPEAT_THRESHOLD"])
+    response.headers["X-SQL-Profile"] = f"queries={summary['queries']}; distinct={summary['distinct']}; ms={summary['ms']}; rows={summary['rows']}"
+    if summary["repeated"]:
+        worst = summary["repeated"][0]
+        response.headers["X-SQL-Repeated"] = f"{worst['count']}x {worst['sql'][:200]}".encode("ascii", "replace").decode("ascii")
+        for agg in summary["repeated"]:
+            app.logger.warning(
+                "possible N+1 on %s %s: %sx (%s ms) %s",
+                request.method, request.path, agg["count"], agg["ms"], agg["sql"]
+            )
+    app.logger.info("sql profile %s %s: %s", request.method, request.path, response.headers["X-SQL-Profile"])
+    return response
+
+
+
+@app.route('/db_stats', methods=['GET'])
+def db_stats(): #Return connection pool counters and per query timings as JSON (logged in managers, or anyone in debug mode)
+    if "manager_id" not in session and not app.debug:
+        return jsonify({"error": "MANAGER_LOGIN_REQUIRED"}), 403
+    stats = get_db_pool_stats()
+    stats["queries"] = get_query_stats()
+    stats["snapshot"] = get_snapshot_stats()
+    stats["search_index"] = search_index.get_stats()
+    stats["fare_calendar"] = fare_calendar.get_stats()
+    stats["connection_graph"] = connection_graph.get_stats()
+    stats["reference_data"] = get_reference_stats()
+    stats["place_trie"] = place_trie.get_stats()
+    stats["departure_board"] = departure_board.get_stats()
+    stats["fragment_cache"] = fragment_cache.get_stats()
+    stats["seat_map_cache"] = seat_map_cache.get_stats()
+    return jsonify(stats)
 
 @app.route('/')
 def homepage(): #Render the homepage template
@@ -52,47 +167,7 @@ def login(): #Customer login validate input authenticate set session and redirec
         return render_template('login.html')
 
 
-@app.route('/history', methods=['GET'])
-def history(): #Show the logged in customer's reservation history with optional status filtering
-    if not session.get('user_email'):
-        return redirect(url_for('login'))
-    user_email = session['user_email']
-    status_filter = request.args.get('status', 'all')
-    query = """
-        SELECT 
-            r.reservation_code, 
-            r.flight_number, 
-            r.total_payment,
-            f.departure_datetime, 
-            f.origin_airport, 
-            f.destination_airport,
-            r.reservations_status as raw_status,
-            CASE 
-                WHEN r.reservations_status = 'ACTIVE' AND f.departure_datetime >= datetime('now') THEN 'פעילה'
-                WHEN r.reservations_status = 'ACTIVE' AND f.departure_datetime < datetime('now') THEN 'בוצעה'
-                WHEN r.reservations_status = 'CUSTOMER_CANCELED' THEN 'ביטול לקוח'
-                WHEN r.reservations_status = 'SYSTEM_CANCELED' THEN 'ביטול מערכת'
-                ELSE r.reservations_status
-            END as display_status
-        FROM reservations r
-        JOIN flight f ON r.flight_number = f.flight_number
-        WHERE r.email = ?
-    """
-    params = [user_email]
-    if status_filter == 'active_future':
-        query += " AND r.reservations_status = 'ACTIVE' AND f.departure_datetime >= datetime('now')"
-    elif status_filter == 'completed':
-        query += " AND r.reservations_status = 'ACTIVE' AND f.departure_datetime < datetime('now')"
-    elif status_filter == 'customer_cancelled':
-        query += " AND r.reservations_status = 'CUSTOMER_CANCELED'"
-    elif status_filter == 'system_cancelled':
-        query += " AND r.reservations_status = 'SYSTEM_CANCELED'"
-
-    query += " ORDER BY f.departure_datetime DESC"
-
-    with db_conn() as cur:
-        cur.execute(query, params)
-        orders = cur.fetchall()
+def history_rows(orders) -> list: #Prepare history rows: parse departure time, mark urgent flights and add the cancellation fee
     now = datetime.now()
     orders_list = []
     for o in orders:
@@ -108,8 +183,45 @@ def history(): #Show the logged in customer's reservation history with optional
         payment_value = o.get('total_payment') or o.get('total_price') or 0
         o['cancellation_fee'] = round(float(payment_value) * 0.05, 2)
         orders_list.append(o)
+    return orders_list
+
 
-    return render_template('history.html', orders=orders_list, current_filter=status_filter)
+def ticket_rows(reservations) -> list: #Prepare guest ticket rows: mark urgent flights and add the cancellation fee
+    now = datetime.now()
+    reservations_list = []
+    for r in reservations:
+        r = dict(r)
+        if r['departure_datetime']:
+            datetime_object = datetime.strptime(r['departure_datetime'], '%Y-%m-%d %H:%M:%S')
+            time_diff = datetime_object - now
+            r['is_urgent'] = time_diff < timedelta(hours=36) and time_diff > timedelta(0)
+        else:
+            r['is_urgent'] = False
+        payment_value = r.get('total_payment') or 0
+        r['cancellation_fee'] = round(float(payment_value) * 0.05, 2)
+        reservations_list.append(r)
+    return reservations_list
+
+
+def history_filter() -> str: #The ?status filter of /history, all when it is missing or unknown
+    status_filter = request.args.get('status', 'all')
+    return status_filter if status_filter in HISTORY_FILTERS else 'all'
+
+
+def load_history(user_email: str, status_filter: str) -> list: #Database part of /history (also awaited by the async page in asgi.py)
+    return query_all(f"customer_history_{status_filter}", (user_email,))
+
+
+def render_history(orders, status_filter: str):
+    return render_template('history.html', orders=history_rows(orders), current_filter=status_filter)
+
+
+@app.route('/history', methods=['GET'])
+def history(): #Show the logged in customer's reservation history with optional status filtering
+    if not session.get('user_email'):
+        return redirect(url_for('login'))
+    status_filter = history_filter()
+    return render_history(load_history(session['user_email'], status_filter), status_filter)
 
 @app.route('/cancel_reservation', methods=['POST'])
 def cancel_reservation(): #Cancel a logged in customer's reservation and update payment based on time of cancellation
@@ -120,78 +232,335 @@ def cancel_reservation(): #Cancel a logged in customer's reservation and update
     user_email = session['user_email']
 
     if res_code:
-        with db_conn() as cur:
-            cur.execute("""
-                SELECT f.departure_datetime, r.total_payment 
-                FROM reservations r
-                JOIN flight f ON r.flight_number = f.flight_number
-                WHERE r.reservation_code = ? AND r.email = ?
-            """, (res_code, user_email))
-
-            result = cur.fetchone()
+        with db_tx() as (conn, cur):
+            result = query_one("reservation_for_cancel", (res_code, user_email), cur=cur)
 
             if result:
                 original_price = result['total_payment']
                 now = datetime.now()
-                cur.execute("DELETE FROM seats_in_reservation WHERE reservation_code = ?", (res_code,))
+                execute("delete_reservation_seats", (res_code,), cur)
                 flight_time = datetime.strptime(result['departure_datetime'], '%Y-%m-%d %H:%M:%S')
                 if flight_time > now + timedelta(hours=36):
                     new_price = float(original_price) * 0.05
-                    cur.execute("""
-                        UPDATE reservations 
-                        SET reservations_status = 'CUSTOMER_CANCELED', 
-                            total_payment = ?
-                        WHERE reservation_code = ?
-                    """, (new_price, res_code))
+                    execute("cancel_reservation_with_fee", (new_price, res_code), cur)
                 else:
-                    cur.execute("""
-                        UPDATE reservations 
-                        SET reservations_status = 'CUSTOMER_CANCELED'
-                        WHERE reservation_code = ?
-                    """, (res_code,))
+                    execute("cancel_reservation_keep_payment", (res_code,), cur)
+        if result:
+            publish("reservations_changed", flight_number=result['flight_number'])
     return redirect(url_for('history'))
 
-@app.route('/flight_search_customers', methods=["GET"])
-def flight_search_customers(): #Search upcoming active flights for logged in customers optional filters by date/countries
+def suggestion_links(suggestions: dict) -> list: #"Did you mean" links from {field: suggested names}: the same search with that field replaced
+    links = []
+    for field, names in suggestions.items():
+        for name in names:
+            args = request.args.to_dict()
+            args[field] = name
+            links.append({"field": field, "name": name, "url": url_for(request.endpoint, **args)})
+    return links
+
+
+def resolve_search_places(origin_text: str, destination_text: str): #Turn the typed origin/destination into airport code sets and "did you mean" links
+    origin_airports, origin_suggestions = airport_resolver.resolve(origin_text)
+    destination_airports, destination_suggestions = airport_resolver.resolve(destination_text)
+    suggestions = suggestion_links({"origin_country": origin_suggestions, "destination_country": destination_suggestions})
+    return origin_airports, destination_airports, suggestions
+
+
+def with_seats_left(flights: list) -> list: #Copy search rows adding free seats per class from the inventory counters
+    seats_left = get_seats_left([f["flight_number"] for f in flights])
+    return [dict(f, seats_left=seats_left.get(f["flight_number"], {})) for f in flights]
+
+
+def load_first_page(flights: list) -> tuple: #First page of search results with free seats per class and the cursor of the next page (reads the database)
+    page, next_cursor = keyset_page(flights, None, app.config["FLIGHTS_PAGE_SIZE"])
+    return with_seats_left(page), next_cursor
+
+
+def first_flights_page(flights: list, first_page: tuple, from_today: bool = False) -> dict: #Template data of the first page from load_first_page, plus what its "load more" button needs to fetch the rest from /api/flights
+    page, next_cursor = first_page
+    api_args = {k: v for k, v in request.args.items() if v}
+    if from_today:
+        api_args["from_today"] = "1"
+    return {
+        "flights": page,
+        "flights_total": len(flights),
+        "next_cursor": next_cursor,
+        "api_url": url_for("api_flights", **api_args)
+    }
+
+
+@app.route('/api/flights', methods=['GET'])
+def api_flights(): #Upcoming flights as compact JSON, same filters as the search pages, keyset paginated with ETag support
     departure_date = (request.args.get("departure_datetime") or "").strip()
-    origin_country = (request.args.get("origin_country") or "").strip()
-    destination_country = (request.args.get("destination_country") or "").strip()
+    origin_airport = (request.args.get("origin_airport") or "").strip().upper()
+    destination_airport = (request.args.get("destination_airport") or "").strip().upper()
+    try:
+        limit = int(request.args.get("limit") or app.config["FLIGHTS_PAGE_SIZE"])
+    except ValueError:
+        return jsonify({"error": "INVALID_LIMIT"}), 400
+    limit = max(1, min(limit, app.config["FLIGHTS_PAGE_SIZE_MAX"]))
+
+    if origin_airport or destination_airport:
+        origin_airports = {origin_airport} if origin_airport else None
+        destination_airports = {destination_airport} if destination_airport else None
+        suggestions = []
+    else:
+        origin_airports, destination_airports, suggestions = resolve_search_places(
+            (request.args.get("origin_country") or "").strip(),
+            (request.args.get("destination_country") or "").strip()
+        )
+    flights = search_index.search(
+        departure_date=departure_date or None,
+        origin_airports=origin_airports,
+        destination_airports=destination_airports,
+        from_today=request.args.get("from_today") == "1"
+    )
+    try:
+        page, next_cursor = keyset_page(flights, request.args.get("after"), limit)
+    except ValueError:
+        return jsonify({"error": "INVALID_CURSOR"}), 400
+    page = with_seats_left(page)
+
+    body = json.dumps({
+        "columns": ["flight_number", "departure_datetime", "origin_airport", "origin_country", "destination_airport", "destination_country", "seats_left"],
+        "rows": [[f["flight_number"], f["departure_datetime"], f["origin_airport"], f["origin_country"], f["destination_airport"], f["destination_country"], f["seats_left"]] for f in page],
+        "next": next_cursor,
+        "suggestions": [s["name"] for s in suggestions]
+    }, ensure_ascii=False, separators=(",", ":"))
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(hashlib.sha1(body.encode("utf8")).hexdigest())
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+def fare_calendar_window(): #Read the flexible dates option of a search as (center date, days either side), None when it is off
+    try:
+        days = int(request.args.get("flex") or 0)
+        center = datetime.strptime((request.args.get("departure_datetime") or "").strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    if days <= 0:
+        return None
+    return center, min(days, app.config["FARE_CALENDAR_MAX_DAYS"])
+
+
+def fare_calendar_links(calendar: list) -> list: #Copy calendar days adding a link that searches that day
+    days = []
+    for day in calendar:
+        args = request.args.to_dict()
+        args["departure_datetime"] = day["date"]
+        days.append(dict(day, url=url_for("flight_search_guest", **args)))
+    return days
+
+
+@app.route('/api/aircraft/<int:aircraft_id_number>/layout', methods=['GET'])
+def api_aircraft_layout(aircraft_id_number): #Rows and columns of every class of an aircraft, the part of a seat map that never changes
+    classes = get_classes_for_aircraft(aircraft_id_number)
+    if not classes:
+        return jsonify({"error": "AIRCRAFT_NOT_FOUND"}), 404
+    response = jsonify({
+        "aircraft_id_number": aircraft_id_number,
+        "classes": [{"type": c["type"], "rows": c["number_of_rows"], "columns": c["number_of_columns"]} for c in classes]
+    })
+    response.set_etag(f"{aircraft_id_number}-{get_reference_stats()['version']}")
+    response.headers["Cache-Control"] = "public, max-age=86400"
+    return response.make_conditional(request)
+
+
+@app.route('/api/flights/<int:flight_number>/seatmap', methods=['GET'])
+def api_flight_seatmap(flight_number): #Prices and a base64 bitmap of seats that cannot be picked per class, the seat pages poll it
+    entry = seat_map_cache.get(flight_number)
+    if entry is None:
+        return jsonify({"error": "FLIGHT_NOT_FOUND"}), 404
+    response = app.response_class(entry["body"], mimetype="application/json")
+    response.set_etag(entry["etag"])
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+def seat_hold_token() -> str: #The id this browser's checkout holds seats under, kept in the session
+    if not session.get("seat_hold_token"):
+        session["seat_hold_token"] = secrets.token_hex(16)
+    return session["seat_hold_token"]
+
+
+def render_seat_map(template: str, entry, held_seats=(), **context): #Seat selection page drawn in the browser from a seat map cache entry and the seats this checkout holds, 404 if there is no such flight
+    if entry is None:
+        return "Flight not found", 404
+    seat_map = entry["payload"]
+    return render_template(template, flight=seat_map["flight"], class_types=seat_map["classes"], seat_map=seat_map, held_seats=list(held_seats), **context)
 
-    query = """
-        SELECT 
-            f.flight_number, 
-            f.departure_datetime, 
-            f.origin_airport, 
-            a1.country AS origin_country,
-            f.destination_airport, 
-            a2.country AS destination_country
-        FROM flight f
-        JOIN airport a1 ON f.origin_airport = a1.airport_name
-        JOIN airport a2 ON f.destination_airport = a2.airport_name
-        WHERE f.departure_datetime >= datetime('now') AND f.status = 'ACTIVE'
 
-    """
-    params = []
+def render_seat_page(template: str, flight_number: int, **context): #Seat selection page of one flight from the cached seat map
+    return render_seat_map(template, *load_seat_selection(flight_number, session.get("seat_hold_token")), **context)
 
-    if departure_date:
-        query += " AND DATE(f.departure_datetime) = ?"
-        params.append(departure_date)
 
-    if origin_country:
-        query += " AND a1.country LIKE ?"
-        params.append(f"%{origin_country}%")
+def render_seats_sold(template: str, flight_number: int, e: SeatTakenError): #Back to seat selection after a booking lost seats to another reservation, listing them (409)
+    return render_seat_page(template, flight_number, error="המושבים הבאים נמכרו בינתיים, יש לבחור מושבים אחרים:", sold_seats=e.seats), 409
 
-    if destination_country:
-        query += " AND a2.country LIKE ?"
-        params.append(f"%{destination_country}%")
 
-    query += " ORDER BY f.departure_datetime"
+def load_seat_selection(flight_number: int, hold_token: str | None): #Database part of the seat selection pages (also awaited by the async pages in asgi.py): the cached seat map and the seats this checkout holds on the flight
+    # only reads: the holds stay (another tab may be paying for them) until review_order holds other seats or they expire
+    return seat_map_cache.get(flight_number), get_own_held_seats(flight_number, hold_token)
 
-    with db_conn() as cursor:
-        cursor.execute(query, params)
-        flights = cursor.fetchall()
 
-    return render_template('flight_search_customers.html', flights=flights)
+@app.route('/api/fare_calendar', methods=['GET'])
+def api_fare_calendar(): #Lowest free ECONOMY/BUSINESS fare per day for a route around a date (departure_datetime, flex, origin/destination country or airport)
+    window = fare_calendar_window()
+    if not window:
+        return jsonify({"error": "INVALID_WINDOW"}), 400
+    origin_airport = (request.args.get("origin_airport") or "").strip().upper()
+    destination_airport = (request.args.get("destination_airport") or "").strip().upper()
+    origin_airports, destination_airports, suggestions = resolve_search_places(
+        (request.args.get("origin_country") or "").strip(),
+        (request.args.get("destination_country") or "").strip()
+    )
+    if origin_airport:
+        origin_airports = {origin_airport}
+    if destination_airport:
+        destination_airports = {destination_airport}
+    if not origin_airports or not destination_airports:
+        return jsonify({"error": "ROUTE_REQUIRED", "suggestions": [s["name"] for s in suggestions]}), 400
+    return jsonify({"days": fare_calendar.get(origin_airports, destination_airports, *window)})
+
+
+@app.route('/api/autocomplete', methods=['GET'])
+def api_autocomplete(): #Airports and countries whose English or Hebrew name starts with q (kind=airport/country to narrow)
+    kind = request.args.get("kind") or None
+    if kind not in (None, "airport", "country"):
+        return jsonify({"error": "INVALID_KIND"}), 400
+    items = place_trie.complete(request.args.get("q") or "", kind=kind, limit=app.config["AUTOCOMPLETE_LIMIT"])
+    response = jsonify({"items": items})
+    # the answer only changes with the airport table, let the browser reuse it while the user retypes
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return response
+
+
+def find_connections(origin_airports, destination_airports, departure_date: str) -> list: #Itineraries with at least one connection between the searched places (empty unless both are set)
+    if not origin_airports or not destination_airports:
+        return []
+    return connection_graph.search(
+        origin_airports,
+        destination_airports,
+        departure_date=departure_date or None,
+        max_legs=app.config["CONNECTION_MAX_LEGS"],
+        min_connection_minutes=app.config["CONNECTION_MIN_MINUTES"],
+        max_connection_minutes=app.config["CONNECTION_MAX_MINUTES"],
+        limit=app.config["CONNECTIONS_SHOWN"],
+        min_legs=2
+    )
+
+
+@app.route('/api/itineraries', methods=['GET'])
+def api_itineraries(): #Direct and connecting itineraries between two places (origin/destination country or airport, departure_datetime, max_legs)
+    origin_airport = (request.args.get("origin_airport") or "").strip().upper()
+    destination_airport = (request.args.get("destination_airport") or "").strip().upper()
+    origin_airports, destination_airports, suggestions = resolve_search_places(
+        (request.args.get("origin_country") or "").strip(),
+        (request.args.get("destination_country") or "").strip()
+    )
+    if origin_airport:
+        origin_airports = {origin_airport}
+    if destination_airport:
+        destination_airports = {destination_airport}
+    if not origin_airports or not destination_airports:
+        return jsonify({"error": "ROUTE_REQUIRED", "suggestions": [s["name"] for s in suggestions]}), 400
+    try:
+        max_legs = int(request.args.get("max_legs") or app.config["CONNECTION_MAX_LEGS"])
+    except ValueError:
+        return jsonify({"error": "INVALID_MAX_LEGS"}), 400
+    itineraries = connection_graph.search(
+        origin_airports,
+        destination_airports,
+        departure_date=(request.args.get("departure_datetime") or "").strip() or None,
+        max_legs=max(1, min(max_legs, app.config["CONNECTION_MAX_LEGS"])),
+        min_connection_minutes=app.config["CONNECTION_MIN_MINUTES"],
+        max_connection_minutes=app.config["CONNECTION_MAX_MINUTES"],
+        limit=app.config["FLIGHTS_PAGE_SIZE"]
+    )
+    return jsonify({"itineraries": itineraries})
+
+
+# query parameters each cached search page depends on, anything else in the URL does not change the page
+SEARCH_PAGE_PARAMS = {
+    "results": ("departure_datetime", "origin_airport", "destination_airport"),
+    "flight_search_guest": ("departure_datetime", "origin_country", "destination_country", "flex"),
+    "flight_search_customers": ("departure_datetime", "origin_country", "destination_country"),
+}
+
+
+def search_page_key(route: str) -> tuple: #Fragment cache key of a search page: the route and its trimmed query parameters
+    return (route,) + tuple((request.args.get(p) or "").strip() for p in SEARCH_PAGE_PARAMS[route])
+
+
+def shown_flight_numbers(flights, connections=()) -> set: #Every flight a search page lists, so a write to one of them drops the cached page
+    return {f["flight_number"] for f in flights} | {leg["flight_number"] for it in connections for leg in it["legs"]}
+
+
+def calendar_flight_numbers(calendar, origin_airports, destination_airports) -> set: #Flights behind a fare calendar: every upcoming flight on the route, any of them can change a day's price
+    if not calendar:
+        return set()
+    return shown_flight_numbers(search_index.search(departure_date=None, origin_airports=origin_airports, destination_airports=destination_airports))
+
+
+def cached_search_page(route: str, render) -> str: #Serve a search page from the fragment cache, render() gives back (html, flight numbers) on a miss
+    key = search_page_key(route)
+    html = fragment_cache.get(key)
+    if html is None:
+        html, flight_numbers = render()
+        fragment_cache.put(key, html, flight_numbers)
+    return html
+
+
+def place_search_args() -> tuple: #(departure date, origin text, destination text) typed into a country search page
+    return tuple((request.args.get(k) or "").strip() for k in ("departure_datetime", "origin_country", "destination_country"))
+
+
+#Database part of the country search pages (also awaited by the async pages in asgi.py): resolved airports, flights with their
+#first page, connections and, when calendar_window is given, the fare calendar
+def load_place_search(departure_date: str, origin_text: str, destination_text: str, calendar_window=None) -> dict:
+    origin_airports, origin_suggestions = airport_resolver.resolve(origin_text)
+    destination_airports, destination_suggestions = airport_resolver.resolve(destination_text)
+    flights = search_index.search(
+        departure_date=departure_date or None,
+        origin_airports=origin_airports,
+        destination_airports=destination_airports
+    )
+
+    calendar = None
+    if calendar_window and origin_airports and destination_airports:
+        calendar = fare_calendar.get(origin_airports, destination_airports, *calendar_window)
+
+    connections = find_connections(origin_airports, destination_airports, departure_date)
+    return {
+        "suggestions": {"origin_country": origin_suggestions, "destination_country": destination_suggestions},
+        "flights": flights,
+        "first_page": load_first_page(flights),
+        "calendar": calendar,
+        "connections": connections,
+        "flight_numbers": shown_flight_numbers(flights, connections) | calendar_flight_numbers(calendar, origin_airports, destination_airports),
+    }
+
+
+def render_flight_search_customers_page(data: dict): #Render the results part of flight_search_customers from load_place_search (no session data in it), gives back (html, flight numbers)
+    html = render_template('flight_search_customers_results.html',
+                           suggestions=suggestion_links(data["suggestions"]),
+                           connections=data["connections"],
+                           **first_flights_page(data["flights"], data["first_page"]))
+    return html, data["flight_numbers"]
+
+
+def render_flight_search_customers(): #Search for flight_search_customers and render its results part
+    return render_flight_search_customers_page(load_place_search(*place_search_args()))
+
+
+def render_flight_search_customers_layout(results_html: str): #The customer search page around its cached results part
+    return render_template('flight_search_customers.html', results_html=Markup(results_html))
+
+
+@app.route('/flight_search_customers', methods=["GET"])
+def flight_search_customers(): #Search upcoming active flights for logged in customers optional filters by date/countries
+    return render_flight_search_customers_layout(cached_search_page("flight_search_customers", render_flight_search_customers))
 
 
 @app.route('/signup', methods=['GET', 'POST'])
@@ -219,78 +588,60 @@ def signup(): #Register a new customer account and start a logged in session
             return render_template('signup.html', message=message)
     return render_template('signup.html')
 
+def render_flight_search_guest_page(data: dict): #Render flight_search_guest from load_place_search, gives back (html, flight numbers)
+    html = render_template('flight_search_guest.html',
+                           searched=any(place_search_args()),
+                           suggestions=suggestion_links(data["suggestions"]),
+                           calendar=None if data["calendar"] is None else fare_calendar_links(data["calendar"]),
+                           connections=data["connections"],
+                           **first_flights_page(data["flights"], data["first_page"]))
+    return html, data["flight_numbers"]
+
+
+def render_flight_search_guest(): #Search for flight_search_guest and render the page
+    return render_flight_search_guest_page(load_place_search(*place_search_args(), fare_calendar_window()))
+
+
 @app.route('/flight_search_guest', methods=["GET"])
 def flight_search_guest(): #Search upcoming active flights for guests and show available countries for filtering
-    departure_date = (request.args.get("departure_datetime") or "").strip()
-    origin_country = (request.args.get("origin_country") or "").strip()
-    destination_country = (request.args.get("destination_country") or "").strip()
-    searched = any([departure_date, origin_country, destination_country])
-    query = """
-        SELECT 
-            f.flight_number, 
-            f.departure_datetime, 
-            f.origin_airport, 
-            a1.country AS origin_country,
-            f.destination_airport, 
-            a2.country AS destination_country
-        FROM flight f
-        JOIN airport a1 ON f.origin_airport = a1.airport_name
-        JOIN airport a2 ON f.destination_airport = a2.airport_name
-        WHERE f.departure_datetime >= datetime('now') AND f.status = 'ACTIVE'
-
-    """
-    params = []
-    if departure_date:
-        query += " AND DATE(f.departure_datetime) = ?"
-        params.append(departure_date)
-    if origin_country:
-        query += " AND a1.country LIKE ?"
-        params.append(f"%{origin_country}%")
-    if destination_country:
-        query += " AND a2.country LIKE ?"
-        params.append(f"%{destination_country}%")
-    query += " ORDER BY f.departure_datetime"
-    with db_conn() as cursor:
-        cursor.execute(query, params)
-        flights = cursor.fetchall()
-
-    countries = get_airport_countries()
-    return render_template('flight_search_guest.html',
-                           flights=flights,
-                           searched=searched,
-                           countries=countries)
+    return cached_search_page("flight_search_guest", render_flight_search_guest)
 
-@app.route('/results', methods=["GET"])
-def results(): #Show flight search results by date and/or origin/destination airport
-    departure_date = (request.args.get("departure_datetime") or "").strip()
-    origin_airport = (request.args.get("origin_airport") or "").strip().upper()
-    destination_airport = (request.args.get("destination_airport") or "").strip().upper()
-    query = """
-        SELECT flight_number, departure_datetime, origin_airport, destination_airport
-        FROM flight
-        WHERE departure_datetime >= CURRENT_DATE AND status = 'ACTIVE'
-    """
-    params = []
-    if departure_date:
-        query += " AND DATE(departure_datetime) = ?"
-        params.append(departure_date)
-    if origin_airport:
-        query += " AND origin_airport = ?"
-        params.append(origin_airport)
-    if destination_airport:
-        query += " AND destination_airport = ?"
-        params.append(destination_airport)
-    query += " ORDER BY departure_datetime"
-    with db_conn() as cursor:
-        cursor.execute(query, params)
-        flights = cursor.fetchall()
-    return render_template(
+def results_search_args() -> tuple: #(departure date, origin airport, destination airport) of /results
+    return (
+        (request.args.get("departure_datetime") or "").strip(),
+        (request.args.get("origin_airport") or "").strip().upper(),
+        (request.args.get("destination_airport") or "").strip().upper()
+    )
+
+
+def load_results(departure_date: str, origin_airport: str, destination_airport: str) -> dict: #Database part of /results (also awaited by the async page in asgi.py)
+    flights = search_index.search(
+        departure_date=departure_date or None,
+        origin_airports={origin_airport} if origin_airport else None,
+        destination_airports={destination_airport} if destination_airport else None,
+        from_today=True
+    )
+    return {"flights": flights, "first_page": load_first_page(flights)}
+
+
+def render_results_page(data: dict, departure_date: str, origin_airport: str, destination_airport: str): #Render results.html from load_results, gives back (html, flight numbers)
+    html = render_template(
         "results.html",
-        flights=flights,
         departure_date=departure_date,
         origin_airport=origin_airport,
-        destination_airport=destination_airport
+        destination_airport=destination_airport,
+        **first_flights_page(data["flights"], data["first_page"], from_today=True)
     )
+    return html, shown_flight_numbers(data["flights"])
+
+
+def render_results(): #Search by date and/or airports and render results.html
+    args = results_search_args()
+    return render_results_page(load_results(*args), *args)
+
+@app.route('/results', methods=["GET"])
+def results(): #Show flight search results by date and/or origin/destination airport
+    return cached_search_page("results", render_results)
 
 @app.route('/login_managers', methods=['GET', 'POST'])
 def login_managers(): #Handle manager login validate ID and password set session and redirect
@@ -482,34 +833,29 @@ def manager_buy_aircraft(): #Manager buy a new aircraft choose manufacturer and
         message=f"המטוס נרכש ונוסף בהצלחה! מספר מטוס: {new_aircraft_id}"
     )
 
+def ticket_lookup_args(): #(email, reservation code) typed into sign_in_show_tickets, the code is None when it is not a number
+    email = (request.form.get("email") or "").strip().lower()
+    try:
+        reservation_code = int(request.form.get("reservation_code"))
+    except:
+        reservation_code = None
+    return email, reservation_code
+
+
+def render_tickets(reservations, email: str):
+    return render_template("tickets_results.html", reservations=ticket_rows(reservations), email=email)
+
+
 @app.route("/sign_in_show_tickets", methods=["GET", "POST"])
 def sign_in_show_tickets(): #Let a guest enter email and reservation code and view active reservations
     if request.method == "GET":
         return render_template("sign_in_show_tickets.html")
 
-    email = (request.form.get("email") or "").strip().lower()
-    reservation_code_raw = request.form.get("reservation_code")
-
-    try:
-        reservation_code = int(reservation_code_raw)
-    except:
+    email, reservation_code = ticket_lookup_args()
+    if reservation_code is None:
         return render_template("sign_in_show_tickets.html", error="קוד לא תקין")
 
-    reservations = get_active_reservations_for_guest(email, reservation_code)
-    now = datetime.now()
-    reservations_list = []
-    for r in reservations:
-        r = dict(r)
-        if r['departure_datetime']:
-            datetime_object = datetime.strptime(r['departure_datetime'], '%Y-%m-%d %H:%M:%S')
-            time_diff = datetime_object - now
-            r['is_urgent'] = time_diff < timedelta(hours=36) and time_diff > timedelta(0)
-        else:
-            r['is_urgent'] = False
-        payment_value = r.get('total_payment') or 0
-        r['cancellation_fee'] = round(float(payment_value) * 0.05, 2)
-        reservations_list.append(r)
-    return render_template("tickets_results.html", reservations=reservations_list, email=email)
+    return render_tickets(get_active_reservations_for_guest(email, reservation_code), email)
 
 
 @app.route("/cancel_reservation_post", methods=["POST"])
@@ -547,6 +893,25 @@ def cancel_reservation_post(): #Cancel a guest reservation using email and reser
                            message="ההזמנה בוטלה בהצלחה.")
 
 
+def departure_board_rows(airport: str): #The next departures from an airport for the board page and API, limit from ?limit=
+    try:
+        limit = int(request.args.get("limit") or app.config["DEPARTURE_BOARD_SIZE"])
+    except ValueError:
+        limit = app.config["DEPARTURE_BOARD_SIZE"]
+    return departure_board.get(airport.strip().upper(), max(1, min(limit, app.config["FLIGHTS_PAGE_SIZE_MAX"])))
+
+
+@app.route('/api/departures/<airport>', methods=['GET'])
+def api_departures(airport): #Live departure board of one origin airport as JSON
+    return jsonify({"airport": airport.strip().upper(), "departures": departure_board_rows(airport)})
+
+
+@app.route("/manager_departure_board", methods=["GET"])
+def manager_departure_board(): #Next departures from one airport with occupancy, for operations staff
+    airport = (request.args.get("airport") or "TLV").strip().upper()
+    return render_template("departure_board.html", airport=airport, departures=departure_board_rows(airport))
+
+
 @app.route("/cancel_flight_manager", methods=["GET"])
 def update_flight_manager(): #Show manager flight list with filters: upcoming, full, past, canceled
     flt = (request.args.get("filter") or "all").strip().lower()
@@ -591,11 +956,21 @@ def cancel_flight_post(): #Cancel a flight and update linked reservations
     msg = f"הטיסה {flight_number} בוטלה. עודכנו {result['reservations_updated']} הזמנות פעילות ל-SYSTEM_CANCELED ואופס התשלום."
     return render_template("cancel_flight_manager.html", flights=flights, message=msg)
 
+def resolve_manager_airport(text: str): #Airport code of a typed airport field (a code, or a country with one airport) as (code, None), else (None, error)
+    airports, suggestions = airport_resolver.resolve(text)
+    if airports and len(airports) == 1:
+        return next(iter(airports)), None
+    if airports:
+        return None, f"ל-{text} יש כמה שדות תעופה, יש לבחור אחד: {', '.join(sorted(airports))}"
+    if suggestions:
+        return None, f"שדה התעופה {text} לא נמצא. אולי התכוונת ל: {', '.join(suggestions)}"
+    return None, f"שדה התעופה {text} לא נמצא."
+
+
 @app.route("/manager_add_flight", methods=["GET", "POST"])
 def manager_add_flight(): #Create a new flight with aircraft crew and prices
-    airports = get_all_airports()
     if request.method == "GET":
-        return render_template("manager_add_flight.html", airports=airports)
+        return render_template("manager_add_flight.html")
 
     def render_step2( #Helper render step 2 of the add flight flow with all needed data and messages
         *,
@@ -655,7 +1030,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
         if duration is None:
             return render_template(
                 "manager_add_flight.html",
-                airports=airports,
                 error="המסלול שנבחר לא קיים במערכת."
             )
 
@@ -666,7 +1040,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
         except Exception:
             return render_template(
                 "manager_add_flight.html",
-                airports=airports,
                 error="תאריך/שעה לא תקינים."
             )
 
@@ -717,12 +1090,7 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
                 error=f"נתונים לא תקינים בשלב 2: {e}"
             )
 
-        with db_conn() as cur:
-            cur.execute(
-                "SELECT size FROM aircraft WHERE aircraft_id_number = ?;",
-                (aircraft_id_number,)
-            )
-            row = cur.fetchone()
+        row = query_one("aircraft_size", (aircraft_id_number,))
 
         if not row:
             return render_step2(
@@ -889,12 +1257,11 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
 
         return render_template(
             "manager_add_flight.html",
-            airports=airports,
             message=f"הטיסה {flight_number:04d} נוצרה בהצלחה "
         )
 
-    origin = (request.form.get("origin_airport") or "").strip().upper()
-    destination = (request.form.get("destination_airport") or "").strip().upper()
+    origin = (request.form.get("origin_airport") or "").strip()
+    destination = (request.form.get("destination_airport") or "").strip()
     dep_date = (request.form.get("departure_date") or "").strip()
     dep_time = (request.form.get("departure_time") or "").strip()
 
@@ -903,7 +1270,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
     if not (origin and destination and dep_date and dep_time and selected_size):
         return render_template(
             "manager_add_flight.html",
-            airports=airports,
             error="חובה לבחור מקור, יעד, גודל מטוס, תאריך ושעה.",
             origin_selected=origin,
             destination_selected=destination,
@@ -912,10 +1278,24 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
             departure_time=dep_time
         )
 
+    # the fields are free text with suggestions, only an existing airport goes on
+    origin_code, origin_error = resolve_manager_airport(origin)
+    destination_code, destination_error = resolve_manager_airport(destination)
+    if origin_error or destination_error:
+        return render_template(
+            "manager_add_flight.html",
+            error=origin_error or destination_error,
+            origin_selected=origin,
+            destination_selected=destination,
+            aircraft_size_selected=selected_size,
+            departure_date=dep_date,
+            departure_time=dep_time
+        )
+    origin, destination = origin_code, destination_code
+
     if origin == destination:
         return render_template(
             "manager_add_flight.html",
-            airports=airports,
             error="שדה מקור ושדה יעד לא יכולים להיות זהים.",
             origin_selected=origin,
             destination_selected=destination,
@@ -929,7 +1309,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
     except ValueError:
         return render_template(
             "manager_add_flight.html",
-            airports=airports,
             error="תאריך/שעה לא תקינים.",
             origin_selected=origin,
             destination_selected=destination,
@@ -941,7 +1320,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
     if departure_dt < datetime.now():
         return render_template(
             "manager_add_flight.html",
-            airports=airports,
             error="לא ניתן לבחור תאריך/שעה שכבר עברו.",
             origin_selected=origin,
             destination_selected=destination,
@@ -954,7 +1332,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
     if duration is None:
         return render_template(
             "manager_add_flight.html",
-            airports=airports,
             error=f"קו הטיסה שנבחר לא קיים במערכת: {origin} → {destination}",
             origin_selected=origin,
             destination_selected=destination,
@@ -968,7 +1345,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
     if long_required and selected_size == "SMALL":
         return render_template(
             "manager_add_flight.html",
-            airports=airports,
             error="טיסה ארוכה (מעל 6 שעות) מחייבת מטוס LARGE. בחרת SMALL ולכן אי אפשר להמשיך.",
             origin_selected=origin,
             destination_selected=destination,
@@ -988,7 +1364,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
     if not aircraft_list:
         return render_template(
             "manager_add_flight.html",
-            airports=airports,
             error=f"אין מטוס פנוי מתאים בגודל {selected_size} בתאריך/שעה שנבחרו.",
             origin_selected=origin,
             destination_selected=destination,
@@ -1001,7 +1376,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
         if len(pilots_list) < 3 or len(attendants_list) < 6:
             return render_template(
                 "manager_add_flight.html",
-                airports=airports,
                 error="אין מספיק אנשי צוות זמינים לטיסה ארוכה (צריך לפחות 3 טייסים ו-6 דיילים).",
                 origin_selected=origin,
                 destination_selected=destination,
@@ -1013,7 +1387,6 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
         if len(pilots_list) < 2 or len(attendants_list) < 3:
             return render_template(
                 "manager_add_flight.html",
-                airports=airports,
                 error="אין מספיק אנשי צוות זמינים לטיסה (צריך לפחות 2 טייסים ו-3 דיילים).",
                 origin_selected=origin,
                 destination_selected=destination,
@@ -1045,27 +1418,7 @@ def manager_add_flight(): #Create a new flight with aircraft crew and prices
 @app.route("/select_seats_guest", methods=["POST"])
 def select_seats(): #Show seat selection for a guest available seats per class and taken seats
     flight_number = int(request.form.get("flight_number"))
-
-    flight = get_flight_with_aircraft(flight_number)
-    if not flight:
-        return "Flight not found", 404
-
-    aircraft_id = flight["aircraft_id_number"]
-    classes = get_classes_for_aircraft(aircraft_id)
-
-    seats_by_class = {}
-    for c in classes:
-        seats_by_class[c["type"]] = get_seats_for_flight_class(flight_number, c["type"])
-
-    taken = get_taken_seats_for_flight(flight_number)
-
-    return render_template(
-        "select_seats_guest.html",
-        flight=flight,
-        classes=classes,
-        seats_by_class=seats_by_class,
-        taken=taken
-    )
+    return render_seat_map("select_seats_guest.html", *load_seat_selection(flight_number, session.get("seat_hold_token")))
 
 
 @app.route("/review_order", methods=["POST"])
@@ -1090,25 +1443,11 @@ def review_order(): #Create order summary validate seats calculate total and sav
     seats_details = []
     total = 0.0
 
+    prices, _missing = get_seat_prices(flight_number, aircraft_id, selected)
     for s in selected:
-        with db_conn() as cur:
-            cur.execute(
-                """
-                SELECT `price`
-                FROM `seats_in_flights`
-                WHERE `aircraft_id_number` = ?
-                  AND `flight_number` = ?
-                  AND `class_type` = ?
-                  AND `row_number` = ?
-                  AND `column_number` = ?
-                """,
-                (aircraft_id, flight_number, str(s.get("class_type")).upper(), s.get("row_number"),
-                 s.get("column_number"))
-            )
-            r = cur.fetchone()
-
-        if r:
-            price = float(r["price"] or 0)
+        key = seat_key(s)
+        if key in prices:
+            price = prices[key]
             total += price
             seats_details.append({
                 "class_type": s.get("class_type"),
@@ -1116,6 +1455,12 @@ def review_order(): #Create order summary validate seats calculate total and sav
                 "column_number": s.get("column_number"),
                 "price": price
             })
+
+    try:
+        acquire_seat_holds(seat_hold_token(), flight_number, aircraft_id, seats_details)
+    except ValueError as e:
+        return render_seat_page("select_seats_guest.html", flight_number, error=str(e)), 409
+
     session["pending_flight_number"] = flight_number
     session["pending_seats_json"] = seats_json
     session["pending_total"] = total
@@ -1125,7 +1470,8 @@ def review_order(): #Create order summary validate seats calculate total and sav
         flight=flight,
         seats=seats_details,
         total=total,
-        selected_seats_json=seats_json
+        selected_seats_json=seats_json,
+        hold_minutes=SEAT_HOLD_SECONDS // 60
     )
 
 @app.route("/place_order", methods=["GET"])
@@ -1189,21 +1535,8 @@ def place_order_customer(): #Load logged in customer profile and open the custom
     email = session["user_email"]
 
     with db_conn() as cur:
-        cur.execute("""
-            SELECT email, first_name, last_name
-            FROM customer
-            WHERE email = ?
-        """, (email,))
-        customer = cur.fetchone()
-
-        cur.execute("""
-            SELECT phone_number
-            FROM customer_phone_number
-            WHERE email = ?
-            ORDER BY phone_number
-        """, (email,))
-
-        raw_phones = cur.fetchall() or []
+        customer = query_one("customer_by_email", (email,), cur=cur)
+        raw_phones = query_all("customer_phones", (email,), cur=cur)
         phones = []
         for r in raw_phones:
             p_str = str(r["phone_number"]).strip()
@@ -1250,25 +1583,11 @@ def review_order_customer(): #Create customer order summary calculate total and
     seats_details = []
     total = 0.0
 
+    prices, _missing = get_seat_prices(flight_number, aircraft_id, selected)
     for s in selected:
-        with db_conn() as cur:
-            cur.execute(
-                """
-                SELECT `price`
-                FROM `seats_in_flights`
-                WHERE `aircraft_id_number` = ?
-                  AND `flight_number` = ?
-                  AND `class_type` = ?
-                  AND `row_number` = ?
-                  AND `column_number` = ?
-                """,
-                (aircraft_id, flight_number, str(s.get("class_type")).upper(),
-                 s.get("row_number"), s.get("column_number"))
-            )
-            r = cur.fetchone()
-
-        if r:
-            price = float(r["price"] or 0)
+        key = seat_key(s)
+        if key in prices:
+            price = prices[key]
             total += price
             seats_details.append({
                 "class_type": s.get("class_type"),
@@ -1277,6 +1596,11 @@ def review_order_customer(): #Create customer order summary calculate total and
                 "price": price
             })
 
+    try:
+        acquire_seat_holds(seat_hold_token(), flight_number, aircraft_id, seats_details)
+    except ValueError as e:
+        return render_seat_page("select_seats_customer.html", flight_number, error=str(e)), 409
+
     session["pending_flight_number"] = flight_number
     session["pending_seats_json"] = seats_json
     session["pending_total"] = total
@@ -1286,7 +1610,8 @@ def review_order_customer(): #Create customer order summary calculate total and
         flight=flight,
         seats=seats_details,
         total=total,
-        selected_seats_json=seats_json
+        selected_seats_json=seats_json,
+        hold_minutes=SEAT_HOLD_SECONDS // 60
     )
 
 
@@ -1303,28 +1628,19 @@ def confirm_seats(): #Confirm seats and create a reservation
         return "לא נבחרו מושבים", 400
 
     try:
-        reservation_code = create_reservation_with_seats(email, flight_number, seats)
+        reservation_code = create_reservation_with_seats(email, flight_number, seats, hold_token=session.get("seat_hold_token"))
+    except SeatTakenError as e:
+        return render_seats_sold("select_seats_customer.html", flight_number, e)
     except Exception as e:
-        flight = get_flight_with_aircraft(flight_number)
-        aircraft_id = flight["aircraft_id_number"]
-        classes = get_classes_for_aircraft(aircraft_id)
-        seats_by_class = {c["type"]: get_seats_for_aircraft_class(aircraft_id, c["type"]) for c in classes}
-        taken = get_taken_seats_for_flight(flight_number)
-
-        return render_template(
-            "select_seats_customer.html",
-            flight=flight,
-            classes=classes,
-            seats_by_class=seats_by_class,
-            taken=taken,
-            error=str(e)
-        )
+        return render_seat_page("select_seats_customer.html", flight_number, error=str(e))
 
     return render_template("reservation_success.html", reservation_code=reservation_code, email=email)
 
 @app.route("/manager_reports", methods=["GET"])
 def manager_reports(): #Show manager reports page and run the selected report image and table preview
     report_id = request.args.get("report", "1").strip()
+    if request.args.get("refresh") == "1":
+        refresh_snapshot()
 
     report_map = {
         "1": ("ממוצע נצילות טיסות שהתקיימו", report_avg_occupancy),
@@ -1336,6 +1652,7 @@ def manager_reports(): #Show manager reports page and run the selected report im
 
     title, fn = report_map.get(report_id, report_map["1"])
     img_path, df = fn()
+    snapshot_age_minutes = int(get_snapshot_age() or 0) // 60
 
     table_rows = []
     table_cols = []
@@ -1349,30 +1666,15 @@ def manager_reports(): #Show manager reports page and run the selected report im
         title=title,
         img_path=img_path,
         table_cols=table_cols,
-        table_rows=table_rows
+        table_rows=table_rows,
+        snapshot_age_minutes=snapshot_age_minutes
     )
 
 
 @app.route("/select_seats_customer", methods=["POST"])
 def select_seats_customer(): #Show seat selection for a logged in customer available seats per class and taken seats
     flight_number = int(request.form.get("flight_number"))
-    flight = get_flight_with_aircraft(flight_number)
-    if not flight:
-        return "Flight not found", 404
-    aircraft_id = flight["aircraft_id_number"]
-    classes = get_classes_for_aircraft(aircraft_id)
-    seats_by_class = {}
-    for c in classes:
-        seats_by_class[c["type"]] = get_seats_for_flight_class(flight_number, c["type"])
-    taken = get_taken_seats_for_flight(flight_number)
-
-    return render_template(
-        "select_seats_customer.html",
-        flight=flight,
-        classes=classes,
-        seats_by_class=seats_by_class,
-        taken=taken
-    )
+    return render_seat_map("select_seats_customer.html", *load_seat_selection(flight_number, session.get("seat_hold_token")))
 
 @app.route("/payment_guest", methods=["GET"])
 def payment(): #Show guest payment page using pending order from session
@@ -1424,10 +1726,16 @@ def payment_post(): #Validate payment details create guest reservation and clear
             last_name=cust["last_name"],
             phones=cust["phones"],
             flight_number=int(flight_number),
-            seats=selected
+            seats=selected,
+            hold_token=session.get("seat_hold_token")
         )
+    except SeatTakenError as e:
+        return render_seats_sold("select_seats_guest.html", int(flight_number), e)
+    except SeatHeldError as e:
+        # another checkout holds the seats now (this one's hold expired), back to picking seats like review_order
+        return render_seat_page("select_seats_guest.html", int(flight_number), error=str(e)), 409
     except Exception as e:
-        return render_template("payment_guest.html", error=str(e), total=session.get("pending_total"), email=cust.get("email")), 409
+        return render_template("payment_guest.html", error=str(e), total=session.get("pending_total"), email=cust.get("email")), 400
 
     session.pop("pending_flight_number", None)
     session.pop("pending_seats_json", None)
@@ -1463,21 +1771,8 @@ def payment_customer_post(): #Validate customer payment details create reservati
     email = session.get("user_email")
 
     with db_conn() as cur:
-        cur.execute("""
-            SELECT email, first_name, last_name
-            FROM customer
-            WHERE email = ?
-            LIMIT 1;
-        """, (email,))
-        customer = cur.fetchone()
-
-        cur.execute("""
-            SELECT phone_number
-            FROM customer_phone_number
-            WHERE email = ?
-            ORDER BY phone_number;
-        """, (email,))
-        phones = [r["phone_number"] for r in (cur.fetchall() or [])]
+        customer = query_one("customer_by_email", (email,), cur=cur)
+        phones = [r["phone_number"] for r in query_all("customer_phones", (email,), cur=cur)]
 
     if not customer:
         return redirect(url_for("flight_search_customers"))
@@ -1544,15 +1839,21 @@ def payment_customer_post(): #Validate customer payment details create reservati
             last_name=profile["last_name"],
             phones=profile["phones"],
             flight_number=int(flight_number),
-            seats=selected
+            seats=selected,
+            hold_token=session.get("seat_hold_token")
         )
+    except SeatTakenError as e:
+        return render_seats_sold("select_seats_customer.html", int(flight_number), e)
+    except SeatHeldError as e:
+        # another checkout holds the seats now (this one's hold expired), back to picking seats like review_order
+        return render_seat_page("select_seats_customer.html", int(flight_number), error=str(e)), 409
     except Exception as e:
         return render_template(
             "payment_customer.html",
             error=str(e),
             total=session.get("pending_total"),
             email=email
-        ), 409
+        ), 400
 
     session.pop("pending_flight_number", None)
     session.pop("pending_seats_json", None)
@@ -1573,4 +1874,5 @@ def payment_success_customer(): #Show customer payment success page with reserva
 
 
 if __name__ == '__main__':
+    start_app()
     app.run(debug=True)
\ No newline at end of file
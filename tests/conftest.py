@@ -0,0 +1,74 @@
+import os
+import sys
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import utils
+from utils_migrations import apply_migrations
+
+
+def copy_database(target_dir) -> str: #Copy the tracked FlyTAU_db.db into target_dir, the tests never open the original
+    path = os.path.join(str(target_dir), utils.DB_PATH)
+    shutil.copyfile(os.path.join(REPO_DIR, utils.DB_PATH), path)
+    return path
+
+
+@pytest.fixture
+def raw_db(tmp_path, monkeypatch): #A private copy of the database without migrations, the test runs inside its directory
+    copy_database(tmp_path)
+    # main keeps its flask sessions in a directory relative to the working directory
+    (tmp_path / "flask_session_data").mkdir()
+    monkeypatch.chdir(tmp_path)
+    utils.configure_db_pool(mode="pool")
+    yield tmp_path
+    utils.configure_db_pool(mode="pool")
+
+
+@pytest.fixture
+def db(raw_db): #The private copy with every migration applied and the in-memory reference data and search index loaded from it
+    apply_migrations()
+    utils.bump_reference_version()
+    from utils_search import search_index, departure_board
+    search_index.rebuild()
+    departure_board.rebuild()
+    return raw_db
+
+
+@pytest.fixture
+def client(db): #Flask test client on the private database (the startup work was already done by db)
+    import main
+    main._started = True
+    main.app.config["TESTING"] = True
+    return main.app.test_client()
+
+
+def create_test_flight(departure=None, econ=(3, 4), business=(2, 2), prices=None) -> int: #A new LARGE aircraft flying TLV -> ATH with no crew, returns the flight number
+    aircraft_id = utils.create_aircraft_with_classes_and_seats(
+        size="LARGE", manufacturer="Boeing", purchase_date="2020-01-01",
+        econ_rows=econ[0], econ_cols=econ[1], bus_rows=business[0], bus_cols=business[1]
+    )
+    flight_number = utils.generate_unique_flight_number()
+    utils.create_flight_with_crew_and_prices(
+        flight_number, aircraft_id, "TLV", "ATH",
+        departure or datetime.now().replace(microsecond=0) + timedelta(days=30),
+        [], [], prices or {"ECONOMY": 100, "BUSINESS": 300}
+    )
+    # every test database hands out the same flight numbers, drop what an earlier test cached for this one
+    from utils_cache import seat_map_cache
+    seat_map_cache.invalidate_flight(flight_number)
+    return flight_number
+
+
+def seat(flight_number: int, row: int, column: int, class_type: str = "ECONOMY") -> dict: #A selected seat as the seat pages post it
+    flight = utils.get_flight_with_aircraft(flight_number)
+    return {"aircraft_id_number": flight["aircraft_id_number"], "class_type": class_type, "row_number": row, "column_number": column}
+
+
+@pytest.fixture
+def flight(db) -> int:
+    return create_test_flight()
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils_search import keyset_page, encode_cursor, decode_cursor
+from conftest import create_test_flight
+
+
+ROWS = [
+    {"departure_datetime": "2030-01-01 08:00:00", "flight_number": 3},
+    {"departure_datetime": "2030-01-01 08:00:00", "flight_number": 7},
+    {"departure_datetime": "2030-01-01 09:30:00", "flight_number": 1},
+    {"departure_datetime": "2030-01-02 06:00:00", "flight_number": 2},
+    {"departure_datetime": "2030-01-03 12:00:00", "flight_number": 5},
+]
+
+
+def test_keyset_page_walks_every_row_once():
+    seen, after = [], None
+    while True:
+        page, after = keyset_page(ROWS, after, 2)
+        seen += [r["flight_number"] for r in page]
+        if after is None:
+            break
+    assert seen == [3, 7, 1, 2, 5]
+
+
+def test_keyset_page_continues_after_the_cursor_row():
+    # two flights share a departure time, the flight number breaks the tie
+    page, next_cursor = keyset_page(ROWS, encode_cursor(ROWS[0]), 2)
+    assert [r["flight_number"] for r in page] == [7, 1]
+    assert decode_cursor(next_cursor) == ("2030-01-01 09:30:00", 1)
+
+    page, next_cursor = keyset_page(ROWS, None, 10)
+    assert len(page) == 5 and next_cursor is None
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "bm8gc2VwYXJhdG9y", "eHx5"])
+def test_decode_cursor_refuses_foreign_text(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def _flights(client, **params):
+    response = client.get("/api/flights", query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_cursor_paging_covers_every_flight_once(client):
+    start = datetime.now().replace(microsecond=0) + timedelta(days=40)
+    created = [create_test_flight(departure=start + timedelta(hours=i % 3)) for i in range(5)]
+
+    everything = _flights(client, origin_airport="TLV", destination_airport="ATH", limit=200)
+    assert everything["next"] is None
+    all_numbers = [row[0] for row in everything["rows"]]
+    assert set(created) <= set(all_numbers)
+
+    paged, after = [], None
+    while True:
+        params = {"origin_airport": "TLV", "destination_airport": "ATH", "limit": 2}
+        if after:
+            params["after"] = after
+        body = _flights(client, **params)
+        assert len(body["rows"]) <= 2
+        paged += [row[0] for row in body["rows"]]
+        after = body["next"]
+        if after is None:
+            break
+    assert paged == all_numbers
+
+
+def test_bad_cursor_and_limit_are_400(client):
+    response = client.get("/api/flights?after=!!!")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "INVALID_CURSOR"}
+
+    response = client.get("/api/flights?limit=ten")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "INVALID_LIMIT"}
+
+
+def test_etag_answers_304_until_the_results_change(client, flight):
+    query = "/api/flights?origin_airport=TLV&destination_airport=ATH"
+    first = client.get(query)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    again = client.get(query, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+
+    # a new flight on the route changes the body and so the ETag
+    create_test_flight()
+    changed = client.get(query, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
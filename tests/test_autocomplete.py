@@ -0,0 +1,31 @@
+from utils import bump_reference_version, db_tx
+from utils_search import place_trie
+
+
+def _add_airports(country: str, count: int): #count airports in one country, more than a trie node keeps of one kind
+    with db_tx() as (conn, cur):
+        cur.executemany("INSERT INTO airport (airport_name, country) VALUES (?, ?);",
+                        [(f"U{chr(65 + i // 26)}{chr(65 + i % 26)}", country) for i in range(count)])
+    bump_reference_version()
+
+
+def test_countries_are_found_under_many_airports(client):
+    _add_airports("Uganda", place_trie.max_matches + 5)
+
+    response = client.get("/api/autocomplete", query_string={"q": "u", "kind": "country"})
+    assert response.status_code == 200
+    assert [item["value"] for item in response.get_json()["items"]] == ["UAE", "UK", "USA", "Uganda"]
+
+    airports = place_trie.complete("u", kind="airport", limit=100)
+    assert len(airports) == place_trie.max_matches
+    assert all(item["kind"] == "airport" for item in airports)
+
+
+def test_no_kind_lists_airports_then_countries(db):
+    items = place_trie.complete("is", limit=100)
+    assert [(item["kind"], item["value"]) for item in items] == [("airport", "IST"), ("airport", "TLV"), ("country", "Israel")]
+    assert place_trie.complete("is", kind="country") == [items[-1]]
+
+
+def test_unknown_kind_is_400(client):
+    assert client.get("/api/autocomplete?q=is&kind=city").status_code == 400
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+import utils
+from utils import SeatTakenError, create_reservation_with_seats, cancel_reservation_for_guest, db_conn
+from conftest import seat
+
+
+def _reservations_of(email: str) -> list:
+    with db_conn() as cur:
+        cur.execute("SELECT reservation_code, reservations_status FROM reservations WHERE email = ?;", (email,))
+        return cur.fetchall()
+
+
+def test_second_booking_of_a_sold_seat_raises_seat_taken(flight):
+    create_reservation_with_seats("first@test.com", flight, [seat(flight, 1, 1)])
+
+    with pytest.raises(SeatTakenError) as raised:
+        create_reservation_with_seats("second@test.com", flight, [seat(flight, 1, 1), seat(flight, 1, 2)])
+
+    assert raised.value.seats == [{"class_type": "ECONOMY", "row_number": 1, "column_number": 1}]
+    # the reservation row and the free seat of the refused booking were rolled back with it
+    assert _reservations_of("second@test.com") == []
+    create_reservation_with_seats("third@test.com", flight, [seat(flight, 1, 2)])
+
+
+def test_class_type_is_stored_normalized(flight):
+    lower = dict(seat(flight, 2, 1), class_type=" economy ")
+    code = create_reservation_with_seats("first@test.com", flight, [lower])
+
+    with db_conn() as cur:
+        cur.execute("SELECT class_type, flight_number, active FROM seats_in_reservation WHERE reservation_code = ?;", (code,))
+        row = cur.fetchone()
+    assert (row["class_type"], row["flight_number"], row["active"]) == ("ECONOMY", flight, 1)
+
+    with pytest.raises(SeatTakenError):
+        create_reservation_with_seats("second@test.com", flight, [seat(flight, 2, 1)])
+
+
+def test_cancelled_reservation_frees_its_seats(flight):
+    code = create_reservation_with_seats("first@test.com", flight, [seat(flight, 1, 1)])
+    assert cancel_reservation_for_guest("first@test.com", code)
+
+    create_reservation_with_seats("second@test.com", flight, [seat(flight, 1, 1)])
+
+
+def test_unique_index_rejects_a_direct_double_insert(flight):
+    code = create_reservation_with_seats("first@test.com", flight, [seat(flight, 1, 1)])
+    other = create_reservation_with_seats("second@test.com", flight, [seat(flight, 1, 2)])
+
+    with pytest.raises(utils.sqlite3.IntegrityError):
+        with utils.db_tx() as (conn, cur):
+            cur.execute("""
+                INSERT INTO seats_in_reservation
+                (reservation_code, aircraft_id_number, class_type, `row_number`, column_number, flight_number, active)
+                SELECT ?, aircraft_id_number, class_type, `row_number`, column_number, flight_number, 1
+                FROM seats_in_reservation WHERE reservation_code = ?;
+            """, (other, code))
+
+
+def _pending_guest_order(client, flight_number: int, seats: list):
+    with client.session_transaction() as s:
+        s["pending_flight_number"] = flight_number
+        s["pending_seats_json"] = json.dumps(seats)
+        s["pending_total"] = 100
+        s["pending_customer"] = {"email": "guest@test.com", "first_name": "G", "last_name": "T", "phones": ["0501234567"]}
+
+
+CARD = {"card_name": "G T", "card_number": "4111111111111111", "exp": "12/39", "cvv": "123"}
+
+
+def test_payment_of_a_sold_seat_answers_409_listing_it(client, flight):
+    create_reservation_with_seats("first@test.com", flight, [seat(flight, 3, 4)])
+    _pending_guest_order(client, flight, [seat(flight, 3, 4)])
+
+    response = client.post("/payment_post", data=CARD)
+
+    assert response.status_code == 409
+    body = response.get_data(as_text=True)
+    assert "ECONOMY – שורה 3, מושב 4" in body
+    assert _reservations_of("guest@test.com") == []
+
+
+def test_payment_of_a_seat_not_on_the_flight_answers_400(client, flight):
+    _pending_guest_order(client, flight, [seat(flight, 99, 1)])
+
+    response = client.post("/payment_post", data=CARD)
+
+    assert response.status_code == 400
+
+
+def test_payment_of_free_seats_books_them(client, flight):
+    _pending_guest_order(client, flight, [seat(flight, 3, 3)])
+
+    response = client.post("/payment_post", data=CARD)
+
+    assert response.status_code == 302
+    assert [r["reservations_status"] for r in _reservations_of("guest@test.com")] == ["ACTIVE"]
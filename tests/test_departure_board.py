@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from utils import cancel_flight_and_linked_reservations
+from utils_search import DepartureBoard
+from conftest import create_test_flight
+
+
+def _in_days(days: float) -> datetime:
+    return datetime.now().replace(microsecond=0) + timedelta(days=days)
+
+
+def _numbers(rows: list) -> list:
+    return [r["flight_number"] for r in rows]
+
+
+def test_far_departures_are_on_the_board(client):
+    later = create_test_flight(departure=_in_days(20))
+    sooner = create_test_flight(departure=_in_days(5))
+
+    response = client.get("/api/departures/tlv")
+    assert response.status_code == 200
+    assert _numbers(response.get_json()["departures"])[:2] == [sooner, later]
+
+
+def test_board_keeps_the_next_flights_of_each_origin(db):
+    flights = [create_test_flight(departure=_in_days(days)) for days in (3, 6, 9)]
+    board = DepartureBoard(per_airport=2)
+    board.rebuild()
+
+    assert _numbers(board.get("TLV", limit=2)) == flights[:2]
+    assert board.get_stats()["flights"] == 2
+    # more than the board keeps is read from the database
+    assert _numbers(board.get("TLV", limit=5)) == flights
+    assert board.get_stats()["fallbacks"] == 1
+
+
+def test_board_follows_created_and_cancelled_flights(db):
+    first, second = create_test_flight(departure=_in_days(4)), create_test_flight(departure=_in_days(8))
+    board = DepartureBoard(per_airport=2)
+    board.rebuild()
+
+    # an earlier flight pushes the last kept one off the board
+    earlier = create_test_flight(departure=_in_days(2))
+    board.refresh_flight(earlier)
+    assert _numbers(board.get("TLV", limit=2)) == [earlier, first]
+
+    cancel_flight_and_linked_reservations(first)
+    board.refresh_flight(first)
+    assert _numbers(board.get("TLV", limit=2)) == [earlier, second]
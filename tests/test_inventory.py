@@ -0,0 +1,72 @@
+from utils import (create_reservation_with_seats, cancel_reservation_for_guest, cancel_flight_and_linked_reservations,
+                   get_seats_left, db_conn, db_tx)
+from utils_queries import execute
+from conftest import create_test_flight, seat
+
+
+def _inventory(flight_number: int) -> dict:
+    with db_conn() as cur:
+        cur.execute("SELECT class_type, total_seats, taken_seats FROM flight_inventory WHERE flight_number = ?;", (flight_number,))
+        return {r["class_type"]: (r["total_seats"], r["taken_seats"]) for r in cur.fetchall()}
+
+
+def _recounted(flight_number: int) -> dict: #The same counters computed from seats_in_flights and the ACTIVE reservations
+    with db_conn() as cur:
+        cur.execute("""
+            SELECT sf.class_type, COUNT(*) AS total_seats,
+                   (SELECT COUNT(*)
+                    FROM reservations r
+                    JOIN seats_in_reservation sir ON sir.reservation_code = r.reservation_code
+                    WHERE r.flight_number = sf.flight_number
+                      AND r.reservations_status = 'ACTIVE'
+                      AND sir.class_type = sf.class_type) AS taken_seats
+            FROM seats_in_flights sf
+            WHERE sf.flight_number = ?
+            GROUP BY sf.class_type;
+        """, (flight_number,))
+        return {r["class_type"]: (r["total_seats"], r["taken_seats"]) for r in cur.fetchall()}
+
+
+def test_new_flight_counts_its_seats(db):
+    flight = create_test_flight(econ=(3, 4), business=(2, 2))
+
+    assert _inventory(flight) == {"ECONOMY": (12, 0), "BUSINESS": (4, 0)}
+    assert get_seats_left([flight]) == {flight: {"BUSINESS": 4, "ECONOMY": 12}}
+
+
+def test_booking_and_cancelling_move_the_taken_counters(flight):
+    code = create_reservation_with_seats("a@test.com", flight, [seat(flight, 1, 1), seat(flight, 1, 2), seat(flight, 1, 1, "BUSINESS")])
+    assert _inventory(flight) == {"ECONOMY": (12, 2), "BUSINESS": (4, 1)}
+    assert get_seats_left([flight])[flight] == {"BUSINESS": 3, "ECONOMY": 10}
+
+    assert cancel_reservation_for_guest("a@test.com", code)
+    assert _inventory(flight) == {"ECONOMY": (12, 0), "BUSINESS": (4, 0)}
+
+
+def test_customer_cancel_with_fee_releases_the_deleted_seats(flight):
+    code = create_reservation_with_seats("a@test.com", flight, [seat(flight, 2, 1), seat(flight, 2, 2)])
+
+    # what main.cancel_reservation runs: the seats go first, then the status changes
+    with db_tx() as (conn, cur):
+        execute("delete_reservation_seats", (code,), cur)
+        execute("cancel_reservation_with_fee", (5.0, code), cur)
+
+    assert _inventory(flight)["ECONOMY"] == (12, 0)
+
+
+def test_cancelled_flight_releases_every_reservation(flight):
+    create_reservation_with_seats("a@test.com", flight, [seat(flight, 1, 1)])
+    create_reservation_with_seats("b@test.com", flight, [seat(flight, 1, 2), seat(flight, 1, 1, "BUSINESS")])
+
+    assert cancel_flight_and_linked_reservations(flight)["reservations_updated"] == 2
+    assert _inventory(flight) == {"ECONOMY": (12, 0), "BUSINESS": (4, 0)}
+
+
+def test_counters_match_a_recount_after_mixed_writes(flight):
+    first = create_reservation_with_seats("a@test.com", flight, [seat(flight, 1, 1), seat(flight, 3, 4)])
+    create_reservation_with_seats("b@test.com", flight, [seat(flight, 2, 2, "BUSINESS")])
+    cancel_reservation_for_guest("a@test.com", first)
+    create_reservation_with_seats("c@test.com", flight, [seat(flight, 1, 1)])
+
+    assert _inventory(flight) == _recounted(flight)
+    assert _inventory(flight) == {"ECONOMY": (12, 1), "BUSINESS": (4, 1)}
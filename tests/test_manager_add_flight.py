@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from utils import bump_reference_version, db_tx
+
+
+def _step1(client, origin: str, destination: str):
+    departure = datetime.now() + timedelta(days=20)
+    return client.post("/manager_add_flight", data={
+        "origin_airport": origin,
+        "destination_airport": destination,
+        "aircraft_size": "LARGE",
+        "departure_date": departure.strftime("%Y-%m-%d"),
+        "departure_time": "10:00",
+    })
+
+
+def test_typed_code_or_country_reaches_step_two(client):
+    response = _step1(client, "tlv", "Greece")
+    page = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert '<input type="hidden" name="origin_airport" value="TLV">' in page
+    assert '<input type="hidden" name="destination_airport" value="ATH">' in page
+
+
+def test_unknown_airport_is_named_in_the_error(client):
+    page = _step1(client, "Tel Aviv", "ATH").get_data(as_text=True)
+    assert "שדה התעופה Tel Aviv לא נמצא" in page
+    assert 'name="origin_airport"' in page and 'type="hidden"' not in page
+
+
+def test_country_with_several_airports_asks_for_one(client):
+    with db_tx() as (conn, cur):
+        cur.execute("INSERT INTO airport (airport_name, country) VALUES ('SAW', 'Turkey');")
+    bump_reference_version()
+
+    page = _step1(client, "TLV", "Turkey").get_data(as_text=True)
+    assert "יש לבחור אחד: IST, SAW" in page
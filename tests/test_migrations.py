@@ -0,0 +1,105 @@
+import sqlite3
+
+import pytest
+
+import utils_migrations
+import utils
+from utils import db_conn
+from utils_migrations import MIGRATIONS, apply_migrations, get_schema_version, migration_status
+
+
+def _index_names(table: str) -> set:
+    with db_conn() as cur:
+        cur.execute(f"PRAGMA index_list({table});")
+        return {r["name"] for r in cur.fetchall()}
+
+
+def test_apply_migrations_runs_every_version_once(raw_db):
+    latest = max(version for version, _, _ in MIGRATIONS)
+    assert get_schema_version() == 0
+
+    assert apply_migrations() == sorted(version for version, _, _ in MIGRATIONS)
+    assert get_schema_version() == latest
+    assert all(m["applied_at"] for m in migration_status())
+
+    # a second run finds nothing pending and changes nothing
+    assert apply_migrations() == []
+    assert get_schema_version() == latest
+
+
+def test_apply_migrations_stops_at_target(raw_db):
+    assert apply_migrations(target=1) == [1]
+    assert get_schema_version() == 1
+    assert [m["version"] for m in migration_status() if m["applied_at"]] == [1]
+    assert "idx_flight_status_departure" in _index_names("flight")
+
+    assert apply_migrations(target=3) == [2, 3]
+    assert get_schema_version() == 3
+
+
+def test_hot_path_indexes_are_used(db):
+    with db_conn() as cur:
+        cur.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT flight_number FROM flight WHERE status = 'ACTIVE' AND departure_datetime >= ?;
+        """, ("2030-01-01",))
+        plan = " ".join(r["detail"] for r in cur.fetchall())
+    assert "idx_flight_status_departure" in plan
+
+
+def test_failed_migration_is_rolled_back(raw_db, monkeypatch):
+    def broken(cur):
+        raise sqlite3.OperationalError("boom")
+
+    apply_migrations(target=1)
+    patched = [(v, name, [*steps, broken]) if v == 2 else (v, name, steps) for v, name, steps in MIGRATIONS]
+    monkeypatch.setattr(utils_migrations, "MIGRATIONS", patched)
+
+    with pytest.raises(sqlite3.OperationalError):
+        apply_migrations(target=2)
+    assert get_schema_version() == 1
+    # the column migration 2 added before the failing step went with the rest of it
+    with db_conn() as cur:
+        cur.execute("PRAGMA table_info(flight);")
+        assert "arrival_datetime" not in [r["name"] for r in cur.fetchall()]
+
+
+def _double_book_a_seat() -> int: #Give a second ACTIVE reservation of the same flight a seat an ACTIVE reservation already has, return its code
+    with utils.db_tx() as (conn, cur):
+        cur.execute("""
+            SELECT r.flight_number, r.email, sir.aircraft_id_number, sir.class_type, sir.`row_number`, sir.column_number
+            FROM seats_in_reservation sir
+            JOIN reservations r ON r.reservation_code = sir.reservation_code
+            WHERE r.reservations_status = 'ACTIVE'
+            LIMIT 1;
+        """)
+        taken = cur.fetchone()
+        cur.execute("SELECT MAX(reservation_code) + 1 AS code FROM reservations;")
+        code = cur.fetchone()["code"]
+        cur.execute("""
+            INSERT INTO reservations (reservation_code, reservations_status, reservation_date, total_payment, email, flight_number)
+            VALUES (?, 'ACTIVE', DATE('now'), 0, ?, ?);
+        """, (code, taken["email"], taken["flight_number"]))
+        cur.execute("""
+            INSERT INTO seats_in_reservation (reservation_code, aircraft_id_number, class_type, `row_number`, column_number)
+            VALUES (?, ?, ?, ?, ?);
+        """, (code, taken["aircraft_id_number"], taken["class_type"], taken["row_number"], taken["column_number"]))
+    return code
+
+
+def test_one_active_reservation_per_seat_refuses_double_bookings(raw_db):
+    apply_migrations(target=5)
+    code = _double_book_a_seat()
+
+    with pytest.raises(RuntimeError) as raised:
+        apply_migrations()
+    assert "seats sold twice" in str(raised.value)
+    assert str(code) in str(raised.value)
+    assert get_schema_version() == 5
+    assert "ux_seats_in_reservation_active" not in _index_names("seats_in_reservation")
+
+    # once one of the two reservations is cancelled the migration goes through
+    with utils.db_tx() as (conn, cur):
+        cur.execute("UPDATE reservations SET reservations_status = 'CUSTOMER_CANCELED' WHERE reservation_code = ?;", (code,))
+    assert 6 in apply_migrations()
+    assert "ux_seats_in_reservation_active" in _index_names("seats_in_reservation")
@@ -0,0 +1,143 @@
+import json
+
+import pytest
+
+from utils import (SeatTakenError, SeatHeldError, acquire_seat_holds, release_seat_holds, sweep_expired_seat_holds,
+                   create_reservation_with_seats, get_flight_with_aircraft, get_seat_page, db_conn, db_tx)
+from utils_seatmap import SeatMap
+from conftest import create_test_flight, seat
+
+
+def _hold(token: str, flight_number: int, seats: list):
+    return acquire_seat_holds(token, flight_number, get_flight_with_aircraft(flight_number)["aircraft_id_number"], seats)
+
+
+def _held_seats(token: str) -> list:
+    with db_conn() as cur:
+        cur.execute("SELECT class_type, `row_number`, column_number FROM seat_holds WHERE hold_token = ? ORDER BY 2, 3;", (token,))
+        return [(r["class_type"], r["row_number"], r["column_number"]) for r in cur.fetchall()]
+
+
+def _expire(token: str):
+    with db_tx() as (conn, cur):
+        cur.execute("UPDATE seat_holds SET expires_at = datetime('now', '-1 seconds') WHERE hold_token = ?;", (token,))
+
+
+def test_a_held_seat_cannot_be_held_or_bought_by_another_checkout(flight):
+    assert _hold("a", flight, [seat(flight, 1, 1)])
+
+    with pytest.raises(SeatHeldError) as raised:
+        _hold("b", flight, [seat(flight, 1, 1), seat(flight, 1, 2)])
+    assert raised.value.seats == [{"class_type": "ECONOMY", "row_number": 1, "column_number": 1}]
+    assert _held_seats("b") == []
+
+    with pytest.raises(SeatHeldError):
+        create_reservation_with_seats("b@test.com", flight, [seat(flight, 1, 1)], hold_token="b")
+    with pytest.raises(ValueError):
+        create_reservation_with_seats("c@test.com", flight, [seat(flight, 1, 1)])
+
+
+def test_the_holder_buys_its_seats_and_the_hold_is_gone(flight):
+    _hold("a", flight, [seat(flight, 1, 1), seat(flight, 1, 2)])
+
+    create_reservation_with_seats("a@test.com", flight, [seat(flight, 1, 1), seat(flight, 1, 2)], hold_token="a")
+
+    assert _held_seats("a") == []
+    with pytest.raises(SeatTakenError):
+        _hold("b", flight, [seat(flight, 1, 1)])
+
+
+def test_a_refused_hold_keeps_the_earlier_holds_of_the_checkout(flight):
+    _hold("a", flight, [seat(flight, 2, 1)])
+    create_reservation_with_seats("x@test.com", flight, [seat(flight, 3, 1)])
+
+    with pytest.raises(SeatTakenError):
+        _hold("a", flight, [seat(flight, 3, 1)])
+    assert _held_seats("a") == [("ECONOMY", 2, 1)]
+
+
+def test_holding_again_replaces_the_earlier_seats(flight):
+    _hold("a", flight, [seat(flight, 1, 1)])
+    _hold("a", flight, [seat(flight, 2, 2)])
+    assert _held_seats("a") == [("ECONOMY", 2, 2)]
+
+    release_seat_holds("a")
+    assert _held_seats("a") == []
+
+
+def test_expired_holds_are_taken_over_and_swept(flight):
+    _hold("a", flight, [seat(flight, 1, 1)])
+    _hold("c", flight, [seat(flight, 2, 2)])
+    _expire("a")
+
+    _hold("b", flight, [seat(flight, 1, 1)])
+    assert _held_seats("b") == [("ECONOMY", 1, 1)]
+
+    _expire("c")
+    assert sweep_expired_seat_holds() == 1
+    assert _held_seats("c") == []
+    assert _held_seats("b") == [("ECONOMY", 1, 1)]
+
+
+def test_seat_page_shows_held_seats(flight):
+    _hold("a", flight, [seat(flight, 1, 2)])
+
+    page = get_seat_page(flight)
+    assert page["hold_maps"]["ECONOMY"].is_taken(1, 2)
+    assert not page["hold_maps"]["ECONOMY"].is_taken(1, 1)
+    assert not page["seat_maps"]["ECONOMY"].is_taken(1, 2)
+
+
+def test_review_order_holds_the_seats_for_its_checkout(client, flight):
+    import main
+    other = main.app.test_client()
+    form = {"flight_number": flight, "selected_seats_json": json.dumps([seat(flight, 1, 1)])}
+
+    assert client.post("/review_order", data=form).status_code == 200
+    response = other.post("/review_order", data=form)
+
+    assert response.status_code == 409
+    assert "שמורים כרגע להזמנה אחרת" in response.get_data(as_text=True)
+
+
+def test_payment_after_losing_the_hold_goes_back_to_seat_selection(client, flight):
+    form = {"flight_number": flight, "selected_seats_json": json.dumps([seat(flight, 1, 1)])}
+    assert client.post("/review_order", data=form).status_code == 200
+    with client.session_transaction() as checkout:
+        checkout["pending_customer"] = {"email": "a@test.com", "first_name": "A", "last_name": "B", "phones": ["0500000000"]}
+        token = checkout["seat_hold_token"]
+    # the checkout took too long and another one holds the seat now
+    _expire(token)
+    _hold("b", flight, [seat(flight, 1, 1)])
+
+    response = client.post("/payment_post", data={"card_name": "A B", "card_number": "4111111111111111", "exp": "12/99", "cvv": "123"})
+
+    assert response.status_code == 409
+    page = response.get_data(as_text=True)
+    assert "שמורים כרגע להזמנה אחרת" in page
+    assert 'id="seatmaps"' in page
+
+
+def test_opening_the_seat_page_keeps_the_checkout_holds(client, flight):
+    other_flight = create_test_flight()
+    form = {"flight_number": flight, "selected_seats_json": json.dumps([seat(flight, 1, 1)])}
+    assert client.post("/review_order", data=form).status_code == 200
+    with client.session_transaction() as checkout:
+        token = checkout["seat_hold_token"]
+
+    assert client.post("/select_seats_guest", data={"flight_number": other_flight}).status_code == 200
+    page = client.post("/select_seats_guest", data={"flight_number": flight}).get_data(as_text=True)
+
+    assert _held_seats(token) == [("ECONOMY", 1, 1)]
+    # the page gets the seat as this checkout's selection
+    assert '"class_type": "ECONOMY", "column_number": 1, "row_number": 1' in page
+
+
+def test_released_holds_leave_the_cached_seat_map(client, flight):
+    _hold("a", flight, [seat(flight, 2, 3)])
+    held = client.get(f"/api/flights/{flight}/seatmap").get_json()["unavailable"]["ECONOMY"]
+    assert SeatMap.from_base64(3, 4, held).is_taken(2, 3)
+
+    release_seat_holds("a")
+    freed = client.get(f"/api/flights/{flight}/seatmap").get_json()["unavailable"]["ECONOMY"]
+    assert not SeatMap.from_base64(3, 4, freed).is_taken(2, 3)
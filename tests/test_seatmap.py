@@ -0,0 +1,122 @@
+import base64
+
+import pytest
+
+from utils import create_reservation_with_seats, get_seat_page
+from utils_seatmap import SeatMap, build_seat_maps, seat_map_payload
+from conftest import seat
+
+
+def _is_unavailable(data: str, columns: int, row: int, column: int) -> bool: #isUnavailable of templates/seat_map_client.html on the base64 text
+    raw = base64.b64decode(data)
+    i = (row - 1) * columns + (column - 1)
+    return bool(raw[i >> 3] & (1 << (i & 7)))
+
+
+def test_bits_are_row_major_and_least_significant_first():
+    seat_map = SeatMap(3, 4)
+    seat_map.set_taken(1, 1)  # bit 0
+    seat_map.set_taken(2, 4)  # bit 7
+    seat_map.set_taken(3, 1)  # bit 8
+
+    assert bytes(seat_map.bits) == b"\x81\x01"
+    assert seat_map.to_base64() == base64.b64encode(b"\x81\x01").decode("ascii")
+    assert seat_map.to_dict() == {"rows": 3, "columns": 4, "taken": seat_map.to_base64()}
+    for row in range(1, 4):
+        for column in range(1, 5):
+            assert _is_unavailable(seat_map.to_base64(), 4, row, column) == seat_map.is_taken(row, column)
+
+
+def test_full_clear_union_and_counts():
+    full = SeatMap.full(3, 3)
+    # nine seats: the second byte keeps only its lowest bit
+    assert bytes(full.bits) == b"\xff\x01"
+    assert full.taken_count() == 9 and full.free_count() == 0
+
+    full.clear(2, 2)
+    assert not full.is_taken(2, 2) and full.taken_count() == 8
+
+    other = SeatMap(3, 3)
+    other.set_taken(2, 2)
+    assert full.union(other).taken_count() == 9
+    # union builds a new map
+    assert full.taken_count() == 8
+
+
+def test_from_base64_round_trip():
+    seat_map = SeatMap(5, 6)
+    for row, column in ((1, 6), (3, 3), (5, 1), (5, 6)):
+        seat_map.set_taken(row, column)
+
+    copy = SeatMap.from_base64(5, 6, seat_map.to_base64())
+    assert copy.bits == seat_map.bits
+    assert copy.taken_count() == 4 and copy.free_count() == 26
+
+
+def test_bad_sizes_and_seats_are_refused():
+    with pytest.raises(ValueError):
+        SeatMap(3, 4, b"\x00")
+    with pytest.raises(IndexError):
+        SeatMap(3, 4).set_taken(4, 1)
+    with pytest.raises(IndexError):
+        SeatMap(3, 4).is_taken(1, 0)
+
+
+def test_build_seat_maps_skips_unknown_classes():
+    classes = [{"type": "ECONOMY", "number_of_rows": 2, "number_of_columns": 2}]
+    taken = [{"class_type": "ECONOMY", "row_number": 2, "column_number": 1},
+             {"class_type": "BUSINESS", "row_number": 1, "column_number": 1}]
+
+    seat_maps = build_seat_maps(classes, taken)
+    assert list(seat_maps) == ["ECONOMY"]
+    assert seat_maps["ECONOMY"].is_taken(2, 1) and seat_maps["ECONOMY"].taken_count() == 1
+
+
+def test_payload_marks_sold_seats_for_the_seat_pages(flight):
+    create_reservation_with_seats("a@test.com", flight, [seat(flight, 2, 3), seat(flight, 1, 2, "BUSINESS")])
+
+    payload = seat_map_payload(get_seat_page(flight))
+    economy, business = payload["unavailable"]["ECONOMY"], payload["unavailable"]["BUSINESS"]
+
+    assert _is_unavailable(economy, 4, 2, 3)
+    assert not _is_unavailable(economy, 4, 3, 2)
+    assert SeatMap.from_base64(3, 4, economy).taken_count() == 1
+    assert _is_unavailable(business, 2, 1, 2)
+    assert SeatMap.from_base64(2, 2, business).taken_count() == 1
+    assert payload["prices"] == {"ECONOMY": 100, "BUSINESS": 300}
+
+
+def test_layout_is_cached_by_etag(client, flight):
+    aircraft_id = seat(flight, 1, 1)["aircraft_id_number"]
+    first = client.get(f"/api/aircraft/{aircraft_id}/layout")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "public, max-age=86400"
+    assert {c["type"]: (c["rows"], c["columns"]) for c in first.get_json()["classes"]} == {"ECONOMY": (3, 4), "BUSINESS": (2, 2)}
+
+    again = client.get(f"/api/aircraft/{aircraft_id}/layout", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_unknown_aircraft_and_flight_are_404(client):
+    response = client.get("/api/aircraft/999999999/layout")
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "AIRCRAFT_NOT_FOUND"}
+
+    response = client.get("/api/flights/999999999/seatmap")
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "FLIGHT_NOT_FOUND"}
+
+
+def test_seatmap_etag_changes_when_a_seat_is_sold(client, flight):
+    first = client.get(f"/api/flights/{flight}/seatmap")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert not _is_unavailable(first.get_json()["unavailable"]["ECONOMY"], 4, 1, 1)
+
+    assert client.get(f"/api/flights/{flight}/seatmap", headers={"If-None-Match": etag}).status_code == 304
+
+    create_reservation_with_seats("a@test.com", flight, [seat(flight, 1, 1)])
+    changed = client.get(f"/api/flights/{flight}/seatmap", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert _is_unavailable(changed.get_json()["unavailable"]["ECONOMY"], 4, 1, 1)
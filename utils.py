@@ -1,146 +1,641 @@
 import sqlite3
+import json
+import re
 from contextlib import contextmanager
-import random
-from datetime import date
+import threading
+import contextvars
+import queue
+import time
+from datetime import date, timedelta
+
+from utils_seatmap import build_seat_maps
+from utils_queries import ID_SPACES, query_all, query_one, execute, execute_many
 
 DB_PATH = 'FlyTAU_db.db'
+DB_POOL_SIZE = 8
+DB_POOL_TIMEOUT = 10
+DB_PRAGMAS = {
+    "cache_size": -16000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+# "pool": every connection reads and writes (default)
+# "wal": WAL journal, read only pool for db_conn and one serialized writer for db_tx
+DB_CONCURRENCY_MODE = "pool"
+DB_BUSY_TIMEOUT_MS = 5000
+DB_WRITE_RETRIES = 3
+DB_WRITE_RETRY_DELAY = 0.05
+# per connection prepared statement cache, large enough for every statement in utils_queries.QUERIES
+DB_CACHED_STATEMENTS = 256
+# reports read from an in-memory copy of the database refreshed after this many seconds (or on demand)
+DB_SNAPSHOT_MAX_AGE = 300
+
+# Per request counters live in context variables, not thread locals: an async request runs its queries on executor
+# threads (utils_async.run_db copies the request's context there) and many requests share the event loop thread.
+# The variable holds a mutable [seconds] so additions made in a copied context reach the request.
+_lock_wait = contextvars.ContextVar("db_lock_wait", default=None)
+_lock_wait_lock = threading.Lock()
+
+
+def _add_lock_wait(seconds: float):
+    waited = _lock_wait.get()
+    if waited is not None:
+        with _lock_wait_lock:
+            waited[0] += seconds
+
+
+def reset_lock_wait(): #Start counting lock wait time for the current request
+    _lock_wait.set([0.0])
+
+
+def get_lock_wait_ms() -> float: #Return how long the current request waited for connections and write locks
+    waited = _lock_wait.get()
+    return round(waited[0] * 1000, 2) if waited is not None else 0.0
+
+
+# SQL tracing (off by default): every statement of a traced request is recorded with its normalized SQL,
+# time and rows so repeated statements (N+1 loops) can be found
+DB_SQL_TRACE = False
+_sql_trace = contextvars.ContextVar("sql_trace", default=None)
+
+_SQL_COMMENT = re.compile(r"--[^\n]*")
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SQL_SPACES = re.compile(r"\s+")
+_SQL_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+|\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalize_sql(sql: str) -> str: #Replace literals and placeholder lists with ? so the same statement always looks the same
+    sql = _SQL_COMMENT.sub(" ", sql)
+    sql = _SQL_STRING.sub("?", sql)
+    sql = _SQL_NUMBER.sub("?", sql)
+    sql = _SQL_SPACES.sub(" ", sql).strip().rstrip(";").strip()
+    return _SQL_PLACEHOLDER_LIST.sub("(...)", sql)
+
+
+class SqlTrace: #Statements run by one request (or any block of code between start and stop)
+    def __init__(self):
+        self.statements = []
+        self._lock = threading.Lock()
+        # the statement running now is tracked per thread, an async request can run queries on several threads at once
+        self._running = threading.local()
+
+    def begin(self, batch_sql: str | None = None): #Start timing one execute on this thread, executemany passes its SQL so the per row callbacks count as calls of it
+        self._running.entry = None
+        self._running.batch = False
+        if batch_sql is not None:
+            self.record(batch_sql)
+            self._running.batch = self._running.entry is not None
+
+    def end(self): #The first statement the current execute recorded, None if it recorded nothing
+        entry = getattr(self._running, "entry", None)
+        self._running.entry = None
+        self._running.batch = False
+        return entry
+
+    def record(self, statement: str):
+        entry = getattr(self._running, "entry", None)
+        if getattr(self._running, "batch", False) and entry is not None:
+            entry["calls"] += 1
+            return
+        sql = normalize_sql(statement)
+        if sql:
+            new_entry = {"sql": sql, "ms": 0.0, "rows": 0, "calls": 1}
+            with self._lock:
+                self.statements.append(new_entry)
+            if entry is None:
+                self._running.entry = new_entry
+
+    def summary(self, repeat_threshold: int = 5) -> dict: #Totals plus every normalized statement that ran more than repeat_threshold times
+        with self._lock:
+            statements = list(self.statements)
+        by_sql = {}
+        for st in statements:
+            agg = by_sql.setdefault(st["sql"], {"sql": st["sql"], "count": 0, "ms": 0.0, "rows": 0})
+            agg["count"] += 1
+            agg["ms"] += st["ms"]
+            agg["rows"] += st["rows"]
+        repeated = sorted(
+            (agg for agg in by_sql.values() if agg["count"] > repeat_threshold),
+            key=lambda agg: agg["count"],
+            reverse=True
+        )
+        return {
+            "queries": len(statements),
+            "distinct": len(by_sql),
+            "ms": round(sum(st["ms"] for st in statements), 2),
+            "rows": sum(st["rows"] for st in statements),
+            "repeated": [dict(agg, ms=round(agg["ms"], 2)) for agg in repeated],
+        }
+
+
+def set_sql_trace(enabled: bool): #Turn statement tracing on or off for all connections
+    global DB_SQL_TRACE
+    DB_SQL_TRACE = bool(enabled)
+
+
+def start_sql_trace() -> SqlTrace | None: #Start collecting statements for the current request context (does nothing when tracing is off)
+    trace = SqlTrace() if DB_SQL_TRACE else None
+    _sql_trace.set(trace)
+    return trace
+
+
+def stop_sql_trace() -> SqlTrace | None: #Stop collecting and return what was collected
+    trace = _sql_trace.get()
+    _sql_trace.set(None)
+    return trace
+
+
+def _on_sql_trace(statement: str): #sqlite3 trace callback, called for every statement the connection runs
+    trace = _sql_trace.get()
+    if trace is not None:
+        trace.record(statement)
+
+
+class TracingCursor(sqlite3.Cursor): #Cursor that adds time and returned rows to the statement the trace callback recorded
+    _trace_entry = None
+
+    def execute(self, sql, parameters=()):
+        return self._timed(False, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(True, super().executemany, sql, seq_of_parameters)
+
+    def _timed(self, batch: bool, run, *args):
+        trace = _sql_trace.get()
+        if trace is None:
+            return run(*args)
+        started = time.perf_counter()
+        # executemany fires the trace callback once per row, count those as calls of one statement
+        trace.begin(args[0] if batch else None)
+        try:
+            return run(*args)
+        finally:
+            entry = trace.end()
+            if entry is not None:
+                self._trace_entry = entry
+                entry["ms"] += (time.perf_counter() - started) * 1000
+
+    def _count_rows(self, n: int):
+        if self._trace_entry is not None and n:
+            self._trace_entry["rows"] += n
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._count_rows(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().fetchmany(*args, **kwargs)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count_rows(len(rows))
+        return rows
+
+
+def _open_cursor(mydb): #Create the cursor for db_conn/db_tx, traced when tracing is on
+    if DB_SQL_TRACE:
+        mydb.set_trace_callback(_on_sql_trace)
+        return mydb.cursor(TracingCursor)
+    return mydb.cursor()
+
+
+def _close_cursor(mydb, cursor):
+    if cursor:
+        cursor.close()
+    if DB_SQL_TRACE:
+        mydb.set_trace_callback(None)
+
+
+class ConnectionPool: #Keep a fixed number of open connections and lend them out again instead of reconnecting
+    def __init__(self, db_path: str, size: int = DB_POOL_SIZE, pragmas: dict | None = None, timeout: float = DB_POOL_TIMEOUT, readonly: bool = False):
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = dict(DB_PRAGMAS if pragmas is None else pragmas)
+        self.timeout = timeout
+        self.readonly = readonly
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "opened": 0, "reused": 0, "discarded": 0, "waited": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _open(self): #Open a new connection with the same settings every caller used before plus the PRAGMAs
+        mydb = _connect(self.db_path, self.pragmas, self.readonly)
+        self._count("opened")
+        return mydb
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            self._count("waited")
+            started = time.perf_counter()
+            got_slot = self._slots.acquire(timeout=self.timeout)
+            _add_lock_wait(time.perf_counter() - started)
+            if not got_slot:
+                raise RuntimeError("אין חיבור פנוי למסד הנתונים (ה-pool מלא).")
+        self._count("acquired")
+        try:
+            while True:
+                try:
+                    mydb = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._open()
+                if _is_healthy(mydb):
+                    self._count("reused")
+                    return mydb
+                self._discard(mydb)
+        except:
+            self._slots.release()
+            raise
+
+    def release(self, mydb):
+        try:
+            if _is_healthy(mydb):
+                self._idle.put(mydb)
+            else:
+                self._discard(mydb)
+        finally:
+            self._slots.release()
+
+    def _discard(self, mydb):
+        self._count("discarded")
+        try:
+            mydb.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self): #Close every idle connection (used on shutdown or when the settings change)
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["size"] = self.size
+        stats["idle"] = self._idle.qsize()
+        stats["readonly"] = self.readonly
+        return stats
+
+
+class SerializedWriter: #One shared write connection, every db_tx waits its turn and runs inside BEGIN IMMEDIATE
+    def __init__(self, db_path: str, pragmas: dict | None = None, timeout: float = DB_POOL_TIMEOUT):
+        self.db_path = db_path
+        self.pragmas = dict(DB_PRAGMAS if pragmas is None else pragmas)
+        self.timeout = timeout
+        self._mydb = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"transactions": 0, "retries": 0, "lock_wait_ms": 0.0}
+
+    def _count(self, key: str, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    @contextmanager
+    def transaction(self):
+        started = time.perf_counter()
+        if not self._lock.acquire(timeout=self.timeout):
+            _add_lock_wait(time.perf_counter() - started)
+            raise RuntimeError("מסד הנתונים עסוק, נסו שוב בעוד רגע.")
+        try:
+            if self._mydb is None or not _is_healthy(self._mydb):
+                self._mydb = _connect(self.db_path, self.pragmas)
+            self._begin_immediate()
+            waited = time.perf_counter() - started
+            _add_lock_wait(waited)
+            self._count("lock_wait_ms", waited * 1000)
+            self._count("transactions")
+            yield self._mydb
+        finally:
+            self._lock.release()
+
+    def _begin_immediate(self): #Take the database write lock now, retry a few times if another process holds it
+        for attempt in range(DB_WRITE_RETRIES + 1):
+            try:
+                self._mydb.execute("BEGIN IMMEDIATE;")
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                if attempt == DB_WRITE_RETRIES:
+                    raise
+                self._count("retries")
+                time.sleep(DB_WRITE_RETRY_DELAY * (attempt + 1))
+
+    def close(self):
+        with self._lock:
+            if self._mydb is not None:
+                self._mydb.close()
+                self._mydb = None
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["lock_wait_ms"] = round(stats["lock_wait_ms"], 2)
+        return stats
+
+
+def _connect(db_path: str, pragmas: dict, readonly: bool = False): #Open one connection with row access by name and the given PRAGMAs
+    if readonly:
+        mydb = sqlite3.connect(
+            f"file:{db_path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=DB_CACHED_STATEMENTS
+        )
+    else:
+        mydb = sqlite3.connect(
+            db_path,
+            check_same_thread=False,
+            cached_statements=DB_CACHED_STATEMENTS
+        )
+    mydb.isolation_level = None
+    mydb.row_factory = sqlite3.Row
+    for name, value in pragmas.items():
+        mydb.execute(f"PRAGMA {name} = {value};")
+    return mydb
+
+
+def _is_healthy(mydb) -> bool: #Make sure a connection still works and is not stuck in a transaction
+    try:
+        if mydb.in_transaction:
+            mydb.rollback()
+        mydb.execute("SELECT 1;").fetchone()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+_pool = None
+_writer = None
+_db_mode = DB_CONCURRENCY_MODE
+_pool_lock = threading.Lock()
+
+
+def get_db_pool() -> ConnectionPool: #Create the shared pool on first use
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def configure_db_pool(size: int | None = None, pragmas: dict | None = None, timeout: float | None = None, mode: str | None = None): #Replace the shared pool (and writer in WAL mode) with ones that use the given settings
+    global _pool, _writer, _db_mode
+    mode = (mode or DB_CONCURRENCY_MODE).lower()
+    if mode not in ("pool", "wal"):
+        raise ValueError(f"Unknown DB concurrency mode: {mode}")
+    pragmas = dict(DB_PRAGMAS if pragmas is None else pragmas)
+    timeout = DB_POOL_TIMEOUT if timeout is None else timeout
+
+    with _pool_lock:
+        old_pool, old_writer = _pool, _writer
+        if mode == "wal":
+            pragmas["busy_timeout"] = DB_BUSY_TIMEOUT_MS
+            writer_pragmas = dict(pragmas, synchronous="NORMAL")
+            setup = _connect(DB_PATH, {"busy_timeout": DB_BUSY_TIMEOUT_MS})
+            try:
+                setup.execute("PRAGMA journal_mode = WAL;")
+            finally:
+                setup.close()
+            _writer = SerializedWriter(DB_PATH, pragmas=writer_pragmas, timeout=timeout)
+            _pool = ConnectionPool(DB_PATH, size=size or DB_POOL_SIZE, pragmas=pragmas, timeout=timeout, readonly=True)
+        else:
+            _writer = None
+            _pool = ConnectionPool(DB_PATH, size=size or DB_POOL_SIZE, pragmas=pragmas, timeout=timeout)
+        _db_mode = mode
+
+    if old_pool:
+        old_pool.close_all()
+    if old_writer:
+        old_writer.close()
+    return _pool
+
+
+def get_db_pool_stats() -> dict: #Return how many connections were borrowed, opened and reused
+    stats = get_db_pool().get_stats()
+    stats["mode"] = _db_mode
+    if _writer is not None:
+        stats["writer"] = _writer.get_stats()
+    return stats
+
+
 @contextmanager
-def db_conn(): #Open the database and give back a cursor then close it
-    mydb = None
+def db_conn(): #Borrow a pooled connection and give back a cursor then return it to the pool (read only in WAL mode)
+    pool = get_db_pool()
+    mydb = pool.acquire()
     cursor = None
     try:
-        mydb = sqlite3.connect(
-            DB_PATH,
-            check_same_thread=False
-        )
-        mydb.isolation_level = None
-        mydb.row_factory = sqlite3.Row
-        cursor = mydb.cursor()
+        cursor = _open_cursor(mydb)
         yield cursor
     finally:
-        if cursor:
-            cursor.close()
-        if mydb:
-            mydb.close()
+        _close_cursor(mydb, cursor)
+        pool.release(mydb)
 
 
 @contextmanager
-def db_tx(): #Open the database as a transaction commit if ok rollback if error
-    mydb = None
+def db_tx(): #Open a transaction commit if ok rollback if error (through the single writer in WAL mode)
+    if _writer is not None:
+        with _writer.transaction() as mydb:
+            cursor = _open_cursor(mydb)
+            try:
+                yield mydb, cursor
+                mydb.commit()
+            except:
+                mydb.rollback()
+                raise
+            finally:
+                _close_cursor(mydb, cursor)
+        return
+
+    pool = get_db_pool()
+    mydb = pool.acquire()
     cursor = None
     try:
-        mydb = sqlite3.connect(
-            DB_PATH,
-            check_same_thread=False
-        )
-        mydb.isolation_level = None
-        mydb.row_factory = sqlite3.Row
-        cursor = mydb.cursor()
+        cursor = _open_cursor(mydb)
         yield mydb, cursor
         mydb.commit()
     except:
-        if mydb:
-            mydb.rollback()
+        mydb.rollback()
         raise
     finally:
-        if cursor:
-            cursor.close()
-        if mydb:
-            mydb.close()
+        _close_cursor(mydb, cursor)
+        pool.release(mydb)
+
+def begin_write(conn, cur): #Make a db_tx block all or nothing: pooled connections run in autocommit mode, the WAL writer already began one
+    if not conn.in_transaction:
+        cur.execute("BEGIN IMMEDIATE;")
+
+_snapshot = None
+_snapshot_taken_at = None
+_snapshot_lock = threading.Lock()
+_snapshot_stats = {"refreshes": 0, "last_refresh_ms": 0.0}
+
+
+def refresh_snapshot(): #Copy the live database into a new in-memory database with the backup API and swap it in
+    started = time.perf_counter()
+    copy = sqlite3.connect(":memory:", check_same_thread=False, cached_statements=DB_CACHED_STATEMENTS)
+    copy.isolation_level = None
+    copy.row_factory = sqlite3.Row
+    pool = get_db_pool()
+    source = pool.acquire()
+    try:
+        source.backup(copy)
+    except:
+        copy.close()
+        raise
+    finally:
+        pool.release(source)
+    copy.execute("PRAGMA query_only = ON;")
+
+    global _snapshot, _snapshot_taken_at
+    with _snapshot_lock:
+        old, _snapshot = _snapshot, copy
+        _snapshot_taken_at = time.time()
+        _snapshot_stats["refreshes"] += 1
+        _snapshot_stats["last_refresh_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    if old is not None:
+        old.close()
+
+
+def get_snapshot_age() -> float | None: #Return how many seconds old the report snapshot is (None before the first refresh)
+    if _snapshot_taken_at is None:
+        return None
+    return time.time() - _snapshot_taken_at
+
+
+def get_snapshot_stats() -> dict: #Return the snapshot age and refresh counters
+    age = get_snapshot_age()
+    return dict(_snapshot_stats, age_seconds=None if age is None else round(age, 1))
+
+
+def start_snapshot_refresher(interval: float = DB_SNAPSHOT_MAX_AGE): #Refresh the snapshot in a background thread every interval seconds
+    def run():
+        while True:
+            try:
+                refresh_snapshot()
+            except sqlite3.Error:
+                pass
+            time.sleep(interval)
+    thread = threading.Thread(target=run, name="db-snapshot-refresher", daemon=True)
+    thread.start()
+    return thread
+
+
+@contextmanager
+def snapshot_conn(max_age: float = DB_SNAPSHOT_MAX_AGE): #Give a cursor on the in-memory report snapshot, refreshing it first if it is older than max_age
+    age = get_snapshot_age()
+    if age is None or age > max_age:
+        refresh_snapshot()
+    # one sqlite connection is not safe for parallel use, so readers of the snapshot take turns
+    with _snapshot_lock:
+        cursor = None
+        try:
+            cursor = _open_cursor(_snapshot)
+            yield cursor
+        finally:
+            _close_cursor(_snapshot, cursor)
+
+_listeners = {}
+
+
+def subscribe(event: str, listener): #Call listener(**data) every time event is published (after its transaction committed)
+    _listeners.setdefault(event, []).append(listener)
+
+
+def publish(event: str, **data): #Tell the listeners of event that a write committed
+    for listener in _listeners.get(event, []):
+        try:
+            listener(**data)
+        except:
+            # the write already committed, a failing cache listener must not turn it into an error page
+            pass
+
+# Airports, routes and aircraft classes change only when a manager adds an aircraft (or a route/airport is edited),
+# so they are read once and served from memory until something bumps the data version.
+_reference = None
+_reference_version = 0
+_reference_lock = threading.Lock()
+_reference_stats = {"hits": 0, "misses": 0, "loads": 0, "invalidations": 0}
+
+
+def bump_reference_version(): #Mark the reference data as changed, the next reader loads it again
+    global _reference, _reference_version
+    with _reference_lock:
+        _reference_version += 1
+        _reference = None
+        _reference_stats["invalidations"] += 1
+    publish("reference_data_changed", version=_reference_version)
+
+
+def get_reference_stats() -> dict: #Return the data version and hit/miss counters of the reference data cache
+    with _reference_lock:
+        return dict(_reference_stats, version=_reference_version, loaded=_reference is not None)
+
+
+def _load_reference() -> dict: #Read the airport, flight_route and class tables in one connection
+    with db_conn() as cur:
+        airports = query_all("reference_airports", cur=cur)
+        routes = {(r["origin_airport"], r["destination_airport"]): r["flight_duration"] for r in query_all("reference_routes", cur=cur)}
+        classes = {}
+        for r in query_all("reference_classes", cur=cur):
+            classes.setdefault(r["aircraft_id_number"], []).append(r)
+    return {
+        "airports": [r["airport_name"] for r in airports],
+        "countries": sorted({r["country"] for r in airports if r["country"]}),
+        "routes": routes,
+        "classes": classes,
+    }
+
+
+def _reference_data() -> dict: #The cached reference data, loaded on first use after every version bump
+    global _reference
+    with _reference_lock:
+        if _reference is not None:
+            _reference_stats["hits"] += 1
+            return _reference
+        _reference_stats["misses"] += 1
+        version = _reference_version
+    data = _load_reference()
+    with _reference_lock:
+        _reference_stats["loads"] += 1
+        # a bump that happened while loading means data may already be old, use it once but do not keep it
+        if version == _reference_version:
+            _reference = data
+    return data
 
 #Get a guest active reservation by email and reservation code
 def get_active_reservations_for_guest(email: str, reservation_code: int):
-    sql = """
-    SELECT
-      r.reservation_code,
-      r.reservations_status,
-      r.reservation_date,
-      r.total_payment,
-      r.email,
-      r.flight_number,
-      f.origin_airport,
-      f.destination_airport,
-      f.departure_datetime,
-      f.status AS flight_status
-    FROM reservations r
-    JOIN flight f ON f.flight_number = r.flight_number
-    WHERE r.email = ?
-      AND r.reservation_code = ?
-      AND r.reservations_status = 'ACTIVE'
-      AND f.status = 'ACTIVE'
-      AND f.departure_datetime > datetime('now')
-    ORDER BY f.departure_datetime ASC;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (email, reservation_code))
-        return cur.fetchall()
+    return query_all("guest_active_reservation", (email, reservation_code))
 
 #Cancel a guest reservation and return True if it worked
 def cancel_reservation_for_guest(email: str, reservation_code: int) -> bool:
-    sql = """
-    UPDATE reservations
-    SET reservations_status = 'CUSTOMER_CANCELED'
-    WHERE email = ?
-      AND reservation_code = ?
-      AND reservations_status = 'ACTIVE';
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (email, reservation_code))
-        return cur.rowcount == 1
-
-#Get all seats of one class for one aircraft
-def get_seats_for_aircraft_class(aircraft_id_number: int, class_type: str):
-    sql = (
-        "SELECT `aircraft_id_number`, `class_type`, `row_number`, `column_number`, `price` "
-        "FROM `seats_in_flights` "
-        "WHERE `aircraft_id_number` = ? AND `class_type` = ? "
-        "ORDER BY `row_number`, `column_number`"
-    )
-
-    with db_conn() as cur:
-        cur.execute(sql, (aircraft_id_number, class_type))
-        return cur.fetchall()
-
+    with db_tx() as (conn, cur):
+        row = query_one("guest_cancel_reservation", (email, reservation_code), cur)
+    if row is None:
+        return False
+    publish("reservations_changed", flight_number=row["flight_number"])
+    return True
 
 def get_all_flights_with_hours(): #Return all flights with hours remaining until departure
-    sql = """
-    SELECT
-  flight_number,
-  aircraft_id_number,
-  origin_airport,
-  destination_airport,
-  departure_datetime,
-  status,
-  CAST((julianday(departure_datetime) - julianday('now')) * 24 AS INTEGER) AS hours_to_departure
-FROM flight
-ORDER BY departure_datetime;
-    """
-    with db_conn() as cur:
-        cur.execute(sql)
-        return cur.fetchall()
+    return query_all("flights_with_hours")
 
 #Cancel a flight if more than 72 hours away and cancel all linked active reservations
 def cancel_flight_and_linked_reservations(flight_number: int) -> dict:
     with db_tx() as (conn, cur):
-        sql_cancel_flight = """
-            UPDATE flight
-            SET status = 'CANCELED'
-            WHERE flight_number = ?
-              AND status = 'ACTIVE'
-              AND departure_datetime > datetime('now', '+72 hours');
-        """
-        cur.execute(sql_cancel_flight, (flight_number,))
-
-        if cur.rowcount != 1:
-            sql_info = """
-            SELECT status,
-                   departure_datetime,
-                   CAST((julianday(departure_datetime) - julianday('now')) * 24 AS INTEGER) AS hours_to_departure
-            FROM flight
-            WHERE flight_number = ?;
-            """
-            cur.execute(sql_info, (flight_number,))
-            info = cur.fetchone()
+        if execute("cancel_flight_if_far", (flight_number,), cur) != 1:
+            info = query_one("flight_cancel_info", (flight_number,), cur)
 
             if not info:
                 return {"ok": False, "reason": "NOT_FOUND"}
@@ -150,29 +645,14 @@ def cancel_flight_and_linked_reservations(flight_number: int) -> dict:
 
             return {"ok": False, "reason": "TOO_SOON", "info": info}
 
-        sql_cancel_res = """
-        UPDATE reservations
-        SET reservations_status = 'SYSTEM_CANCELED',
-            total_payment = 0
-        WHERE flight_number = ?
-          AND reservations_status = 'ACTIVE';
-        """
-        cur.execute(sql_cancel_res, (flight_number,))
-        reservations_updated = cur.rowcount
+        reservations_updated = execute("system_cancel_flight_reservations", (flight_number,), cur)
 
-        return {"ok": True, "flight_number": flight_number, "reservations_updated": reservations_updated}
+    publish("flight_cancelled", flight_number=flight_number)
+    return {"ok": True, "flight_number": flight_number, "reservations_updated": reservations_updated}
 
 #Get flight duration in minutes for a route or return None if route not found
 def get_flight_duration_minutes(origin_airport: str, destination_airport: str):
-    sql = """
-    SELECT flight_duration
-    FROM flight_route
-    WHERE origin_airport = ? AND destination_airport = ?;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (origin_airport, destination_airport))
-        row = cur.fetchone()
-        return None if not row else row["flight_duration"]
+    return _reference_data()["routes"].get((origin_airport, destination_airport))
 
 #Check if a flight is long at least 360 minutes
 def is_long_flight(duration_minutes: int) -> bool:
@@ -180,72 +660,8 @@ def is_long_flight(duration_minutes: int) -> bool:
 
 #Find available aircraft for a time window at an origin airport with long flight rules
 def get_available_aircraft(departure_dt, arrival_dt, origin_airport: str, long_required: bool):
-
-    sql = """
-    SELECT a.aircraft_id_number, a.size, a.manufacturer
-FROM aircraft a
-WHERE (? = 0 OR a.size = 'LARGE')
-
-  -- 1. Exclude aircraft that are busy during the requested window
-  AND a.aircraft_id_number NOT IN (
-    SELECT f.aircraft_id_number
-    FROM flight f
-    JOIN flight_route fr
-      ON fr.origin_airport = f.origin_airport
-     AND fr.destination_airport = f.destination_airport
-    WHERE f.status = 'ACTIVE'
-      AND f.aircraft_id_number IS NOT NULL
-      AND (
-        f.departure_datetime < ?  -- Overlap Start
-        -- SQLite Dynamic Interval: Adds flight_duration minutes to departure
-        AND datetime(f.departure_datetime, '+' || fr.flight_duration || ' minutes') > ? -- Overlap End
-      )
-  )
-
-  -- 2. Ensure aircraft is at the correct starting airport
-  AND (
-    (
-      -- Logic: Find the destination of the LAST flight that landed before our new flight departs
-      (
-        SELECT f2.destination_airport
-        FROM flight f2
-        JOIN flight_route fr2
-          ON fr2.origin_airport = f2.origin_airport
-         AND fr2.destination_airport = f2.destination_airport
-        WHERE f2.aircraft_id_number = a.aircraft_id_number
-          AND f2.status <> 'CANCELED'
-          AND datetime(f2.departure_datetime, '+' || fr2.flight_duration || ' minutes') <= ?
-        ORDER BY datetime(f2.departure_datetime, '+' || fr2.flight_duration || ' minutes') DESC
-        LIMIT 1
-      ) = ?
-    )
-    OR
-    (
-      -- Logic: If the aircraft has NEVER flown, assume it is at 'TLV'
-      ? = 'TLV'
-      AND NOT EXISTS (
-        SELECT 1
-        FROM flight f0
-        WHERE f0.aircraft_id_number = a.aircraft_id_number
-          AND f0.status <> 'CANCELED'
-          AND f0.departure_datetime IS NOT NULL
-      )
-    )
-  )
-
-ORDER BY a.aircraft_id_number;
-    """
-
-    with db_conn() as cur:
-        cur.execute(sql, (
-            1 if long_required else 0,
-            arrival_dt,
-            departure_dt,
-            departure_dt,
-            origin_airport,
-            origin_airport
-        ))
-        return cur.fetchall()
+    name = "available_aircraft_long" if long_required else "available_aircraft_any"
+    return query_all(name, (arrival_dt, departure_dt, departure_dt, origin_airport, origin_airport))
 
 #Return required number of pilots and attendants based on aircraft size
 def required_crew_counts(aircraft_size: str):
@@ -258,151 +674,16 @@ def required_crew_counts(aircraft_size: str):
 
 #Find available pilots for a time window at an origin airport with long flight rules
 def get_available_pilots(departure_dt, arrival_dt, origin_airport: str, long_required: bool):
-    sql = """
-   SELECT p.id_number, p.first_name, p.last_name, p.long_flight_certification
-FROM pilot p
-WHERE (? = 0 OR p.long_flight_certification = 1)
-
-  -- 1. Exclude pilots who are currently flying during the window
-  AND p.id_number NOT IN (
-    SELECT pf.id_number
-    FROM pilots_on_flights pf
-    JOIN flight f ON f.flight_number = pf.flight_number
-    JOIN flight_route fr
-      ON fr.origin_airport = f.origin_airport
-     AND fr.destination_airport = f.destination_airport
-    WHERE f.status = 'ACTIVE'
-      AND (
-        f.departure_datetime < ? -- Overlap Start
-        -- SQLite Dynamic Interval: Add duration minutes to departure
-        AND datetime(f.departure_datetime, '+' || fr.flight_duration || ' minutes') > ? -- Overlap End
-      )
-  )
-  AND (
-    (
-      -- 2a. Check pilot's last known location
-      (
-        SELECT f2.destination_airport
-        FROM pilots_on_flights pf2
-        JOIN flight f2 ON f2.flight_number = pf2.flight_number
-        JOIN flight_route fr2
-          ON fr2.origin_airport = f2.origin_airport
-         AND fr2.destination_airport = f2.destination_airport
-        WHERE pf2.id_number = p.id_number
-          AND f2.status <> 'CANCELED'
-          AND datetime(f2.departure_datetime, '+' || fr2.flight_duration || ' minutes') <= ?
-        ORDER BY datetime(f2.departure_datetime, '+' || fr2.flight_duration || ' minutes') DESC
-        LIMIT 1
-      ) = ?
-    )
-    OR
-    (
-      -- 2b. If pilot has never flown, assume they are at TLV
-      ? = 'TLV'
-      AND NOT EXISTS (
-        SELECT 1
-        FROM pilots_on_flights pf0
-        JOIN flight f0 ON f0.flight_number = pf0.flight_number
-        WHERE pf0.id_number = p.id_number
-          AND f0.status <> 'CANCELED'
-          AND f0.departure_datetime IS NOT NULL
-      )
-    )
-  )
-
-ORDER BY p.id_number;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (
-            1 if long_required else 0,
-            arrival_dt,
-            departure_dt,
-            departure_dt,
-            origin_airport,
-            origin_airport
-        ))
-        return cur.fetchall()
+    name = "available_pilots_long" if long_required else "available_pilots_any"
+    return query_all(name, (arrival_dt, departure_dt, departure_dt, origin_airport, origin_airport))
 
 #Find available flight attendants for a time window at an origin airport with long flight rules
 def get_available_attendants(departure_dt, arrival_dt, origin_airport: str, long_required: bool):
-    sql = """
-    SELECT fa.id_number, fa.first_name, fa.last_name, fa.long_flight_certification
-FROM flight_attendant fa
-WHERE (? = 0 OR fa.long_flight_certification = 1)
-
-  -- 1. Exclude flight attendants who are flying during the requested window
-  AND fa.id_number NOT IN (
-    SELECT ff.id_number
-    FROM flight_attendants_on_flights ff
-    JOIN flight f ON f.flight_number = ff.flight_number
-    JOIN flight_route fr
-      ON fr.origin_airport = f.origin_airport
-     AND fr.destination_airport = f.destination_airport
-    WHERE f.status = 'ACTIVE'
-      AND (
-        f.departure_datetime < ?
-        -- SQLite Dynamic Interval
-        AND datetime(f.departure_datetime, '+' || fr.flight_duration || ' minutes') > ?
-      )
-  )
-
-  -- 2. Ensure flight attendant is at the correct airport
-  AND (
-    (
-      -- Logic: Find destination of their last completed flight
-      (
-        SELECT f2.destination_airport
-        FROM flight_attendants_on_flights ff2
-        JOIN flight f2 ON f2.flight_number = ff2.flight_number
-        JOIN flight_route fr2
-          ON fr2.origin_airport = f2.origin_airport
-         AND fr2.destination_airport = f2.destination_airport
-        WHERE ff2.id_number = fa.id_number
-          AND f2.status <> 'CANCELED'
-          AND datetime(f2.departure_datetime, '+' || fr2.flight_duration || ' minutes') <= ?
-        ORDER BY datetime(f2.departure_datetime, '+' || fr2.flight_duration || ' minutes') DESC
-        LIMIT 1
-      ) = ?
-    )
-    OR
-    (
-      -- Logic: If they have never flown, assume they are at 'TLV'
-      ? = 'TLV'
-      AND NOT EXISTS (
-        SELECT 1
-        FROM flight_attendants_on_flights ff0
-        JOIN flight f0 ON f0.flight_number = ff0.flight_number
-        WHERE ff0.id_number = fa.id_number
-          AND f0.status <> 'CANCELED'
-          AND f0.departure_datetime IS NOT NULL
-      )
-    )
-  )
-
-ORDER BY fa.id_number;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (
-            1 if long_required else 0,
-            arrival_dt,
-            departure_dt,
-            departure_dt,
-            origin_airport,
-            origin_airport
-        ))
-        return cur.fetchall()
-
+    name = "available_attendants_long" if long_required else "available_attendants_any"
+    return query_all(name, (arrival_dt, departure_dt, departure_dt, origin_airport, origin_airport))
 
 def get_aircraft_classes(aircraft_id_number: int): #Get the class types for an aircraft
-    sql = """
-    SELECT type
-    FROM class
-    WHERE aircraft_id_number = ?
-    ORDER BY type;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (aircraft_id_number,))
-        return [r["type"] for r in cur.fetchall()]
+    return sorted(r["type"] for r in _reference_data()["classes"].get(aircraft_id_number, []))
 
 #Create a flight add crew and create seats with prices for that flight
 def create_flight_with_crew_and_prices(
@@ -433,37 +714,23 @@ def create_flight_with_crew_and_prices(
         raise ValueError("חובה לספק מחיר למחלקת ECONOMY.")
 
     with db_tx() as (conn, cur):
-        cur.execute("SELECT 1 FROM flight WHERE flight_number=? LIMIT 1;", (flight_number,))
-        if cur.fetchone():
-            cur.fetchall()
+        if query_one("flight_number_exists", (flight_number,), cur):
             raise ValueError("מספר הטיסה כבר קיים במערכת.")
-        cur.fetchall()
 
-        cur.execute("""
-            INSERT INTO flight
-              (flight_number, aircraft_id_number, origin_airport, destination_airport, departure_datetime, status)
-            VALUES (?, ?, ?, ?, ?, 'ACTIVE')
-        """, (flight_number, aircraft_id_number, origin_airport, destination_airport, departure_dt))
+        route = query_one("route_duration", (origin_airport, destination_airport), cur)
+        if not route or route["flight_duration"] is None:
+            raise ValueError("המסלול שנבחר לא קיים במערכת.")
+        arrival_dt = departure_dt + timedelta(minutes=int(route["flight_duration"]))
+
+        execute("insert_flight", (flight_number, aircraft_id_number, origin_airport, destination_airport, departure_dt, arrival_dt), cur)
 
         for pid in pilots_ids:
-            cur.execute("""
-                INSERT INTO pilots_on_flights (id_number, flight_number)
-                VALUES (?, ?)
-            """, (pid, flight_number))
+            execute("insert_pilot_on_flight", (pid, flight_number), cur)
 
         for aid in attendants_ids:
-            cur.execute("""
-                INSERT INTO flight_attendants_on_flights (id_number, flight_number)
-                VALUES (?, ?)
-            """, (aid, flight_number))
-
-        cur.execute("""
-            SELECT aircraft_id_number, class_type, `row_number`, column_number
-            FROM seat
-            WHERE aircraft_id_number = ?
-            ORDER BY class_type, `row_number`, column_number;
-        """, (aircraft_id_number,))
-        seats = cur.fetchall()
+            execute("insert_attendant_on_flight", (aid, flight_number), cur)
+
+        seats = query_all("aircraft_seats", (aircraft_id_number,), cur)
 
         if not seats:
             raise ValueError("אין מושבים מוגדרים למטוס הזה (seat table empty).")
@@ -486,78 +753,68 @@ def create_flight_with_crew_and_prices(
         if not rows_to_insert:
             raise ValueError("לא נמצא אף מושב להוספה לטיסה (בדוק מחירים).")
 
-        cur.executemany("""
-            INSERT INTO seats_in_flights
-              (aircraft_id_number, class_type, `row_number`, column_number, flight_number, price)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, rows_to_insert)
+        execute_many("insert_seats_in_flight", rows_to_insert, cur)
+
+    publish("flight_created", flight_number=flight_number)
+
 
+#Take the next free id of an ID space (utils_queries.ID_SPACES) from the id_sequence table inside the caller's transaction
+def allocate_id(cur, space: str) -> int:
+    if space not in ID_SPACES:
+        raise KeyError(space)
+    for _ in range(1000):
+        row = query_one("id_sequence_next", (space,), cur)
+        if not row:
+            raise RuntimeError(f"אין רצף מזהים מוגדר עבור {space} (יש להריץ migrations).")
 
-def generate_unique_flight_number() -> int: #Pick a random free flight number
-    for _ in range(20000):
-        n = random.randint(0, 9999)
-        with db_conn() as cur:
-            cur.execute("SELECT 1 FROM flight WHERE flight_number = ? LIMIT 1;", (n,))
-            exists = cur.fetchone() is not None
-        if not exists:
-            return n
-    raise RuntimeError("לא ניתן להגריל מספר טיסה פנוי (ייתכן שכל הטווח תפוס).")
+        value = row["value"]
+        if row["max_value"] is not None and value > row["max_value"]:
+            value = _first_free_id(cur, space, row["min_value"], row["max_value"])
+            if value is None:
+                raise RuntimeError(f"אין מזהה פנוי בטווח {row['min_value']}-{row['max_value']} עבור {space}.")
+            return value
+
+        # ids written by hand (or by the old random generator) are skipped, normally this runs once
+        if not query_one(f"id_taken_{space}", (value,), cur):
+            return value
+    raise RuntimeError(f"לא ניתן להקצות מזהה פנוי עבור {space}.")
+
+#Find the lowest unused id in a bounded range, used only after the sequence ran past its max
+def _first_free_id(cur, space: str, min_value: int, max_value: int):
+    row = query_one(f"first_free_id_{space}", (min_value, min_value, max_value, min_value, max_value), cur)
+    return None if not row else row["candidate"]
+
+def generate_unique_flight_number() -> int: #Allocate the next free flight number
+    with db_tx() as (conn, cur):
+        return allocate_id(cur, "flight_number")
 
 
 def authenticate_user(email, password): #Check email and password and return the customer if they match
-    sql = """
-    SELECT rc.email, c.first_name, c.last_name
-    FROM registered_customer rc
-    JOIN customer c ON rc.email = c.email
-    WHERE rc.email = ? AND rc.password = ?;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (email, password))
-        return cur.fetchone()
+    return query_one("customer_login", (email, password))
 
 
 def signup_user(data): #Create a new user account and save their details
     email = data['email']
     passport = data['passport']
 
-    with db_conn() as cur:
-        cur.execute("SELECT email FROM customer WHERE email = ?", (email,))
-        if cur.fetchone():
-            cur.fetchall()
+    with db_tx() as (conn, cur):
+        if query_one("customer_by_email", (email,), cur):
             return False, "האימייל כבר רשום במערכת"
-        cur.fetchall()
 
-        cur.execute("SELECT email FROM registered_customer WHERE passport_number = ?", (passport,))
-        if cur.fetchone():
-            cur.fetchall()
+        if query_one("passport_exists", (passport,), cur):
             return False, "שגיאה: מספר הדרכון כבר קיים במערכת. לא ניתן להירשם פעמיים."
-        cur.fetchall()
 
         try:
-            cur.execute(
-                "INSERT INTO customer (email, first_name, last_name) VALUES (?, ?, ?)",
-                (email, data['first_name'], data['last_name'])
-            )
-
-            cur.execute(
-                """INSERT INTO registered_customer 
-                   (email, password, passport_number, date_of_birth, registration_date) 
-                   VALUES (?, ?, ?, ?, ?)""",
-                (email, data['password'], passport, data['birth_date'], date.today())
-            )
-
-            cur.execute(
-                "INSERT INTO customer_phone_number (email, phone_number) VALUES (?, ?)",
-                (email, data['phone_main'])
-            )
+            execute("insert_customer", (email, data['first_name'], data['last_name']), cur)
+
+            execute("insert_registered_customer", (email, data['password'], passport, data['birth_date'], date.today()), cur)
+
+            execute("insert_customer_phone", (email, data['phone_main']), cur)
 
             if 'extra_phones' in data:
                 for phone in data['extra_phones']:
                     if phone.strip():
-                        cur.execute(
-                            "INSERT INTO customer_phone_number (email, phone_number) VALUES (?, ?)",
-                            (email, phone)
-                        )
+                        execute("insert_customer_phone", (email, phone), cur)
 
             return True, "נרשמת בהצלחה! כעת ניתן להתחבר"
 
@@ -567,187 +824,245 @@ def signup_user(data): #Create a new user account and save their details
 
 
 def get_flight_with_aircraft(flight_number: int): #Get one flight including its aircraft id
-    sql = """
-    SELECT f.flight_number, f.departure_datetime, f.origin_airport, f.destination_airport,
-           f.aircraft_id_number, f.status
-    FROM flight f
-    WHERE f.flight_number = ?;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (flight_number,))
-        return cur.fetchone()
+    return query_one("flight_with_aircraft", (flight_number,))
 
 
 def get_classes_for_aircraft(aircraft_id_number: int): #Get the seat classes and sizes for an aircraft
-    sql = """
-    SELECT type, number_of_rows, number_of_columns
-FROM class
-WHERE aircraft_id_number = ?
-ORDER BY CASE type
-    WHEN 'BUSINESS' THEN 1
-    WHEN 'ECONOMY' THEN 2
-    ELSE 3
-END;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (aircraft_id_number,))
-        return cur.fetchall()
-
-#Get all seats for a flight in one class
-def get_seats_for_flight_class(flight_number: int, class_type: str):
-    sql = """
-    SELECT `aircraft_id_number`, `class_type`, `row_number`, `column_number`, `price`
-    FROM `seats_in_flights`
-    WHERE `flight_number` = ?
-      AND `class_type` = ?
-    ORDER BY `row_number`, `column_number`;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (flight_number, class_type))
-        return cur.fetchall()
-
-
-def get_taken_seats_for_flight(flight_number: int): #Get which seats are already taken on a flight
-    sql = """
-    SELECT sir.aircraft_id_number, sir.class_type, sir.row_number, sir.column_number
-    FROM seats_in_reservation sir
-    JOIN reservations r ON r.reservation_code = sir.reservation_code
-    WHERE r.flight_number = ?
-      AND r.reservations_status = 'ACTIVE';
-    """
+    return list(_reference_data()["classes"].get(aircraft_id_number, []))
+
+def get_seats_left(flight_numbers) -> dict: #Free seats per class for many flights in one indexed lookup: {flight_number: {class_type: seats_left}}
+    seats_left = {}
+    if not flight_numbers:
+        return seats_left
+    for r in query_all("seats_left_many", (json.dumps([int(n) for n in flight_numbers]),)):
+        seats_left.setdefault(r["flight_number"], {})[r["class_type"]] = r["seats_left"]
+    return seats_left
+
+def get_seat_page(flight_number: int): #Everything a seat page shows in one connection: flight, classes, priced seats per class and a SeatMap per class of taken and of held seats (None if no such flight)
     with db_conn() as cur:
-        cur.execute(sql, (flight_number,))
-        rows = cur.fetchall()
-        return set((x["aircraft_id_number"], x["class_type"], x["row_number"], x["column_number"]) for x in rows)
+        flight = query_one("flight_with_aircraft", (flight_number,), cur)
+        if not flight:
+            return None
+        seats = query_all("seat_page_seats", (flight_number,), cur)
+    classes = get_classes_for_aircraft(flight["aircraft_id_number"])
+    seats_by_class = {c["type"]: [] for c in classes}
+    for s in seats:
+        seats_by_class.setdefault(s["class_type"], []).append(s)
+    return {
+        "flight": flight,
+        "classes": classes,
+        "seats_by_class": seats_by_class,
+        "seat_maps": build_seat_maps(classes, [s for s in seats if s["taken"]]),
+        "hold_maps": build_seat_maps(classes, [s for s in seats if s["held"] and not s["taken"]]),
+    }
+
+def seat_key(seat: dict): #Turn a selected seat dict into a (class_type, row_number, column_number) key or None if it is not valid
+    try:
+        return (str(seat.get("class_type")).strip().upper(), int(seat.get("row_number")), int(seat.get("column_number")))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+#Get the prices of many seats of one flight in one query and return (prices by seat key, keys that were not found)
+def get_seat_prices(flight_number: int, aircraft_id_number: int, seats: list[dict], cur=None):
+    keys = []
+    missing = []
+    for s in seats or []:
+        key = seat_key(s)
+        if key is None:
+            missing.append(key)
+        elif key not in keys:
+            keys.append(key)
+
+    if not keys:
+        return {}, missing
+
+    rows = query_all("seat_prices", (flight_number, aircraft_id_number, _seat_keys_json(keys)), cur)
+
+    prices = {(r["class_type"], r["row_number"], r["column_number"]): float(r["price"] or 0) for r in rows}
+    missing += [key for key in keys if key not in prices]
+    return prices, missing
+
+#Price the selected seats inside a booking transaction or raise if one of them is not on the flight
+def _price_seats_for_booking(cur, flight_number: int, aircraft_id: int, seats: list[dict]) -> float:
+    prices, missing = get_seat_prices(flight_number, aircraft_id, seats, cur=cur)
+    if missing:
+        for s in seats:
+            if seat_key(s) in missing:
+                raise ValueError(f"מושב {s.get('row_number')}-{s.get('column_number')} לא נמצא בטיסה זו")
+        raise ValueError("נתוני מושבים לא תקינים")
+    return sum(prices[seat_key(s)] for s in seats)
+
+# A seat in checkout is held for this long, after that anyone can buy it and the sweeper deletes the hold
+SEAT_HOLD_SECONDS = 600
+SEAT_HOLD_SWEEP_INTERVAL = 60
+
+
+class SeatTakenError(ValueError): #A booking or hold asked for seats an ACTIVE reservation of the flight already has, seats lists them
+    def __init__(self, keys):
+        self.seats = [{"class_type": c, "row_number": r, "column_number": col} for c, r, col in keys]
+        super().__init__(f"המושבים {_seat_labels(keys)} כבר נמכרו")
+
+
+class SeatHeldError(ValueError): #A booking or hold asked for seats another checkout holds and its hold did not expire yet, seats lists them
+    def __init__(self, keys):
+        self.seats = [{"class_type": c, "row_number": r, "column_number": col} for c, r, col in keys]
+        super().__init__(f"המושבים {_seat_labels(keys)} שמורים כרגע להזמנה אחרת")
+
+
+def _seat_keys(seats) -> list: #Valid (class_type, row_number, column_number) keys of the selected seats without repeats
+    keys = []
+    for s in seats or []:
+        key = seat_key(s)
+        if key is not None and key not in keys:
+            keys.append(key)
+    return keys
+
+def _seat_keys_json(keys) -> str: #The seat keys as the one json parameter the registered seat statements take
+    return json.dumps([list(key) for key in keys])
+
+def _seat_labels(keys) -> str:
+    return ", ".join(f"{class_type} {row}-{column}" for class_type, row, column in keys)
+
+#Which of these seats an ACTIVE reservation of the flight (other than except_reservation) already has, read from ux_seats_in_reservation_active
+def _taken_seat_keys(cur, flight_number: int, keys, except_reservation: int | None = None) -> list:
+    if not keys:
+        return []
+    rows = query_all("taken_seats", (flight_number, _seat_keys_json(keys), except_reservation), cur)
+    return [(r["class_type"], r["row_number"], r["column_number"]) for r in rows]
+
+def _check_seat_holds(cur, flight_number: int, seats: list[dict], hold_token: str | None): #Raise if another checkout holds one of the seats and the hold did not expire yet
+    keys = _seat_keys(seats)
+    if not keys:
+        return
+    rows = query_all("held_seats_other", (flight_number, _seat_keys_json(keys), hold_token), cur)
+    held = [(r["class_type"], r["row_number"], r["column_number"]) for r in rows]
+    if held:
+        raise SeatHeldError(held)
+
+def _hold_flights(cur, hold_token: str) -> list[int]:
+    return [r["flight_number"] for r in query_all("hold_flights", (hold_token,), cur)]
+
+#Hold the selected seats of a flight for one checkout (replacing its earlier holds) and return when the hold expires
+#Raise SeatTakenError or SeatHeldError naming the seats that are already sold or held by another checkout
+def acquire_seat_holds(hold_token: str, flight_number: int, aircraft_id_number: int, seats: list[dict], seconds: int = SEAT_HOLD_SECONDS) -> str:
+    keys = _seat_keys(seats)
+    if not keys:
+        raise ValueError("לא נבחרו מושבים")
+
+    with db_tx() as (conn, cur):
+        # a refused hold keeps the checkout's earlier holds
+        begin_write(conn, cur)
+        released = _hold_flights(cur, hold_token)
+        execute("delete_holds", (hold_token,), cur)
+
+        taken = _taken_seat_keys(cur, flight_number, keys)
+        if taken:
+            raise SeatTakenError(taken)
+
+        # one primary key probe per seat: a free or expired seat is taken over, a live hold of someone else is left alone
+        held = []
+        for class_type, row, column in keys:
+            params = (flight_number, aircraft_id_number, class_type, row, column, hold_token, f"+{int(seconds)} seconds")
+            if execute("upsert_seat_hold", params, cur) == 0:
+                held.append((class_type, row, column))
+        if held:
+            raise SeatHeldError(held)
+
+        expires_at = query_one("hold_expires_at", (hold_token,), cur)["expires_at"]
+
+    for n in set(released) | {flight_number}:
+        publish("seat_holds_changed", flight_number=n)
+    return expires_at
+
+def get_own_held_seats(flight_number: int, hold_token: str | None) -> list[dict]: #Seats of a flight this checkout holds and nobody bought, the seat page shows them as its selection
+    if not hold_token:
+        return []
+    return [dict(r) for r in query_all("own_held_seats", (flight_number, hold_token))]
+
+def release_seat_holds(hold_token: str | None): #Drop every seat a checkout holds (it left the checkout or picked other seats)
+    if not hold_token:
+        return
+    with db_tx() as (conn, cur):
+        released = _hold_flights(cur, hold_token)
+        if released:
+            execute("delete_holds", (hold_token,), cur)
+    for n in released:
+        publish("seat_holds_changed", flight_number=n)
+
+def sweep_expired_seat_holds() -> int: #Delete expired holds and return how many were deleted
+    with db_tx() as (conn, cur):
+        flights = [r["flight_number"] for r in query_all("expired_hold_flights", cur=cur)]
+        deleted = execute("delete_expired_holds", (), cur)
+    for n in flights:
+        publish("seat_holds_changed", flight_number=n)
+    return deleted
+
+def start_seat_hold_sweeper(interval: float = SEAT_HOLD_SWEEP_INTERVAL): #Delete expired holds in a background thread every interval seconds
+    def run():
+        while True:
+            try:
+                sweep_expired_seat_holds()
+            except sqlite3.Error:
+                pass
+            time.sleep(interval)
+    thread = threading.Thread(target=run, name="seat-hold-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+#Save the seats of a new ACTIVE reservation, the unique index on active seats rejects one another reservation already has
+#The seats are not looked up first: the index fails the insert and the conflict is raised as SeatTakenError naming every sold seat
+#The caller's begin_write still takes the write lock first, SQLite has one writer so bookings run one after the other anyway
+def _insert_reservation_seats(cur, reservation_code: int, flight_number: int, aircraft_id: int, seats: list[dict]):
+    try:
+        for s in seats:
+            # the same key the prices and holds were checked with, the index compares the stored class text exactly
+            class_type, row_number, column_number = seat_key(s)
+            execute("insert_reservation_seat", (reservation_code, aircraft_id, class_type, row_number, column_number, flight_number), cur)
+    except sqlite3.IntegrityError:
+        taken = _taken_seat_keys(cur, flight_number, _seat_keys(seats), except_reservation=reservation_code)
+        if taken:
+            raise SeatTakenError(taken)
+        raise
 
 #Create a reservation for a flight and save the selected seats
-def create_reservation_with_seats(email: str, flight_number: int, seats: list[dict]) -> int:
+def create_reservation_with_seats(email: str, flight_number: int, seats: list[dict], hold_token: str | None = None) -> int:
     with db_tx() as (conn, cur):
-        cur.execute("SELECT aircraft_id_number FROM flight WHERE flight_number=?", (flight_number,))
-        f = cur.fetchone()
-        cur.fetchall()
+        # a seat that is already sold fails after the reservation row was written, it has to go with the rest
+        # BEGIN IMMEDIATE: a deferred transaction that read first can fail with SQLITE_BUSY when it turns into a write
+        begin_write(conn, cur)
+        f = query_one("flight_aircraft", (flight_number,), cur)
 
         if not f:
             raise ValueError("טיסה לא קיימת")
         aircraft_id = f["aircraft_id_number"]
 
-        total = 0.0
-        for s in seats:
-            cur.execute("""
-                SELECT price
-                FROM seats_in_flights
-                WHERE aircraft_id_number=? AND flight_number=? AND class_type=? AND `row_number`=? AND column_number=?
-            """, (aircraft_id, flight_number, s["class_type"], s["row_number"], s["column_number"]))
-
-            seat_row = cur.fetchone()
-            cur.fetchall()
+        total = _price_seats_for_booking(cur, flight_number, aircraft_id, seats)
+        _check_seat_holds(cur, flight_number, seats, hold_token)
 
-            if not seat_row:
-                raise ValueError(f"מושב {s['row_number']}-{s['column_number']} לא נמצא בטיסה זו")
+        reservation_code = allocate_id(cur, "reservation_code")
 
-            total += float(seat_row["price"] or 0)
+        if not query_one("customer_by_email", (email,), cur):
+            execute("insert_customer", (email, None, None), cur)
 
-        while True:
-            reservation_code = random.randint(8000, 9999)
-            cur.execute("SELECT 1 FROM reservations WHERE reservation_code=?", (reservation_code,))
-            res_exists = cur.fetchone()
-            cur.fetchall()
-            if not res_exists:
-                break
+        execute("insert_reservation", (reservation_code, total, email, flight_number), cur)
 
-        cur.execute("SELECT 1 FROM customer WHERE email=?", (email,))
-        cust_exists = cur.fetchone()
-        cur.fetchall()
+        _insert_reservation_seats(cur, reservation_code, flight_number, aircraft_id, seats)
 
-        if not cust_exists:
-            cur.execute("INSERT INTO customer(email, first_name, last_name) VALUES (?, NULL, NULL)", (email,))
+        if hold_token:
+            execute("delete_holds", (hold_token,), cur)
 
-        cur.execute("""
-            INSERT INTO reservations
-            (reservation_code, reservations_status, reservation_date, total_payment, email, flight_number)
-            VALUES (?, 'ACTIVE', DATE('now'), ?, ?, ?);
-        """, (reservation_code, total, email, flight_number))
-
-        for s in seats:
-            cur.execute("""
-                INSERT INTO seats_in_reservation
-                (reservation_code, aircraft_id_number, class_type, `row_number`, column_number)
-                VALUES (?, ?, ?, ?, ?)
-            """, (reservation_code, aircraft_id, s["class_type"], s["row_number"], s["column_number"]))
-
-        return reservation_code
+    publish("reservations_changed", flight_number=flight_number)
+    return reservation_code
 
 def get_airport_countries(): #Get the list of countries that exist in the airports table
-    sql = """
-        SELECT DISTINCT country
-        FROM airport
-        WHERE country IS NOT NULL AND country <> ''
-        ORDER BY country;
-    """
-    with db_conn() as cur:
-        cur.execute(sql)
-        rows = cur.fetchall()
-    return [r["country"] for r in rows]
+    return list(_reference_data()["countries"])
 
 #Check manager id and password and return the manager if they match
 def authenticate_manager(manager_id: int, password: str):
-    sql = """
-        SELECT id_number, first_name, last_name
-        FROM manager
-        WHERE id_number = ? AND password = ?
-        LIMIT 1;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (manager_id, password))
-        return cur.fetchone()
+    return query_one("manager_login", (manager_id, password))
 
 def get_all_flights_with_hours_and_occupancy(): #Get flights with seat counts and flags like past or full
-    sql = """
-    SELECT
-  f.flight_number,
-  f.aircraft_id_number,
-  f.origin_airport,
-  f.destination_airport,
-  f.departure_datetime,
-  f.status,
-
-  -- REPLACEMENT 1: SQLite replacement for TIMESTAMPDIFF(HOUR, ...)
-  -- Calculates difference in days, multiplies by 24 for hours, and casts to int
-  CAST((julianday(f.departure_datetime) - julianday('now')) * 24 AS INTEGER) AS hours_to_departure,
-
-  -- REPLACEMENT 2: SQLite boolean logic
-  -- Returns 1 (True) or 0 (False)
-  (f.departure_datetime < datetime('now')) AS is_past,
-
-  COALESCE(st.total_seats, 0) AS total_seats,
-  COALESCE(tk.taken_seats, 0) AS taken_seats,
-
-  CASE
-    WHEN COALESCE(st.total_seats, 0) > 0
-     AND COALESCE(st.total_seats, 0) = COALESCE(tk.taken_seats, 0)
-    THEN 1 ELSE 0
-  END AS is_full
-
-FROM flight f
-LEFT JOIN (
-    SELECT flight_number, COUNT(*) AS total_seats
-    FROM seats_in_flights
-    GROUP BY flight_number
-) st ON st.flight_number = f.flight_number
-
-LEFT JOIN (
-    SELECT r.flight_number, COUNT(*) AS taken_seats
-    FROM reservations r
-    JOIN seats_in_reservation sir ON sir.reservation_code = r.reservation_code
-    WHERE r.reservations_status = 'ACTIVE'
-    GROUP BY r.flight_number
-) tk ON tk.flight_number = f.flight_number
-
-ORDER BY f.departure_datetime;
-    """
-    with db_conn() as cur:
-        cur.execute(sql)
-        rows = cur.fetchall() or []
+    rows = query_all("flights_with_occupancy")
 
     rows_list = []
     for r in rows:
@@ -758,34 +1073,22 @@ ORDER BY f.departure_datetime;
     return rows_list
 
 def get_all_airports(): #Get a list of all airport names
-    sql = "SELECT airport_name FROM airport ORDER BY airport_name;"
-    with db_conn() as cur:
-        cur.execute(sql)
-        return [r["airport_name"] for r in cur.fetchall()]
+    return list(_reference_data()["airports"])
 
 def aircraft_id_exists(aircraft_id_number: int) -> bool: #Check if an aircraft id already exists
-    sql = "SELECT 1 FROM aircraft WHERE aircraft_id_number = ? LIMIT 1;"
-    with db_conn() as cur:
-        cur.execute(sql, (aircraft_id_number,))
-        return cur.fetchone() is not None
+    return query_one("aircraft_exists", (aircraft_id_number,)) is not None
 
-#Pick a random free aircraft id number
-def generate_unique_aircraft_id_4_digits(max_tries: int = 5000) -> int:
-    for _ in range(max_tries):
-        candidate = random.randint(1000, 9999)
-        if not aircraft_id_exists(candidate):
-            return candidate
-    raise RuntimeError("לא הצלחתי לייצר מספר מטוס ייחודי (4 ספרות).")
+#Allocate the next free aircraft id number (4 digits)
+def generate_unique_aircraft_id_4_digits() -> int:
+    with db_tx() as (conn, cur):
+        return allocate_id(cur, "aircraft_id_number")
 
 #Create a new aircraft row and return its id
 def create_aircraft(size: str, manufacturer: str, purchase_date):
-    sql = """
-    INSERT INTO aircraft (aircraft_id_number, size, manufacturer, purchase_date)
-    VALUES (?, ?, ?, ?);
-    """
-    new_id = generate_unique_aircraft_id_4_digits()
-    with db_conn() as cur:
-        cur.execute(sql, (new_id, size, manufacturer, purchase_date))
+    with db_tx() as (conn, cur):
+        new_id = allocate_id(cur, "aircraft_id_number")
+        execute("insert_aircraft", (new_id, size, manufacturer, purchase_date), cur)
+    bump_reference_version()
     return new_id
 
 #Create a reservation and also save customer name and phones
@@ -795,7 +1098,8 @@ def create_reservation_with_seats_with_customer_details(
     last_name: str,
     phones: list[str],
     flight_number: int,
-    seats: list[dict]
+    seats: list[dict],
+    hold_token: str | None = None
 ) -> int:
     email = (email or "").strip().lower()
     first_name = (first_name or "").strip()
@@ -806,87 +1110,40 @@ def create_reservation_with_seats_with_customer_details(
         raise ValueError("חסרים פרטי לקוח (אימייל/שם/טלפון).")
 
     with db_tx() as (conn, cur):
-        cur.execute("SELECT 1 FROM customer WHERE email=?", (email,))
-        exists = cur.fetchone()
-        cur.fetchall()
-
-        if not exists:
-            cur.execute(
-                "INSERT INTO customer (email, first_name, last_name) VALUES (?, ?, ?)",
-                (email, first_name, last_name)
-            )
+        begin_write(conn, cur)
+        if not query_one("customer_by_email", (email,), cur):
+            execute("insert_customer", (email, first_name, last_name), cur)
         else:
-            cur.execute(
-                "UPDATE customer SET first_name=?, last_name=? WHERE email=?",
-                (first_name, last_name, email)
-            )
+            execute("update_customer_name", (first_name, last_name, email), cur)
 
-        cur.execute("DELETE FROM customer_phone_number WHERE email=?", (email,))
+        execute("delete_customer_phones", (email,), cur)
         for p in phones:
-            cur.execute(
-                "INSERT INTO customer_phone_number (email, phone_number) VALUES (?, ?)",
-                (email, p)
-            )
+            execute("insert_customer_phone", (email, p), cur)
 
-        cur.execute("SELECT aircraft_id_number FROM flight WHERE flight_number=?", (flight_number,))
-        f = cur.fetchone()
-        cur.fetchall()
+        f = query_one("flight_aircraft", (flight_number,), cur)
 
         if not f:
             raise ValueError("טיסה לא קיימת")
         aircraft_id = f["aircraft_id_number"]
 
-        total = 0.0
-        for s in seats:
-            cur.execute("""
-                SELECT price
-                FROM seats_in_flights
-                WHERE aircraft_id_number=? AND flight_number=? AND class_type=? AND `row_number`=? AND column_number=?
-            """, (aircraft_id, flight_number, s["class_type"], s["row_number"], s["column_number"]))
-            seat_row = cur.fetchone()
-            cur.fetchall()
+        total = _price_seats_for_booking(cur, flight_number, aircraft_id, seats)
+        _check_seat_holds(cur, flight_number, seats, hold_token)
 
-            if not seat_row:
-                raise ValueError(f"מושב {s['row_number']}-{s['column_number']} לא נמצא בטיסה זו")
+        reservation_code = allocate_id(cur, "reservation_code")
 
-            total += float(seat_row["price"] or 0)
+        execute("insert_reservation", (reservation_code, total, email, flight_number), cur)
 
-        while True:
-            reservation_code = random.randint(8000, 9999)
-            cur.execute("SELECT 1 FROM reservations WHERE reservation_code=?", (reservation_code,))
-            res_exists = cur.fetchone()
-            cur.fetchall()
-            if not res_exists:
-                break
+        _insert_reservation_seats(cur, reservation_code, flight_number, aircraft_id, seats)
 
-        cur.execute("""
-            INSERT INTO reservations
-            (reservation_code, reservations_status, reservation_date, total_payment, email, flight_number)
-            VALUES (?, 'ACTIVE', CURRENT_DATE, ?, ?, ?);
-        """, (reservation_code, total, email, flight_number))
+        if hold_token:
+            execute("delete_holds", (hold_token,), cur)
 
-        for s in seats:
-            cur.execute("""
-                INSERT INTO seats_in_reservation
-                (reservation_code, aircraft_id_number, class_type, `row_number`, column_number)
-                VALUES (?, ?, ?, ?, ?)
-            """, (reservation_code, aircraft_id, s["class_type"], s["row_number"], s["column_number"]))
-
-        return reservation_code
+    publish("reservations_changed", flight_number=flight_number)
+    return reservation_code
 
 #Check if this id number is already in pilot attendant or manager tables
 def crew_member_exists_in_any_table(id_number: int) -> bool:
-    sql = """
-    SELECT 1 FROM pilot WHERE id_number = ?
-    UNION
-    SELECT 1 FROM flight_attendant WHERE id_number = ?
-    UNION
-    SELECT 1 FROM manager WHERE id_number = ?
-    LIMIT 1;
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (id_number, id_number, id_number))
-        return cur.fetchone() is not None
+    return query_one("crew_id_taken", (id_number, id_number, id_number)) is not None
 
 #Add a pilot to the database
 def create_pilot(
@@ -900,17 +1157,11 @@ def create_pilot(
     employment_start_date,
     long_flight_certification: int
 ):
-    sql = """
-    INSERT INTO pilot
-      (id_number, first_name, last_name, city, street, house_number, phone_number, employment_start_date, long_flight_certification)
-    VALUES
-      (?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (
+    with db_tx() as (conn, cur):
+        execute("insert_pilot", (
             id_number, first_name, last_name, city, street,
             house_number, phone_number, employment_start_date, long_flight_certification
-        ))
+        ), cur)
 
 #Add a flight attendant to the database
 def create_attendant(
@@ -924,17 +1175,11 @@ def create_attendant(
     employment_start_date,
     long_flight_certification: int
 ):
-    sql = """
-    INSERT INTO flight_attendant
-      (id_number, first_name, last_name, city, street, house_number, phone_number, employment_start_date, long_flight_certification)
-    VALUES
-      (?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """
-    with db_conn() as cur:
-        cur.execute(sql, (
+    with db_tx() as (conn, cur):
+        execute("insert_attendant", (
             id_number, first_name, last_name, city, street,
             house_number, phone_number, employment_start_date, long_flight_certification
-        ))
+        ), cur)
 
 #Create an aircraft and also create its classes and seats
 def create_aircraft_with_classes_and_seats(
@@ -947,44 +1192,29 @@ def create_aircraft_with_classes_and_seats(
     bus_rows=None,
     bus_cols=None
 ):
-    new_id = generate_unique_aircraft_id_4_digits()
-
-    sql_air = """
-    INSERT INTO `aircraft` (`aircraft_id_number`, `size`, `manufacturer`, `purchase_date`)
-    VALUES (?, ?, ?, ?);
-    """
-
-    sql_class = """
-    INSERT INTO `class` (`aircraft_id_number`, `type`, `number_of_rows`, `number_of_columns`)
-    VALUES (?, ?, ?, ?);
-    """
-
-    sql_seat = """
-    INSERT INTO `seat` (`aircraft_id_number`, `class_type`, `row_number`, `column_number`)
-    VALUES (?, ?, ?, ?);
-    """
-
     def build_seats(aircraft_id: int, class_type: str, rows: int, cols: int):
         return [(aircraft_id, class_type, r, c)
                 for r in range(1, rows + 1)
                 for c in range(1, cols + 1)]
 
-    with db_conn() as cur:
-        cur.execute(sql_air, (new_id, size, manufacturer, purchase_date))
+    with db_tx() as (conn, cur):
+        new_id = allocate_id(cur, "aircraft_id_number")
+        execute("insert_aircraft", (new_id, size, manufacturer, purchase_date), cur)
 
-        cur.execute(sql_class, (new_id, "ECONOMY", econ_rows, econ_cols))
+        execute("insert_class", (new_id, "ECONOMY", econ_rows, econ_cols), cur)
 
         if size == "LARGE":
             if bus_rows is None or bus_cols is None:
                 raise ValueError("חובה להזין נתוני BUSINESS למטוס גדול.")
-            cur.execute(sql_class, (new_id, "BUSINESS", int(bus_rows), int(bus_cols)))
+            execute("insert_class", (new_id, "BUSINESS", int(bus_rows), int(bus_cols)), cur)
 
         econ_seats = build_seats(new_id, "ECONOMY", int(econ_rows), int(econ_cols))
-        cur.executemany(sql_seat, econ_seats)
+        execute_many("insert_seat", econ_seats, cur)
 
         if size == "LARGE":
             bus_seats = build_seats(new_id, "BUSINESS", int(bus_rows), int(bus_cols))
-            cur.executemany(sql_seat, bus_seats)
+            execute_many("insert_seat", bus_seats, cur)
+    bump_reference_version()
     return new_id
 
 def is_card_exp_valid(exp: str): #Check if a credit card expiration date is valid
@@ -0,0 +1,92 @@
+import asyncio
+import contextvars
+import functools
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import DB_POOL_SIZE, db_conn, db_tx
+from utils_queries import query_all, query_one
+
+# sqlite has no async driver, so blocking calls run on a fixed number of threads.
+# More workers than pooled connections would only wait on the pool.
+DB_ASYNC_WORKERS = DB_POOL_SIZE
+
+_executor = ThreadPoolExecutor(max_workers=DB_ASYNC_WORKERS, thread_name_prefix="db-async")
+
+
+async def run_db(fn, *args, **kwargs): #Run a blocking data access function on the database executor and wait for it without blocking the event loop
+    loop = asyncio.get_running_loop()
+    # run inside a copy of the caller's context so the request's lock wait counter and SQL trace see these queries
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+class AsyncCursor: #Cursor wrapper whose execute/fetch calls run on the database executor
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def execute(self, sql: str, params=()):
+        await run_db(self._cursor.execute, sql, params)
+        return self
+
+    async def executemany(self, sql: str, seq_of_params):
+        await run_db(self._cursor.executemany, sql, seq_of_params)
+        return self
+
+    async def fetchone(self):
+        return await run_db(self._cursor.fetchone)
+
+    async def fetchall(self):
+        return await run_db(self._cursor.fetchall)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def sync(self): #The wrapped cursor, for passing to sync helpers inside run_db
+        return self._cursor
+
+
+@asynccontextmanager
+async def _async_enter(cm):
+    value = await run_db(cm.__enter__)
+    try:
+        yield value
+    except BaseException as e:
+        if not await run_db(cm.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await run_db(cm.__exit__, None, None, None)
+
+
+@asynccontextmanager
+async def async_db_conn(): #Async version of db_conn: borrow a pooled connection and give back an AsyncCursor
+    async with _async_enter(db_conn()) as cur:
+        yield AsyncCursor(cur)
+
+
+@asynccontextmanager
+async def async_db_tx(): #Async version of db_tx: commit if ok rollback if error, gives back (connection, AsyncCursor)
+    async with _async_enter(db_tx()) as (conn, cur):
+        yield conn, AsyncCursor(cur)
+
+
+async def async_query_all(name: str, params=()) -> list: #Run a registered SELECT on the executor and return all rows
+    return await run_db(query_all, name, params)
+
+
+async def async_query_one(name: str, params=()): #Run a registered SELECT on the executor and return the first row or None
+    return await run_db(query_one, name, params)
+
+
+def shutdown_executor(): #Wait for running database calls and stop the executor threads
+    _executor.shutdown(wait=True)
@@ -0,0 +1,137 @@
+import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from utils import subscribe, get_seat_page
+from utils_seatmap import seat_map_payload
+
+# Rendered search pages are reused for this long at most, the searches hide flights that already departed
+FRAGMENT_CACHE_MAX_AGE = 60
+FRAGMENT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+
+class FragmentCache: #Rendered HTML per route and query, least recently used first out, dropped when a flight it shows changes
+    def __init__(self, max_bytes: int = FRAGMENT_CACHE_MAX_BYTES, max_age: float = FRAGMENT_CACHE_MAX_AGE):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_flight = {}
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _drop(self, key):
+        html, size, flight_numbers, _ = self._entries.pop(key)
+        self._bytes -= size
+        for flight_number in flight_numbers:
+            keys = self._by_flight.get(flight_number)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_flight[flight_number]
+
+    def get(self, key): #The cached HTML for key, or None if it is missing or too old
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[3] > self.max_age:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, html: str, flight_numbers): #Keep html for key, remembering which flights it shows so a write to one of them drops it
+        size = len(html.encode("utf8"))
+        if size > self.max_bytes:
+            return
+        flight_numbers = frozenset(flight_numbers)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (html, size, flight_numbers, time.time())
+            self._bytes += size
+            for flight_number in flight_numbers:
+                self._by_flight.setdefault(flight_number, set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate_flight(self, flight_number: int, **_): #Drop every page that lists this flight
+        with self._lock:
+            for key in list(self._by_flight.get(flight_number, ())):
+                self._drop(key)
+                self._stats["invalidations"] += 1
+
+    def clear(self, **_): #Drop everything, for writes that can add a flight to any search (a new flight, new airports)
+        with self._lock:
+            self._stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._by_flight.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                hit_rate=round(self._stats["hits"] / lookups, 3) if lookups else None
+            )
+
+
+class SeatMapCache: #JSON body and ETag of /api/flights/<n>/seatmap per flight, loaded again only after a write to that flight
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, flight_number: int): #{"payload", "body", "etag"} of a flight, None if there is no such flight
+        with self._lock:
+            entry = self._entries.get(flight_number)
+            if entry is not None:
+                self._entries.move_to_end(flight_number)
+                self._stats["hits"] += 1
+                return entry
+            self._stats["misses"] += 1
+            generation = self._generation
+        seat_page = get_seat_page(flight_number)
+        if seat_page is None:
+            return None
+        payload = seat_map_payload(seat_page)
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        entry = {"payload": payload, "body": body, "etag": hashlib.sha1(body.encode("utf8")).hexdigest()}
+        with self._lock:
+            # a write that landed while loading may not be in this copy, serve it once but do not keep it
+            if generation == self._generation:
+                self._entries[flight_number] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate_flight(self, flight_number: int, **_):
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(flight_number, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+fragment_cache = FragmentCache()
+seat_map_cache = SeatMapCache()
+subscribe("reservations_changed", fragment_cache.invalidate_flight)
+subscribe("flight_cancelled", fragment_cache.invalidate_flight)
+subscribe("flight_created", fragment_cache.clear)
+subscribe("reference_data_changed", fragment_cache.clear)
+for _event in ("reservations_changed", "flight_cancelled", "seat_holds_changed"):
+    subscribe(_event, seat_map_cache.invalidate_flight)
@@ -0,0 +1,335 @@
+import sys
+from datetime import datetime
+
+from utils import db_tx
+
+
+def _add_column_if_missing(table: str, column: str, definition: str): #Build a step that runs ALTER TABLE ADD COLUMN only once
+    def step(cur):
+        cur.execute(f"PRAGMA table_info({table});")
+        if column not in [r["name"] for r in cur.fetchall()]:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    return step
+
+
+def _fail_on_double_bookings(cur): #Stop the migration with the seats that two ACTIVE reservations share, the unique index cannot be built over them
+    cur.execute("""
+        SELECT flight_number, class_type, `row_number`, column_number, GROUP_CONCAT(reservation_code) AS reservation_codes
+        FROM seats_in_reservation
+        WHERE active = 1
+        GROUP BY flight_number, class_type, `row_number`, column_number
+        HAVING COUNT(*) > 1;
+    """)
+    rows = cur.fetchall()
+    if rows:
+        seats = "; ".join(
+            f"flight {r['flight_number']} {r['class_type']} {r['row_number']}-{r['column_number']}: reservations {r['reservation_codes']}"
+            for r in rows
+        )
+        raise RuntimeError(f"seats sold twice, cancel one of the reservations and migrate again: {seats}")
+
+
+# Hebrew names people type in the search forms for the airports and countries of the seed data (the airport table is English only)
+_SEED_PLACE_NAMES = [
+    ("TLV", "נתב\"ג"), ("TLV", "בן גוריון"), ("TLV", "תל אביב"),
+    ("LCA", "לרנקה"), ("ATH", "אתונה"), ("IST", "איסטנבול"), ("DXB", "דובאי"),
+    ("LHR", "הית'רו"), ("LHR", "לונדון"), ("CDG", "שארל דה גול"), ("CDG", "פריז"),
+    ("JFK", "ניו יורק"), ("FCO", "רומא"), ("AMS", "אמסטרדם"),
+    ("Israel", "ישראל"), ("Cyprus", "קפריסין"), ("Greece", "יוון"), ("Turkey", "טורקיה"),
+    ("UAE", "איחוד האמירויות"), ("UAE", "אמירויות"), ("UK", "בריטניה"), ("UK", "אנגליה"),
+    ("France", "צרפת"), ("USA", "ארצות הברית"), ("USA", "ארה\"ב"), ("Italy", "איטליה"), ("Netherlands", "הולנד"),
+]
+
+
+def _seed_place_names(cur): #Add the Hebrew names of the places this database has, later names are added as data
+    cur.execute("SELECT airport_name AS place FROM airport UNION SELECT country FROM airport WHERE country IS NOT NULL;")
+    places = {r["place"] for r in cur.fetchall()}
+    cur.executemany(
+        "INSERT OR IGNORE INTO place_name (place, name, position) VALUES (?, ?, ?);",
+        [(place, name, position) for position, (place, name) in enumerate(_SEED_PLACE_NAMES) if place in places]
+    )
+
+
+# Every migration is (version, name, steps). A step is a SQL string or a function that gets the cursor.
+# Steps must be safe to run again (IF NOT EXISTS / checks) so a half applied migration can be retried.
+MIGRATIONS = [
+    (1, "hot path indexes", [
+        """CREATE INDEX IF NOT EXISTS idx_flight_status_departure
+           ON flight (status, departure_datetime, origin_airport, destination_airport, flight_number);""",
+        """CREATE INDEX IF NOT EXISTS idx_reservations_flight_status
+           ON reservations (flight_number, reservations_status, reservation_code);""",
+        """CREATE INDEX IF NOT EXISTS idx_reservations_email
+           ON reservations (email);""",
+        """CREATE INDEX IF NOT EXISTS idx_seats_in_flights_flight_class
+           ON seats_in_flights (flight_number, class_type, `row_number`, column_number, price, aircraft_id_number);""",
+        """CREATE INDEX IF NOT EXISTS idx_pilots_on_flights_flight
+           ON pilots_on_flights (flight_number, id_number);""",
+        """CREATE INDEX IF NOT EXISTS idx_attendants_on_flights_flight
+           ON flight_attendants_on_flights (flight_number, id_number);""",
+    ]),
+    (2, "stored flight arrival time", [
+        _add_column_if_missing("flight", "arrival_datetime", "DATETIME NULL"),
+        """UPDATE flight
+           SET arrival_datetime = (
+             SELECT datetime(flight.departure_datetime, '+' || fr.flight_duration || ' minutes')
+             FROM flight_route fr
+             WHERE fr.origin_airport = flight.origin_airport
+               AND fr.destination_airport = flight.destination_airport
+           )
+           WHERE arrival_datetime IS NULL;""",
+        # flights inserted without an arrival time (seed scripts, manual inserts) get one from the route
+        """CREATE TRIGGER IF NOT EXISTS trg_flight_arrival_insert
+           AFTER INSERT ON flight
+           WHEN NEW.arrival_datetime IS NULL
+           BEGIN
+             UPDATE flight
+             SET arrival_datetime = (
+               SELECT datetime(NEW.departure_datetime, '+' || fr.flight_duration || ' minutes')
+               FROM flight_route fr
+               WHERE fr.origin_airport = NEW.origin_airport
+                 AND fr.destination_airport = NEW.destination_airport
+             )
+             WHERE flight_number = NEW.flight_number;
+           END;""",
+        """CREATE TRIGGER IF NOT EXISTS trg_flight_arrival_update
+           AFTER UPDATE OF departure_datetime, origin_airport, destination_airport ON flight
+           BEGIN
+             UPDATE flight
+             SET arrival_datetime = (
+               SELECT datetime(NEW.departure_datetime, '+' || fr.flight_duration || ' minutes')
+               FROM flight_route fr
+               WHERE fr.origin_airport = NEW.origin_airport
+                 AND fr.destination_airport = NEW.destination_airport
+             )
+             WHERE flight_number = NEW.flight_number;
+           END;""",
+        """CREATE INDEX IF NOT EXISTS idx_flight_status_arrival
+           ON flight (status, arrival_datetime, departure_datetime, aircraft_id_number);""",
+        """CREATE INDEX IF NOT EXISTS idx_flight_aircraft_arrival
+           ON flight (aircraft_id_number, arrival_datetime, status, destination_airport);""",
+    ]),
+    (3, "id sequences", [
+        """CREATE TABLE IF NOT EXISTS id_sequence (
+             name VARCHAR(45) NOT NULL,
+             next_value INTEGER NOT NULL,
+             min_value INTEGER NULL,
+             max_value INTEGER NULL,
+             PRIMARY KEY (name)
+           );""",
+        # new reservation codes start above the old random 8000-9999 range so they never collide with it
+        """INSERT OR IGNORE INTO id_sequence (name, next_value, min_value, max_value)
+           SELECT 'reservation_code', MAX(10000, COALESCE(MAX(reservation_code), 0) + 1), 10000, NULL
+           FROM reservations;""",
+        """INSERT OR IGNORE INTO id_sequence (name, next_value, min_value, max_value)
+           SELECT 'flight_number', COALESCE(MAX(flight_number), 0) + 1, 1, NULL
+           FROM flight;""",
+        """INSERT OR IGNORE INTO id_sequence (name, next_value, min_value, max_value)
+           SELECT 'aircraft_id_number', MAX(1000, COALESCE(MAX(aircraft_id_number), 999) + 1), 1000, 9999
+           FROM aircraft
+           WHERE aircraft_id_number BETWEEN 1000 AND 9999;""",
+    ]),
+    (4, "flight inventory counters", [
+        """CREATE TABLE IF NOT EXISTS flight_inventory (
+             flight_number INT NOT NULL,
+             class_type VARCHAR(45) NOT NULL,
+             total_seats INT NOT NULL DEFAULT 0,
+             taken_seats INT NOT NULL DEFAULT 0,
+             PRIMARY KEY (flight_number, class_type)
+           );""",
+        "DELETE FROM flight_inventory;",
+        """INSERT INTO flight_inventory (flight_number, class_type, total_seats, taken_seats)
+           SELECT sf.flight_number, sf.class_type, COUNT(*),
+                  (SELECT COUNT(*)
+                   FROM reservations r
+                   JOIN seats_in_reservation sir ON sir.reservation_code = r.reservation_code
+                   WHERE r.flight_number = sf.flight_number
+                     AND r.reservations_status = 'ACTIVE'
+                     AND sir.class_type = sf.class_type)
+           FROM seats_in_flights sf
+           GROUP BY sf.flight_number, sf.class_type;""",
+        # a seat is taken while it is in seats_in_reservation of an ACTIVE reservation of that flight
+        """CREATE TRIGGER IF NOT EXISTS trg_inventory_seat_added
+           AFTER INSERT ON seats_in_flights
+           BEGIN
+             INSERT INTO flight_inventory (flight_number, class_type, total_seats, taken_seats)
+             VALUES (NEW.flight_number, NEW.class_type, 1, 0)
+             ON CONFLICT (flight_number, class_type) DO UPDATE SET total_seats = total_seats + 1;
+           END;""",
+        """CREATE TRIGGER IF NOT EXISTS trg_inventory_seat_removed
+           AFTER DELETE ON seats_in_flights
+           BEGIN
+             UPDATE flight_inventory SET total_seats = total_seats - 1
+             WHERE flight_number = OLD.flight_number AND class_type = OLD.class_type;
+           END;""",
+        """CREATE TRIGGER IF NOT EXISTS trg_inventory_seat_booked
+           AFTER INSERT ON seats_in_reservation
+           BEGIN
+             UPDATE flight_inventory SET taken_seats = taken_seats + 1
+             WHERE class_type = NEW.class_type
+               AND flight_number = (SELECT flight_number FROM reservations
+                                    WHERE reservation_code = NEW.reservation_code AND reservations_status = 'ACTIVE');
+           END;""",
+        """CREATE TRIGGER IF NOT EXISTS trg_inventory_seat_released
+           AFTER DELETE ON seats_in_reservation
+           BEGIN
+             UPDATE flight_inventory SET taken_seats = taken_seats - 1
+             WHERE class_type = OLD.class_type
+               AND flight_number = (SELECT flight_number FROM reservations
+                                    WHERE reservation_code = OLD.reservation_code AND reservations_status = 'ACTIVE');
+           END;""",
+        """CREATE TRIGGER IF NOT EXISTS trg_inventory_reservation_status
+           AFTER UPDATE OF reservations_status, flight_number ON reservations
+           WHEN (COALESCE(OLD.reservations_status, '') = 'ACTIVE') != (COALESCE(NEW.reservations_status, '') = 'ACTIVE')
+             OR OLD.flight_number IS NOT NEW.flight_number
+           BEGIN
+             UPDATE flight_inventory
+             SET taken_seats = taken_seats - (SELECT COUNT(*) FROM seats_in_reservation sir
+                                              WHERE sir.reservation_code = OLD.reservation_code
+                                                AND sir.class_type = flight_inventory.class_type)
+             WHERE OLD.reservations_status = 'ACTIVE' AND flight_number = OLD.flight_number;
+             UPDATE flight_inventory
+             SET taken_seats = taken_seats + (SELECT COUNT(*) FROM seats_in_reservation sir
+                                              WHERE sir.reservation_code = NEW.reservation_code
+                                                AND sir.class_type = flight_inventory.class_type)
+             WHERE NEW.reservations_status = 'ACTIVE' AND flight_number = NEW.flight_number;
+           END;""",
+    ]),
+    (5, "seat holds", [
+        # one row per held seat, the primary key is what makes two checkouts unable to hold the same seat
+        """CREATE TABLE IF NOT EXISTS seat_holds (
+             flight_number INT NOT NULL,
+             aircraft_id_number INT NOT NULL,
+             class_type VARCHAR(45) NOT NULL,
+             `row_number` INT NOT NULL,
+             column_number INT NOT NULL,
+             hold_token VARCHAR(64) NOT NULL,
+             expires_at DATETIME NOT NULL,
+             PRIMARY KEY (flight_number, class_type, `row_number`, column_number)
+           );""",
+        """CREATE INDEX IF NOT EXISTS idx_seat_holds_token
+           ON seat_holds (hold_token, flight_number);""",
+        """CREATE INDEX IF NOT EXISTS idx_seat_holds_expires
+           ON seat_holds (expires_at, flight_number);""",
+    ]),
+    (6, "one active reservation per seat", [
+        # the flight and status of the reservation are copied onto its seats so one partial unique index can cover them
+        _add_column_if_missing("seats_in_reservation", "flight_number", "INT NULL"),
+        _add_column_if_missing("seats_in_reservation", "active", "INT NOT NULL DEFAULT 0"),
+        """UPDATE seats_in_reservation
+           SET flight_number = (SELECT r.flight_number FROM reservations r
+                                WHERE r.reservation_code = seats_in_reservation.reservation_code),
+               active = COALESCE((SELECT r.reservations_status = 'ACTIVE' FROM reservations r
+                                  WHERE r.reservation_code = seats_in_reservation.reservation_code), 0);""",
+        _fail_on_double_bookings,
+        """CREATE UNIQUE INDEX IF NOT EXISTS ux_seats_in_reservation_active
+           ON seats_in_reservation (flight_number, class_type, `row_number`, column_number)
+           WHERE active = 1;""",
+        # rows inserted without the copied columns (seed scripts, manual inserts) get them from the reservation
+        """CREATE TRIGGER IF NOT EXISTS trg_seat_assignment_insert
+           AFTER INSERT ON seats_in_reservation
+           WHEN NEW.flight_number IS NULL
+           BEGIN
+             UPDATE seats_in_reservation
+             SET flight_number = (SELECT flight_number FROM reservations WHERE reservation_code = NEW.reservation_code),
+                 active = COALESCE((SELECT reservations_status = 'ACTIVE' FROM reservations
+                                    WHERE reservation_code = NEW.reservation_code), 0)
+             WHERE reservation_code = NEW.reservation_code
+               AND aircraft_id_number = NEW.aircraft_id_number
+               AND class_type = NEW.class_type
+               AND `row_number` = NEW.`row_number`
+               AND column_number = NEW.column_number;
+           END;""",
+        """CREATE TRIGGER IF NOT EXISTS trg_seat_assignment_status
+           AFTER UPDATE OF reservations_status, flight_number ON reservations
+           BEGIN
+             UPDATE seats_in_reservation
+             SET flight_number = NEW.flight_number,
+                 active = (COALESCE(NEW.reservations_status, '') = 'ACTIVE')
+             WHERE reservation_code = NEW.reservation_code;
+           END;""",
+    ]),
+    (7, "place names", [
+        # other names of an airport code or a country for search autocomplete, position orders the names of one place
+        """CREATE TABLE IF NOT EXISTS place_name (
+             place VARCHAR(45) NOT NULL,
+             name VARCHAR(100) NOT NULL,
+             position INT NOT NULL DEFAULT 0,
+             PRIMARY KEY (place, name)
+           );""",
+        _seed_place_names,
+    ]),
+]
+
+
+def _ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+          version INTEGER NOT NULL,
+          name VARCHAR(100) NULL,
+          applied_at DATETIME NULL,
+          PRIMARY KEY (version)
+        );
+    """)
+
+
+def get_schema_version() -> int: #Return the highest migration version recorded in the database
+    with db_tx() as (conn, cur):
+        _ensure_version_table(cur)
+        cur.execute("SELECT MAX(version) AS version FROM schema_migrations;")
+        row = cur.fetchone()
+    return (row["version"] if row else None) or 0
+
+
+def apply_migrations(target: int | None = None) -> list[int]: #Apply every pending migration in order and return the versions that ran
+    applied = []
+    for version, name, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if target is not None and version > target:
+            break
+        with db_tx() as (conn, cur):
+            if not conn.in_transaction:
+                cur.execute("BEGIN IMMEDIATE;")
+            _ensure_version_table(cur)
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = ?;", (version,))
+            if cur.fetchone():
+                continue
+
+            for step in steps:
+                if callable(step):
+                    step(cur)
+                else:
+                    cur.execute(step)
+
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?);",
+                (version, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+        applied.append(version)
+    return applied
+
+
+def migration_status() -> list[dict]: #List every known migration and whether it was applied
+    with db_tx() as (conn, cur):
+        _ensure_version_table(cur)
+        cur.execute("SELECT version, applied_at FROM schema_migrations;")
+        done = {r["version"]: r["applied_at"] for r in cur.fetchall()}
+    return [
+        {"version": version, "name": name, "applied_at": done.get(version)}
+        for version, name, _ in sorted(MIGRATIONS, key=lambda m: m[0])
+    ]
+
+
+if __name__ == "__main__":
+    # python utils_migrations.py [migrate|status] [--target N]
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    target = int(sys.argv[sys.argv.index("--target") + 1]) if "--target" in sys.argv else None
+
+    if command == "status":
+        for m in migration_status():
+            state = m["applied_at"] or "pending"
+            print(f"{m['version']:>4}  {m['name']:<40} {state}")
+    elif command == "migrate":
+        ran = apply_migrations(target)
+        print(f"applied: {ran or 'nothing'} | schema version: {get_schema_version()}")
+    else:
+        print("usage: python utils_migrations.py [migrate|status] [--target N]")
+        sys.exit(1)
@@ -0,0 +1,1001 @@
+import sys
+import json
+import time
+import threading
+
+# Every SQL statement used by the routes, the reports and the helpers in utils.py, defined once by name.
+# The text of a statement never changes between calls so sqlite's statement cache (cached_statements) always hits.
+QUERIES = {}
+
+QUERIES["customer_history_base"] = """
+        SELECT 
+            r.reservation_code, 
+            r.flight_number, 
+            r.total_payment,
+            f.departure_datetime, 
+            f.origin_airport, 
+            f.destination_airport,
+            r.reservations_status as raw_status,
+            CASE 
+                WHEN r.reservations_status = 'ACTIVE' AND f.departure_datetime >= datetime('now') THEN 'פעילה'
+                WHEN r.reservations_status = 'ACTIVE' AND f.departure_datetime < datetime('now') THEN 'בוצעה'
+                WHEN r.reservations_status = 'CUSTOMER_CANCELED' THEN 'ביטול לקוח'
+                WHEN r.reservations_status = 'SYSTEM_CANCELED' THEN 'ביטול מערכת'
+                ELSE r.reservations_status
+            END as display_status
+        FROM reservations r
+        JOIN flight f ON r.flight_number = f.flight_number
+        WHERE r.email = ?
+"""
+
+# history page status filter -> extra condition, each combination is its own fixed statement
+HISTORY_FILTERS = {
+    "all": "",
+    "active_future": " AND r.reservations_status = 'ACTIVE' AND f.departure_datetime >= datetime('now')",
+    "completed": " AND r.reservations_status = 'ACTIVE' AND f.departure_datetime < datetime('now')",
+    "customer_cancelled": " AND r.reservations_status = 'CUSTOMER_CANCELED'",
+    "system_cancelled": " AND r.reservations_status = 'SYSTEM_CANCELED'",
+}
+for _filter, _condition in HISTORY_FILTERS.items():
+    QUERIES[f"customer_history_{_filter}"] = QUERIES["customer_history_base"] + _condition + " ORDER BY f.departure_datetime DESC"
+del QUERIES["customer_history_base"]
+
+QUERIES["reservation_for_cancel"] = """
+                SELECT f.departure_datetime, r.total_payment, r.flight_number
+                FROM reservations r
+                JOIN flight f ON r.flight_number = f.flight_number
+                WHERE r.reservation_code = ? AND r.email = ?
+"""
+
+QUERIES["delete_reservation_seats"] = "DELETE FROM seats_in_reservation WHERE reservation_code = ?"
+
+QUERIES["cancel_reservation_with_fee"] = """
+                        UPDATE reservations 
+                        SET reservations_status = 'CUSTOMER_CANCELED', 
+                            total_payment = ?
+                        WHERE reservation_code = ?
+"""
+
+QUERIES["cancel_reservation_keep_payment"] = """
+                        UPDATE reservations 
+                        SET reservations_status = 'CUSTOMER_CANCELED'
+                        WHERE reservation_code = ?
+"""
+
+# search index (utils_search.py): every upcoming ACTIVE flight with its countries, and one flight for incremental updates
+QUERIES["search_index_upcoming_flights"] = """
+        SELECT 
+            f.flight_number, 
+            f.departure_datetime, 
+            f.origin_airport, 
+            a1.country AS origin_country,
+            f.destination_airport, 
+            a2.country AS destination_country
+        FROM flight f
+        JOIN airport a1 ON f.origin_airport = a1.airport_name
+        JOIN airport a2 ON f.destination_airport = a2.airport_name
+        WHERE f.departure_datetime >= CURRENT_DATE AND f.status = 'ACTIVE'
+"""
+
+QUERIES["search_index_flight"] = """
+        SELECT 
+            f.flight_number, 
+            f.departure_datetime, 
+            f.origin_airport, 
+            a1.country AS origin_country,
+            f.destination_airport, 
+            a2.country AS destination_country,
+            f.status
+        FROM flight f
+        JOIN airport a1 ON f.origin_airport = a1.airport_name
+        JOIN airport a2 ON f.destination_airport = a2.airport_name
+        WHERE f.flight_number = ?
+"""
+
+# fare calendar (utils_search.py): cheapest free seat per day and class on a route, one grouped pass
+QUERIES["fare_calendar"] = """
+        SELECT
+            DATE(f.departure_datetime) AS day,
+            sf.class_type,
+            MIN(sf.price) AS lowest_price,
+            COUNT(*) AS free_seats
+        FROM flight f
+        JOIN seats_in_flights sf ON sf.flight_number = f.flight_number
+        WHERE f.status = 'ACTIVE'
+          AND f.origin_airport IN (SELECT value FROM json_each(:origin_airports))
+          AND f.destination_airport IN (SELECT value FROM json_each(:destination_airports))
+          AND f.departure_datetime >= :window_start
+          AND f.departure_datetime < :window_end
+          AND f.departure_datetime >= datetime('now')
+          AND NOT EXISTS (
+              SELECT 1
+              FROM reservations r
+              JOIN seats_in_reservation sir ON sir.reservation_code = r.reservation_code
+              WHERE r.flight_number = f.flight_number
+                AND r.reservations_status = 'ACTIVE'
+                AND sir.aircraft_id_number = sf.aircraft_id_number
+                AND sir.class_type = sf.class_type
+                AND sir.`row_number` = sf.`row_number`
+                AND sir.column_number = sf.column_number
+          )
+        GROUP BY DATE(f.departure_datetime), sf.class_type
+"""
+
+QUERIES["flight_route"] = "SELECT origin_airport, destination_airport FROM flight WHERE flight_number = ?;"
+
+# connection graph (utils_search.py): upcoming ACTIVE flights with their arrival time, and one flight for incremental updates
+QUERIES["connection_graph_flights"] = """
+        SELECT flight_number, origin_airport, destination_airport, departure_datetime, arrival_datetime
+        FROM flight
+        WHERE status = 'ACTIVE' AND departure_datetime >= datetime('now') AND arrival_datetime IS NOT NULL
+"""
+
+QUERIES["connection_graph_flight"] = """
+        SELECT flight_number, origin_airport, destination_airport, departure_datetime, arrival_datetime, status
+        FROM flight
+        WHERE flight_number = ?
+"""
+
+# departure board (utils_search.py): the next ACTIVE departures of each origin with occupancy from the inventory counters
+_DEPARTURE_BOARD_SELECT = """
+        SELECT
+            f.flight_number,
+            f.origin_airport,
+            f.destination_airport,
+            a.country AS destination_country,
+            f.departure_datetime,
+            f.arrival_datetime,
+            f.status,
+            COALESCE(SUM(inv.total_seats), 0) AS total_seats,
+            COALESCE(SUM(inv.taken_seats), 0) AS taken_seats
+        FROM flight f
+        JOIN airport a ON a.airport_name = f.destination_airport
+        LEFT JOIN flight_inventory inv ON inv.flight_number = f.flight_number
+"""
+
+QUERIES["departure_board_next"] = """
+        SELECT * FROM (
+            SELECT board.*, ROW_NUMBER() OVER (PARTITION BY origin_airport ORDER BY departure_datetime, flight_number) AS position
+            FROM (""" + _DEPARTURE_BOARD_SELECT + """
+                WHERE f.status = 'ACTIVE'
+                  AND f.departure_datetime >= datetime('now')
+                GROUP BY f.flight_number
+            ) board
+        )
+        WHERE position <= ?
+"""
+
+QUERIES["departure_board_origin"] = _DEPARTURE_BOARD_SELECT + """
+        WHERE f.status = 'ACTIVE'
+          AND f.origin_airport = ?
+          AND f.departure_datetime >= datetime('now')
+        GROUP BY f.flight_number
+        ORDER BY f.departure_datetime, f.flight_number
+        LIMIT ?
+"""
+
+QUERIES["departure_board_flight"] = _DEPARTURE_BOARD_SELECT + """
+        WHERE f.flight_number = ?
+        GROUP BY f.flight_number
+"""
+
+QUERIES["airports_all"] = "SELECT airport_name, country FROM airport;"
+
+# place autocomplete (utils_search.py): the other (Hebrew) names of airport codes and countries, migration 7
+QUERIES["place_names_all"] = "SELECT place, name FROM place_name ORDER BY place, position, name;"
+
+QUERIES["customer_by_email"] = """
+            SELECT email, first_name, last_name
+            FROM customer
+            WHERE email = ?
+            LIMIT 1;
+"""
+
+QUERIES["customer_phones"] = """
+            SELECT phone_number
+            FROM customer_phone_number
+            WHERE email = ?
+            ORDER BY phone_number;
+"""
+
+QUERIES["aircraft_size"] = "SELECT size FROM aircraft WHERE aircraft_id_number = ?;"
+
+# manager reports (utils_reports.py)
+QUERIES["report_avg_occupancy"] = """
+    SELECT AVG(100.0 * (CASE WHEN booked.booked_seats IS NULL THEN 0 ELSE booked.booked_seats END) / ac_seat.total_seats) AS avg_occupancy_percent
+    FROM
+      (SELECT flight_number, aircraft_id_number
+        FROM flight
+        WHERE departure_datetime < datetime('now')  AND status = 'ACTIVE') AS past_flights
+        JOIN (SELECT aircraft_id_number, COUNT(*) AS total_seats
+              FROM seat
+              GROUP BY aircraft_id_number) AS ac_seat ON ac_seat.aircraft_id_number = past_flights.aircraft_id_number
+              LEFT JOIN (SELECT r.flight_number, COUNT(*) AS booked_seats
+                         FROM reservations AS r
+                         JOIN seats_in_reservation as sir ON sir.reservation_code = r.reservation_code
+                         WHERE r.reservations_status = 'ACTIVE'
+                         GROUP BY r.flight_number) AS booked ON booked.flight_number = past_flights.flight_number;
+    """
+
+QUERIES["report_revenue_by_combo"] = """
+SELECT combos.aircraft_size,combos.aircraft_manufacturer, combos.class_type,
+  SUM(CASE WHEN sif.price IS NULL THEN 0 ELSE sif.price END) AS total_revenue
+FROM (SELECT DISTINCT a.size AS aircraft_size, a.manufacturer AS aircraft_manufacturer, c.type AS class_type, f.flight_number
+    FROM flight AS f
+    JOIN aircraft AS a ON f.aircraft_id_number = a.aircraft_id_number
+    JOIN class AS c ON c.aircraft_id_number = a.aircraft_id_number) AS combos
+LEFT JOIN reservations AS r ON r.flight_number = combos.flight_number
+LEFT JOIN seats_in_reservation AS sir ON sir.reservation_code = r.reservation_code
+LEFT JOIN seats_in_flights AS sif ON sif.flight_number = combos.flight_number
+ AND sif.aircraft_id_number = sir.aircraft_id_number
+ AND sif.class_type = sir.class_type
+ AND sif.row_number = sir.row_number
+ AND sif.column_number = sir.column_number
+GROUP BY combos.aircraft_size, combos.aircraft_manufacturer, combos.class_type
+ORDER BY combos.aircraft_size, combos.aircraft_manufacturer, combos.class_type;
+    """
+
+QUERIES["report_staff_hours"] = """
+    SELECT staff_id, first_name, last_name,
+        SUM(CASE WHEN flight_duration < 360 THEN flight_duration ELSE 0 END) / 60.0 AS short_hours,
+        SUM(CASE WHEN flight_duration >= 360 THEN flight_duration ELSE 0 END) / 60.0 AS long_hours,
+        SUM(flight_duration) / 60.0 AS total_hours
+    FROM (
+        SELECT p.id_number AS staff_id, p.first_name, p.last_name,
+               CAST(ROUND((julianday(f.arrival_datetime) - julianday(f.departure_datetime)) * 1440) AS INTEGER) AS flight_duration
+        FROM pilot AS p
+        JOIN pilots_on_flights AS pof ON p.id_number = pof.id_number
+        JOIN flight AS f ON pof.flight_number = f.flight_number
+        WHERE f.status = 'ACTIVE' AND f.departure_datetime < datetime('now')
+
+        UNION ALL
+
+        SELECT fa.id_number AS staff_id, fa.first_name, fa.last_name,
+               CAST(ROUND((julianday(f.arrival_datetime) - julianday(f.departure_datetime)) * 1440) AS INTEGER) AS flight_duration
+        FROM flight_attendant AS fa
+        JOIN flight_attendants_on_flights AS faof ON fa.id_number = faof.id_number
+        JOIN flight AS f ON faof.flight_number = f.flight_number
+        WHERE f.status = 'ACTIVE' AND f.departure_datetime < datetime('now')
+    ) AS all_staff
+    GROUP BY staff_id, first_name, last_name
+    ORDER BY total_hours DESC;
+    """
+
+QUERIES["report_cancellation_rate"] = """
+    SELECT 
+    CAST(strftime('%Y', r.reservation_date) AS INTEGER) AS order_year, 
+    CAST(strftime('%m', r.reservation_date) AS INTEGER) AS order_month,
+    (SUM(CASE WHEN r.reservations_status = 'CUSTOMER_CANCELED' THEN 1 ELSE 0 END) * 100.0 / COUNT(reservation_code)) AS cancellation_rate
+    FROM reservations AS r
+    GROUP BY order_year, order_month
+    ORDER BY order_year ASC, order_month ASC;
+    """
+
+QUERIES["report_aircraft_monthly_summary"] = """
+    SELECT 
+    f.aircraft_id_number, 
+    f.activity_year, 
+    f.activity_month,
+    
+    -- 1. Active Flights Count
+    (SELECT COUNT(*)
+     FROM flight AS f1
+     WHERE f1.aircraft_id_number = f.aircraft_id_number
+     AND f1.status = 'ACTIVE'
+     AND CAST(strftime('%Y', f1.departure_datetime) AS INTEGER) = f.activity_year
+     AND CAST(strftime('%m', f1.departure_datetime) AS INTEGER) = f.activity_month) AS active_flights,
+
+    -- 2. Canceled Flights Count
+    (SELECT COUNT(*)
+     FROM flight AS f2
+     WHERE f2.aircraft_id_number = f.aircraft_id_number
+     AND f2.status = 'CANCELED'
+     AND CAST(strftime('%Y', f2.departure_datetime) AS INTEGER) = f.activity_year
+     AND CAST(strftime('%m', f2.departure_datetime) AS INTEGER) = f.activity_month) AS canceled_flights,
+
+    -- 3. Utilization (Rounded to 2 decimals)
+    ROUND(
+        (SELECT COUNT(DISTINCT date(f3.departure_datetime))
+         FROM flight AS f3
+         WHERE f3.aircraft_id_number = f.aircraft_id_number
+         AND f3.status = 'ACTIVE'
+         AND CAST(strftime('%Y', f3.departure_datetime) AS INTEGER) = f.activity_year
+         AND CAST(strftime('%m', f3.departure_datetime) AS INTEGER) = f.activity_month
+        ) / 30.0 * 100
+    , 2) AS utilization,
+
+    f_routes.origin_airport,
+    f_routes.destination_airport
+
+FROM (
+    -- Main Subquery: Get unique Aircraft-Year-Month combos
+    SELECT DISTINCT 
+        aircraft_id_number, 
+        CAST(strftime('%Y', departure_datetime) AS INTEGER) AS activity_year, 
+        CAST(strftime('%m', departure_datetime) AS INTEGER) AS activity_month
+    FROM flight
+) AS f
+
+LEFT JOIN (
+    -- Route Stats Subquery
+    SELECT 
+        aircraft_id_number, 
+        CAST(strftime('%Y', departure_datetime) AS INTEGER) AS r_year, 
+        CAST(strftime('%m', departure_datetime) AS INTEGER) AS r_month,
+        origin_airport, 
+        destination_airport, 
+        COUNT(*) AS route_count
+    FROM flight
+    WHERE status = 'ACTIVE'
+    GROUP BY aircraft_id_number, r_year, r_month, origin_airport, destination_airport
+) AS f_routes 
+  ON f.aircraft_id_number = f_routes.aircraft_id_number
+  AND f.activity_year = f_routes.r_year
+  AND f.activity_month = f_routes.r_month
+  AND f_routes.route_count = (
+      -- Max Count Subquery
+      SELECT COUNT(*) AS max_cnt
+      FROM flight AS f_max
+      WHERE f_max.aircraft_id_number = f_routes.aircraft_id_number
+      AND f_max.status = 'ACTIVE'
+      AND CAST(strftime('%Y', f_max.departure_datetime) AS INTEGER) = f_routes.r_year
+      AND CAST(strftime('%m', f_max.departure_datetime) AS INTEGER) = f_routes.r_month
+      GROUP BY f_max.origin_airport, f_max.destination_airport
+      ORDER BY max_cnt DESC
+      LIMIT 1
+  )
+
+ORDER BY f.aircraft_id_number ASC, f.activity_year ASC, f.activity_month ASC;
+    """
+
+
+# reference data cache (utils.py): airports, routes and aircraft classes, read together after every version bump
+QUERIES["reference_airports"] = "SELECT airport_name, country FROM airport ORDER BY airport_name;"
+
+QUERIES["reference_routes"] = "SELECT origin_airport, destination_airport, flight_duration FROM flight_route;"
+
+QUERIES["reference_classes"] = """
+            SELECT aircraft_id_number, type, number_of_rows, number_of_columns
+            FROM class
+            ORDER BY aircraft_id_number, CASE type
+                WHEN 'BUSINESS' THEN 1
+                WHEN 'ECONOMY' THEN 2
+                ELSE 3
+            END;
+"""
+
+# guest tickets (utils.py)
+QUERIES["guest_active_reservation"] = """
+    SELECT
+      r.reservation_code,
+      r.reservations_status,
+      r.reservation_date,
+      r.total_payment,
+      r.email,
+      r.flight_number,
+      f.origin_airport,
+      f.destination_airport,
+      f.departure_datetime,
+      f.status AS flight_status
+    FROM reservations r
+    JOIN flight f ON f.flight_number = r.flight_number
+    WHERE r.email = ?
+      AND r.reservation_code = ?
+      AND r.reservations_status = 'ACTIVE'
+      AND f.status = 'ACTIVE'
+      AND f.departure_datetime > datetime('now')
+    ORDER BY f.departure_datetime ASC;
+"""
+
+QUERIES["guest_cancel_reservation"] = """
+    UPDATE reservations
+    SET reservations_status = 'CUSTOMER_CANCELED'
+    WHERE email = ?
+      AND reservation_code = ?
+      AND reservations_status = 'ACTIVE'
+    RETURNING flight_number;
+"""
+
+# manager flight list and cancel (utils.py)
+QUERIES["flights_with_hours"] = """
+    SELECT
+  flight_number,
+  aircraft_id_number,
+  origin_airport,
+  destination_airport,
+  departure_datetime,
+  status,
+  CAST((julianday(departure_datetime) - julianday('now')) * 24 AS INTEGER) AS hours_to_departure
+FROM flight
+ORDER BY departure_datetime;
+"""
+
+QUERIES["flights_with_occupancy"] = """
+    SELECT
+  f.flight_number,
+  f.aircraft_id_number,
+  f.origin_airport,
+  f.destination_airport,
+  f.departure_datetime,
+  f.status,
+
+  -- REPLACEMENT 1: SQLite replacement for TIMESTAMPDIFF(HOUR, ...)
+  -- Calculates difference in days, multiplies by 24 for hours, and casts to int
+  CAST((julianday(f.departure_datetime) - julianday('now')) * 24 AS INTEGER) AS hours_to_departure,
+
+  -- REPLACEMENT 2: SQLite boolean logic
+  -- Returns 1 (True) or 0 (False)
+  (f.departure_datetime < datetime('now')) AS is_past,
+
+  COALESCE(inv.total_seats, 0) AS total_seats,
+  COALESCE(inv.taken_seats, 0) AS taken_seats,
+
+  CASE
+    WHEN COALESCE(inv.total_seats, 0) > 0
+     AND COALESCE(inv.total_seats, 0) = COALESCE(inv.taken_seats, 0)
+    THEN 1 ELSE 0
+  END AS is_full
+
+FROM flight f
+-- counters kept by the flight_inventory triggers (utils_migrations.py), a few rows per flight
+LEFT JOIN (
+    SELECT flight_number, SUM(total_seats) AS total_seats, SUM(taken_seats) AS taken_seats
+    FROM flight_inventory
+    GROUP BY flight_number
+) inv ON inv.flight_number = f.flight_number
+
+ORDER BY f.departure_datetime;
+"""
+
+QUERIES["cancel_flight_if_far"] = """
+            UPDATE flight
+            SET status = 'CANCELED'
+            WHERE flight_number = ?
+              AND status = 'ACTIVE'
+              AND departure_datetime > datetime('now', '+72 hours');
+"""
+
+QUERIES["flight_cancel_info"] = """
+            SELECT status,
+                   departure_datetime,
+                   CAST((julianday(departure_datetime) - julianday('now')) * 24 AS INTEGER) AS hours_to_departure
+            FROM flight
+            WHERE flight_number = ?;
+"""
+
+QUERIES["system_cancel_flight_reservations"] = """
+        UPDATE reservations
+        SET reservations_status = 'SYSTEM_CANCELED',
+            total_payment = 0
+        WHERE flight_number = ?
+          AND reservations_status = 'ACTIVE';
+"""
+
+# add flight wizard (utils.py): aircraft and crew free in a time window at the origin airport
+# parameters: arrival, departure, departure, origin, origin
+# a long flight needs a LARGE aircraft and certified crew, that is its own statement instead of a (? = 0 OR ...) switch
+# so the planner never has to keep a branch it cannot rule out at prepare time
+_AVAILABLE_AIRCRAFT = """
+    SELECT a.aircraft_id_number, a.size, a.manufacturer
+FROM aircraft a
+WHERE {long_filter}
+
+  -- 1. Exclude aircraft that are busy during the requested window
+  a.aircraft_id_number NOT IN (
+    SELECT f.aircraft_id_number
+    FROM flight f
+    WHERE f.status = 'ACTIVE'
+      AND f.aircraft_id_number IS NOT NULL
+      AND (
+        f.departure_datetime < ?  -- Overlap Start
+        AND f.arrival_datetime > ? -- Overlap End (stored arrival time)
+      )
+  )
+
+  -- 2. Ensure aircraft is at the correct starting airport
+  AND (
+    (
+      -- Logic: Find the destination of the LAST flight that landed before our new flight departs
+      (
+        SELECT f2.destination_airport
+        FROM flight f2
+        WHERE f2.aircraft_id_number = a.aircraft_id_number
+          AND f2.status <> 'CANCELED'
+          AND f2.arrival_datetime <= ?
+        ORDER BY f2.arrival_datetime DESC
+        LIMIT 1
+      ) = ?
+    )
+    OR
+    (
+      -- Logic: If the aircraft has NEVER flown, assume it is at 'TLV'
+      ? = 'TLV'
+      AND NOT EXISTS (
+        SELECT 1
+        FROM flight f0
+        WHERE f0.aircraft_id_number = a.aircraft_id_number
+          AND f0.status <> 'CANCELED'
+          AND f0.departure_datetime IS NOT NULL
+      )
+    )
+  )
+
+ORDER BY a.aircraft_id_number;
+"""
+
+_AVAILABLE_PILOTS = """
+   SELECT p.id_number, p.first_name, p.last_name, p.long_flight_certification
+FROM pilot p
+WHERE {long_filter}
+
+  -- 1. Exclude pilots who are currently flying during the window
+  p.id_number NOT IN (
+    SELECT pf.id_number
+    FROM pilots_on_flights pf
+    JOIN flight f ON f.flight_number = pf.flight_number
+    WHERE f.status = 'ACTIVE'
+      AND (
+        f.departure_datetime < ? -- Overlap Start
+        AND f.arrival_datetime > ? -- Overlap End (stored arrival time)
+      )
+  )
+  AND (
+    (
+      -- 2a. Check pilot's last known location
+      (
+        SELECT f2.destination_airport
+        FROM pilots_on_flights pf2
+        JOIN flight f2 ON f2.flight_number = pf2.flight_number
+        WHERE pf2.id_number = p.id_number
+          AND f2.status <> 'CANCELED'
+          AND f2.arrival_datetime <= ?
+        ORDER BY f2.arrival_datetime DESC
+        LIMIT 1
+      ) = ?
+    )
+    OR
+    (
+      -- 2b. If pilot has never flown, assume they are at TLV
+      ? = 'TLV'
+      AND NOT EXISTS (
+        SELECT 1
+        FROM pilots_on_flights pf0
+        JOIN flight f0 ON f0.flight_number = pf0.flight_number
+        WHERE pf0.id_number = p.id_number
+          AND f0.status <> 'CANCELED'
+          AND f0.departure_datetime IS NOT NULL
+      )
+    )
+  )
+
+ORDER BY p.id_number;
+"""
+
+_AVAILABLE_ATTENDANTS = """
+    SELECT fa.id_number, fa.first_name, fa.last_name, fa.long_flight_certification
+FROM flight_attendant fa
+WHERE {long_filter}
+
+  -- 1. Exclude flight attendants who are flying during the requested window
+  fa.id_number NOT IN (
+    SELECT ff.id_number
+    FROM flight_attendants_on_flights ff
+    JOIN flight f ON f.flight_number = ff.flight_number
+    WHERE f.status = 'ACTIVE'
+      AND (
+        f.departure_datetime < ?
+        AND f.arrival_datetime > ?
+      )
+  )
+
+  -- 2. Ensure flight attendant is at the correct airport
+  AND (
+    (
+      -- Logic: Find destination of their last completed flight
+      (
+        SELECT f2.destination_airport
+        FROM flight_attendants_on_flights ff2
+        JOIN flight f2 ON f2.flight_number = ff2.flight_number
+        WHERE ff2.id_number = fa.id_number
+          AND f2.status <> 'CANCELED'
+          AND f2.arrival_datetime <= ?
+        ORDER BY f2.arrival_datetime DESC
+        LIMIT 1
+      ) = ?
+    )
+    OR
+    (
+      -- Logic: If they have never flown, assume they are at 'TLV'
+      ? = 'TLV'
+      AND NOT EXISTS (
+        SELECT 1
+        FROM flight_attendants_on_flights ff0
+        JOIN flight f0 ON f0.flight_number = ff0.flight_number
+        WHERE ff0.id_number = fa.id_number
+          AND f0.status <> 'CANCELED'
+          AND f0.departure_datetime IS NOT NULL
+      )
+    )
+  )
+
+ORDER BY fa.id_number;
+"""
+
+QUERIES["available_aircraft_any"] = _AVAILABLE_AIRCRAFT.format(long_filter="")
+QUERIES["available_aircraft_long"] = _AVAILABLE_AIRCRAFT.format(long_filter="a.size = 'LARGE' AND")
+QUERIES["available_pilots_any"] = _AVAILABLE_PILOTS.format(long_filter="")
+QUERIES["available_pilots_long"] = _AVAILABLE_PILOTS.format(long_filter="p.long_flight_certification = 1 AND")
+QUERIES["available_attendants_any"] = _AVAILABLE_ATTENDANTS.format(long_filter="")
+QUERIES["available_attendants_long"] = _AVAILABLE_ATTENDANTS.format(long_filter="fa.long_flight_certification = 1 AND")
+
+# create flight (utils.py)
+QUERIES["flight_number_exists"] = "SELECT 1 FROM flight WHERE flight_number=? LIMIT 1;"
+
+QUERIES["route_duration"] = """
+            SELECT flight_duration
+            FROM flight_route
+            WHERE origin_airport = ? AND destination_airport = ?;
+"""
+
+QUERIES["insert_flight"] = """
+            INSERT INTO flight
+              (flight_number, aircraft_id_number, origin_airport, destination_airport, departure_datetime, arrival_datetime, status)
+            VALUES (?, ?, ?, ?, ?, ?, 'ACTIVE')
+"""
+
+QUERIES["insert_pilot_on_flight"] = """
+                INSERT INTO pilots_on_flights (id_number, flight_number)
+                VALUES (?, ?)
+"""
+
+QUERIES["insert_attendant_on_flight"] = """
+                INSERT INTO flight_attendants_on_flights (id_number, flight_number)
+                VALUES (?, ?)
+"""
+
+QUERIES["aircraft_seats"] = """
+            SELECT aircraft_id_number, class_type, `row_number`, column_number
+            FROM seat
+            WHERE aircraft_id_number = ?
+            ORDER BY class_type, `row_number`, column_number;
+"""
+
+QUERIES["insert_seats_in_flight"] = """
+            INSERT INTO seats_in_flights
+              (aircraft_id_number, class_type, `row_number`, column_number, flight_number, price)
+            VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# id allocation (utils.py): ID space name -> (table, column) that holds the ids already in use
+ID_SPACES = {
+    "reservation_code": ("reservations", "reservation_code"),
+    "flight_number": ("flight", "flight_number"),
+    "aircraft_id_number": ("aircraft", "aircraft_id_number"),
+}
+
+QUERIES["id_sequence_next"] = """
+            UPDATE id_sequence
+            SET next_value = next_value + 1
+            WHERE name = ?
+            RETURNING next_value - 1 AS value, min_value, max_value;
+"""
+
+# the table name cannot be a parameter, every ID space gets its own fixed pair of statements
+for _space, (_table, _column) in ID_SPACES.items():
+    QUERIES[f"id_taken_{_space}"] = f"SELECT 1 FROM {_table} WHERE {_column} = ? LIMIT 1;"
+    QUERIES[f"first_free_id_{_space}"] = f"""
+        SELECT candidate FROM (
+            SELECT ? AS candidate
+            UNION ALL
+            SELECT t.{_column} + 1 FROM {_table} t WHERE t.{_column} BETWEEN ? AND ?
+        )
+        WHERE candidate BETWEEN ? AND ?
+          AND NOT EXISTS (SELECT 1 FROM {_table} x WHERE x.{_column} = candidate)
+        ORDER BY candidate
+        LIMIT 1;
+"""
+
+# login and signup (utils.py)
+QUERIES["customer_login"] = """
+    SELECT rc.email, c.first_name, c.last_name
+    FROM registered_customer rc
+    JOIN customer c ON rc.email = c.email
+    WHERE rc.email = ? AND rc.password = ?;
+"""
+
+QUERIES["manager_login"] = """
+        SELECT id_number, first_name, last_name
+        FROM manager
+        WHERE id_number = ? AND password = ?
+        LIMIT 1;
+"""
+
+QUERIES["passport_exists"] = "SELECT email FROM registered_customer WHERE passport_number = ?"
+
+QUERIES["insert_customer"] = "INSERT INTO customer (email, first_name, last_name) VALUES (?, ?, ?)"
+
+QUERIES["update_customer_name"] = "UPDATE customer SET first_name=?, last_name=? WHERE email=?"
+
+QUERIES["insert_registered_customer"] = """INSERT INTO registered_customer 
+                   (email, password, passport_number, date_of_birth, registration_date) 
+                   VALUES (?, ?, ?, ?, ?)"""
+
+QUERIES["insert_customer_phone"] = "INSERT INTO customer_phone_number (email, phone_number) VALUES (?, ?)"
+
+QUERIES["delete_customer_phones"] = "DELETE FROM customer_phone_number WHERE email=?"
+
+# seat pages and booking (utils.py)
+QUERIES["flight_with_aircraft"] = """
+    SELECT f.flight_number, f.departure_datetime, f.origin_airport, f.destination_airport,
+           f.aircraft_id_number, f.status
+    FROM flight f
+    WHERE f.flight_number = ?;
+"""
+
+QUERIES["flight_aircraft"] = "SELECT aircraft_id_number FROM flight WHERE flight_number=?"
+
+QUERIES["seats_left_many"] = """
+    SELECT flight_number, class_type, total_seats - taken_seats AS seats_left
+    FROM flight_inventory
+    WHERE flight_number IN (SELECT value FROM json_each(?))
+    ORDER BY flight_number, class_type;
+"""
+
+QUERIES["seat_page_seats"] = """
+    SELECT
+        sf.aircraft_id_number,
+        sf.class_type,
+        sf.`row_number`,
+        sf.column_number,
+        sf.price,
+        EXISTS (
+            SELECT 1
+            FROM seats_in_reservation sir
+            WHERE sir.flight_number = sf.flight_number
+              AND sir.class_type = sf.class_type
+              AND sir.`row_number` = sf.`row_number`
+              AND sir.column_number = sf.column_number
+              AND sir.active = 1
+        ) AS taken,
+        EXISTS (
+            SELECT 1
+            FROM seat_holds h
+            WHERE h.flight_number = sf.flight_number
+              AND h.class_type = sf.class_type
+              AND h.`row_number` = sf.`row_number`
+              AND h.column_number = sf.column_number
+              AND h.expires_at > datetime('now')
+        ) AS held
+    FROM seats_in_flights sf
+    WHERE sf.flight_number = ?
+    ORDER BY sf.class_type, sf.`row_number`, sf.column_number;
+"""
+
+# the selected seats are one json parameter [[class_type, row_number, column_number], ...] instead of a (?, ?, ?) list per seat,
+# so any number of seats runs the same statement and each row still probes the (flight_number, class_type, ...) index
+_SELECTED_SEATS = "(SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]') FROM json_each(?))"
+
+QUERIES["seat_prices"] = f"""
+    SELECT `class_type`, `row_number`, `column_number`, `price`
+    FROM `seats_in_flights`
+    WHERE `flight_number` = ?
+      AND `aircraft_id_number` = ?
+      AND (`class_type`, `row_number`, `column_number`) IN {_SELECTED_SEATS};
+"""
+
+QUERIES["taken_seats"] = f"""
+    SELECT class_type, `row_number`, column_number
+    FROM seats_in_reservation
+    WHERE flight_number = ?
+      AND (class_type, `row_number`, column_number) IN {_SELECTED_SEATS}
+      AND active = 1
+      AND reservation_code IS NOT ?;
+"""
+
+QUERIES["held_seats_other"] = f"""
+    SELECT class_type, `row_number`, column_number
+    FROM seat_holds
+    WHERE flight_number = ?
+      AND (class_type, `row_number`, column_number) IN {_SELECTED_SEATS}
+      AND expires_at > datetime('now')
+      AND hold_token IS NOT ?;
+"""
+
+QUERIES["own_held_seats"] = """
+    SELECT h.class_type, h.`row_number`, h.column_number
+    FROM seat_holds h
+    WHERE h.flight_number = ?
+      AND h.hold_token = ?
+      AND h.expires_at > datetime('now')
+      AND NOT EXISTS (
+          SELECT 1
+          FROM seats_in_reservation sir
+          WHERE sir.flight_number = h.flight_number
+            AND sir.class_type = h.class_type
+            AND sir.`row_number` = h.`row_number`
+            AND sir.column_number = h.column_number
+            AND sir.active = 1
+      )
+    ORDER BY h.class_type, h.`row_number`, h.column_number;
+"""
+
+QUERIES["hold_flights"] = "SELECT DISTINCT flight_number FROM seat_holds WHERE hold_token = ?;"
+
+QUERIES["delete_holds"] = "DELETE FROM seat_holds WHERE hold_token = ?;"
+
+QUERIES["upsert_seat_hold"] = """
+                INSERT INTO seat_holds
+                (flight_number, aircraft_id_number, class_type, `row_number`, column_number, hold_token, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, datetime('now', ?))
+                ON CONFLICT (flight_number, class_type, `row_number`, column_number) DO UPDATE SET
+                    aircraft_id_number = excluded.aircraft_id_number,
+                    hold_token = excluded.hold_token,
+                    expires_at = excluded.expires_at
+                WHERE seat_holds.expires_at <= datetime('now');
+"""
+
+QUERIES["hold_expires_at"] = "SELECT MAX(expires_at) AS expires_at FROM seat_holds WHERE hold_token = ?;"
+
+QUERIES["expired_hold_flights"] = "SELECT DISTINCT flight_number FROM seat_holds WHERE expires_at <= datetime('now');"
+
+QUERIES["delete_expired_holds"] = "DELETE FROM seat_holds WHERE expires_at <= datetime('now');"
+
+QUERIES["insert_reservation"] = """
+            INSERT INTO reservations
+            (reservation_code, reservations_status, reservation_date, total_payment, email, flight_number)
+            VALUES (?, 'ACTIVE', DATE('now'), ?, ?, ?);
+"""
+
+QUERIES["insert_reservation_seat"] = """
+                INSERT INTO seats_in_reservation
+                (reservation_code, aircraft_id_number, class_type, `row_number`, column_number, flight_number, active)
+                VALUES (?, ?, ?, ?, ?, ?, 1)
+"""
+
+# fleet and crew (utils.py)
+QUERIES["aircraft_exists"] = "SELECT 1 FROM aircraft WHERE aircraft_id_number = ? LIMIT 1;"
+
+QUERIES["insert_aircraft"] = """
+    INSERT INTO `aircraft` (`aircraft_id_number`, `size`, `manufacturer`, `purchase_date`)
+    VALUES (?, ?, ?, ?);
+"""
+
+QUERIES["insert_class"] = """
+    INSERT INTO `class` (`aircraft_id_number`, `type`, `number_of_rows`, `number_of_columns`)
+    VALUES (?, ?, ?, ?);
+"""
+
+QUERIES["insert_seat"] = """
+    INSERT INTO `seat` (`aircraft_id_number`, `class_type`, `row_number`, `column_number`)
+    VALUES (?, ?, ?, ?);
+"""
+
+QUERIES["crew_id_taken"] = """
+    SELECT 1 FROM pilot WHERE id_number = ?
+    UNION
+    SELECT 1 FROM flight_attendant WHERE id_number = ?
+    UNION
+    SELECT 1 FROM manager WHERE id_number = ?
+    LIMIT 1;
+"""
+
+QUERIES["insert_pilot"] = """
+    INSERT INTO pilot
+      (id_number, first_name, last_name, city, street, house_number, phone_number, employment_start_date, long_flight_certification)
+    VALUES
+      (?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+QUERIES["insert_attendant"] = """
+    INSERT INTO flight_attendant
+      (id_number, first_name, last_name, city, street, house_number, phone_number, employment_start_date, long_flight_certification)
+    VALUES
+      (?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _db_conn(): #utils reads its statements from here, so its connection pool is looked up when a statement first runs
+    from utils import db_conn
+    return db_conn()
+
+
+def _timed(name: str, run): #Run one registered statement and add its time to the counters
+    started = time.perf_counter()
+    try:
+        return run(QUERIES[name])
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _stats_lock:
+            st = _stats.setdefault(name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+            st["calls"] += 1
+            st["total_ms"] += elapsed_ms
+            st["max_ms"] = max(st["max_ms"], elapsed_ms)
+
+
+def query_all(name: str, params=(), cur=None) -> list: #Run a registered SELECT and return all rows
+    if cur is None:
+        with _db_conn() as cur:
+            return query_all(name, params, cur)
+
+    def run(sql):
+        cur.execute(sql, params)
+        return cur.fetchall()
+    return _timed(name, run)
+
+
+def query_one(name: str, params=(), cur=None): #Run a registered SELECT and return the first row or None
+    if cur is None:
+        with _db_conn() as cur:
+            return query_one(name, params, cur)
+
+    def run(sql):
+        cur.execute(sql, params)
+        row = cur.fetchone()
+        cur.fetchall()
+        return row
+    return _timed(name, run)
+
+
+def execute(name: str, params, cur) -> int: #Run a registered write statement on the caller's transaction cursor and return rowcount
+    def run(sql):
+        cur.execute(sql, params)
+        return cur.rowcount
+    return _timed(name, run)
+
+
+def execute_many(name: str, rows, cur) -> int: #Run a registered write statement once per parameter row on the caller's transaction cursor
+    def run(sql):
+        cur.executemany(sql, rows)
+        return cur.rowcount
+    return _timed(name, run)
+
+
+def get_query_stats() -> dict: #Return calls, total and max time for every registered statement that ran
+    with _stats_lock:
+        return {
+            name: {
+                "calls": st["calls"],
+                "total_ms": round(st["total_ms"], 2),
+                "avg_ms": round(st["total_ms"] / st["calls"], 3),
+                "max_ms": round(st["max_ms"], 2)
+            }
+            for name, st in sorted(_stats.items())
+        }
+
+
+def benchmark(name: str, params=(), runs: int = 50) -> dict: #Run one statement many times in isolation and return its timings
+    timings = []
+    with _db_conn() as cur:
+        for _ in range(runs):
+            started = time.perf_counter()
+            cur.execute(QUERIES[name], params)
+            rows = cur.fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "name": name,
+        "runs": runs,
+        "rows": len(rows),
+        "min_ms": round(timings[0], 3),
+        "median_ms": round(timings[len(timings) // 2], 3),
+        "max_ms": round(timings[-1], 3)
+    }
+
+
+if __name__ == "__main__":
+    # python utils_queries.py list
+    # python utils_queries.py bench <name> '<params as json list or object>' [runs]
+    if len(sys.argv) < 2 or sys.argv[1] not in ("list", "bench"):
+        print("usage: python utils_queries.py list | bench <name> [params_json] [runs]")
+        sys.exit(1)
+    if sys.argv[1] == "list":
+        for query_name in sorted(QUERIES):
+            print(query_name)
+    else:
+        bench_params = json.loads(sys.argv[3]) if len(sys.argv) > 3 else ()
+        bench_runs = int(sys.argv[4]) if len(sys.argv) > 4 else 50
+        print(benchmark(sys.argv[2], bench_params, bench_runs))
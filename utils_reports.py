@@ -4,19 +4,19 @@ import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
-from utils import db_conn
+from utils import snapshot_conn
+from utils_queries import query_all
 
 REPORTS_DIR = os.path.join(os.path.dirname(__file__), "static", "reports")
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
 
-def _query_df(sql: str, params=None) -> pd.DataFrame: #Run a SQL query and return the results as a pandas DataFrame
+def _query_df(query_name: str, params=None) -> pd.DataFrame: #Run a registered query on the report snapshot and return the results as a pandas DataFrame
     if params is None:
         params = []
 
-    with db_conn() as cur:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
+    with snapshot_conn() as cur:
+        rows = query_all(query_name, params, cur=cur)
         if not rows:
             return pd.DataFrame()
         columns = [description[0] for description in cur.description]
@@ -32,22 +32,7 @@ def _save_plot(fig, filename: str) -> str: #Save a matplotlib figure as an image
 
 
 def report_avg_occupancy(): #Calculate average seat occupancy for past flights and return a summary table
-    sql = """
-    SELECT AVG(100.0 * (CASE WHEN booked.booked_seats IS NULL THEN 0 ELSE booked.booked_seats END) / ac_seat.total_seats) AS avg_occupancy_percent
-    FROM
-      (SELECT flight_number, aircraft_id_number
-        FROM flight
-        WHERE departure_datetime < datetime('now')  AND status = 'ACTIVE') AS past_flights
-        JOIN (SELECT aircraft_id_number, COUNT(*) AS total_seats
-              FROM seat
-              GROUP BY aircraft_id_number) AS ac_seat ON ac_seat.aircraft_id_number = past_flights.aircraft_id_number
-              LEFT JOIN (SELECT r.flight_number, COUNT(*) AS booked_seats
-                         FROM reservations AS r
-                         JOIN seats_in_reservation as sir ON sir.reservation_code = r.reservation_code
-                         WHERE r.reservations_status = 'ACTIVE'
-                         GROUP BY r.flight_number) AS booked ON booked.flight_number = past_flights.flight_number;
-    """
-    df = _query_df(sql)
+    df = _query_df("report_avg_occupancy")
     try:
         val = float(df.iloc[0])
     except:
@@ -65,24 +50,7 @@ def report_avg_occupancy(): #Calculate average seat occupancy for past flights a
 
 #Calculate total revenue by aircraft size manufacturer and class and return a bar chart and table
 def report_revenue_by_combo():
-    sql = """
-SELECT combos.aircraft_size,combos.aircraft_manufacturer, combos.class_type,
-  SUM(CASE WHEN sif.price IS NULL THEN 0 ELSE sif.price END) AS total_revenue
-FROM (SELECT DISTINCT a.size AS aircraft_size, a.manufacturer AS aircraft_manufacturer, c.type AS class_type, f.flight_number
-    FROM flight AS f
-    JOIN aircraft AS a ON f.aircraft_id_number = a.aircraft_id_number
-    JOIN class AS c ON c.aircraft_id_number = a.aircraft_id_number) AS combos
-LEFT JOIN reservations AS r ON r.flight_number = combos.flight_number
-LEFT JOIN seats_in_reservation AS sir ON sir.reservation_code = r.reservation_code
-LEFT JOIN seats_in_flights AS sif ON sif.flight_number = combos.flight_number
- AND sif.aircraft_id_number = sir.aircraft_id_number
- AND sif.class_type = sir.class_type
- AND sif.row_number = sir.row_number
- AND sif.column_number = sir.column_number
-GROUP BY combos.aircraft_size, combos.aircraft_manufacturer, combos.class_type
-ORDER BY combos.aircraft_size, combos.aircraft_manufacturer, combos.class_type;
-    """
-    df = _query_df(sql)
+    df = _query_df("report_revenue_by_combo")
     if df.empty:
         fig = plt.figure()
         plt.title("Revenue by Combo (no data)")
@@ -103,37 +71,7 @@ ORDER BY combos.aircraft_size, combos.aircraft_manufacturer, combos.class_type;
 
 
 def report_staff_hours(): #Calculate staff flight hours and return a chart for top 10
-    sql = """
-    SELECT staff_id, first_name, last_name,
-        SUM(CASE WHEN flight_duration < 360 THEN flight_duration ELSE 0 END) / 60.0 AS short_hours,
-        SUM(CASE WHEN flight_duration >= 360 THEN flight_duration ELSE 0 END) / 60.0 AS long_hours,
-        SUM(flight_duration) / 60.0 AS total_hours
-    FROM (
-        SELECT p.id_number AS staff_id, p.first_name, p.last_name, fr.flight_duration
-        FROM pilot AS p
-        JOIN pilots_on_flights AS pof ON p.id_number = pof.id_number
-        JOIN flight AS f ON pof.flight_number = f.flight_number
-        JOIN flight_route AS fr 
-          ON f.origin_airport = fr.origin_airport 
-         AND f.destination_airport = fr.destination_airport
-        WHERE f.status = 'ACTIVE' AND f.departure_datetime < datetime('now')
-
-        UNION ALL
-
-        SELECT fa.id_number AS staff_id, fa.first_name, fa.last_name, fr.flight_duration
-        FROM flight_attendant AS fa
-        JOIN flight_attendants_on_flights AS faof ON fa.id_number = faof.id_number
-        JOIN flight AS f ON faof.flight_number = f.flight_number
-        JOIN flight_route AS fr 
-          ON f.origin_airport = fr.origin_airport 
-         AND f.destination_airport = fr.destination_airport
-        WHERE f.status = 'ACTIVE' AND f.departure_datetime < datetime('now')
-    ) AS all_staff
-    GROUP BY staff_id, first_name, last_name
-    ORDER BY total_hours DESC;
-    """
-
-    df = _query_df(sql)
+    df = _query_df("report_staff_hours")
     if df.empty:
         fig = plt.figure()
         plt.title("No staff flight data")
@@ -180,16 +118,7 @@ def report_staff_hours(): #Calculate staff flight hours and return a chart for t
 
 
 def report_cancellation_rate(): #Calculate monthly customer cancellation rate and return a bar chart and table
-    sql = """
-    SELECT 
-    CAST(strftime('%Y', r.reservation_date) AS INTEGER) AS order_year, 
-    CAST(strftime('%m', r.reservation_date) AS INTEGER) AS order_month,
-    (SUM(CASE WHEN r.reservations_status = 'CUSTOMER_CANCELED' THEN 1 ELSE 0 END) * 100.0 / COUNT(reservation_code)) AS cancellation_rate
-    FROM reservations AS r
-    GROUP BY order_year, order_month
-    ORDER BY order_year ASC, order_month ASC;
-    """
-    df = _query_df(sql)
+    df = _query_df("report_cancellation_rate")
     if df.empty:
         fig = plt.figure()
         plt.title("Cancellation Rate (no data)")
@@ -214,83 +143,7 @@ def report_cancellation_rate(): #Calculate monthly customer cancellation rate an
 
 
 def report_aircraft_monthly_summary(): #Create a monthly summary per aircraft and return a utilization chart and table
-    sql = """
-    SELECT 
-    f.aircraft_id_number, 
-    f.activity_year, 
-    f.activity_month,
-    
-    -- 1. Active Flights Count
-    (SELECT COUNT(*)
-     FROM flight AS f1
-     WHERE f1.aircraft_id_number = f.aircraft_id_number
-     AND f1.status = 'ACTIVE'
-     AND CAST(strftime('%Y', f1.departure_datetime) AS INTEGER) = f.activity_year
-     AND CAST(strftime('%m', f1.departure_datetime) AS INTEGER) = f.activity_month) AS active_flights,
-
-    -- 2. Canceled Flights Count
-    (SELECT COUNT(*)
-     FROM flight AS f2
-     WHERE f2.aircraft_id_number = f.aircraft_id_number
-     AND f2.status = 'CANCELED'
-     AND CAST(strftime('%Y', f2.departure_datetime) AS INTEGER) = f.activity_year
-     AND CAST(strftime('%m', f2.departure_datetime) AS INTEGER) = f.activity_month) AS canceled_flights,
-
-    -- 3. Utilization (Rounded to 2 decimals)
-    ROUND(
-        (SELECT COUNT(DISTINCT date(f3.departure_datetime))
-         FROM flight AS f3
-         WHERE f3.aircraft_id_number = f.aircraft_id_number
-         AND f3.status = 'ACTIVE'
-         AND CAST(strftime('%Y', f3.departure_datetime) AS INTEGER) = f.activity_year
-         AND CAST(strftime('%m', f3.departure_datetime) AS INTEGER) = f.activity_month
-        ) / 30.0 * 100
-    , 2) AS utilization,
-
-    f_routes.origin_airport,
-    f_routes.destination_airport
-
-FROM (
-    -- Main Subquery: Get unique Aircraft-Year-Month combos
-    SELECT DISTINCT 
-        aircraft_id_number, 
-        CAST(strftime('%Y', departure_datetime) AS INTEGER) AS activity_year, 
-        CAST(strftime('%m', departure_datetime) AS INTEGER) AS activity_month
-    FROM flight
-) AS f
-
-LEFT JOIN (
-    -- Route Stats Subquery
-    SELECT 
-        aircraft_id_number, 
-        CAST(strftime('%Y', departure_datetime) AS INTEGER) AS r_year, 
-        CAST(strftime('%m', departure_datetime) AS INTEGER) AS r_month,
-        origin_airport, 
-        destination_airport, 
-        COUNT(*) AS route_count
-    FROM flight
-    WHERE status = 'ACTIVE'
-    GROUP BY aircraft_id_number, r_year, r_month, origin_airport, destination_airport
-) AS f_routes 
-  ON f.aircraft_id_number = f_routes.aircraft_id_number
-  AND f.activity_year = f_routes.r_year
-  AND f.activity_month = f_routes.r_month
-  AND f_routes.route_count = (
-      -- Max Count Subquery
-      SELECT COUNT(*) AS max_cnt
-      FROM flight AS f_max
-      WHERE f_max.aircraft_id_number = f_routes.aircraft_id_number
-      AND f_max.status = 'ACTIVE'
-      AND CAST(strftime('%Y', f_max.departure_datetime) AS INTEGER) = f_routes.r_year
-      AND CAST(strftime('%m', f_max.departure_datetime) AS INTEGER) = f_routes.r_month
-      GROUP BY f_max.origin_airport, f_max.destination_airport
-      ORDER BY max_cnt DESC
-      LIMIT 1
-  )
-
-ORDER BY f.aircraft_id_number ASC, f.activity_year ASC, f.activity_month ASC;
-    """
-    df = _query_df(sql)
+    df = _query_df("report_aircraft_monthly_summary")
     if df.empty:
         fig = plt.figure()
         plt.title("Aircraft Monthly Summary (no data)")
@@ -0,0 +1,613 @@
+import json
+import base64
+import sqlite3
+import bisect
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+
+from utils import subscribe
+from utils_queries import query_all, query_one
+
+# The index is also rebuilt from the database after this many seconds, for writes that did not go through
+# this process (another worker, manual SQL).
+SEARCH_INDEX_MAX_AGE = 300
+
+
+def _utc_now_str() -> str: #Current UTC time in the stored datetime format, same clock as sqlite's datetime('now')
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _sort_key(row: dict):
+    return str(row["departure_datetime"]), row["flight_number"]
+
+
+def _add_to_bucket(buckets: dict, key, flight_number: int):
+    buckets.setdefault(key, set()).add(flight_number)
+
+
+def _remove_from_bucket(buckets: dict, key, flight_number: int):
+    bucket = buckets.get(key)
+    if bucket is not None:
+        bucket.discard(flight_number)
+        if not bucket:
+            del buckets[key]
+
+
+class FlightSearchIndex: #Upcoming ACTIVE flights kept in memory, bucketed by departure date and airports
+    def __init__(self, max_age: float = SEARCH_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._by_date = {}
+        self._by_origin = {}
+        self._by_destination = {}
+        self._built_at = None
+        self._stats = {"builds": 0, "updates": 0, "searches": 0}
+
+    def _add(self, row: dict):
+        fn = row["flight_number"]
+        self._flights[fn] = row
+        _add_to_bucket(self._by_date, str(row["departure_datetime"])[:10], fn)
+        _add_to_bucket(self._by_origin, row["origin_airport"], fn)
+        _add_to_bucket(self._by_destination, row["destination_airport"], fn)
+
+    def _remove(self, flight_number: int):
+        row = self._flights.pop(flight_number, None)
+        if row is None:
+            return
+        _remove_from_bucket(self._by_date, str(row["departure_datetime"])[:10], flight_number)
+        _remove_from_bucket(self._by_origin, row["origin_airport"], flight_number)
+        _remove_from_bucket(self._by_destination, row["destination_airport"], flight_number)
+
+    def rebuild(self): #Load every upcoming ACTIVE flight from the database and replace the index
+        rows = query_all("search_index_upcoming_flights")
+        with self._lock:
+            self._flights = {}
+            self._by_date = {}
+            self._by_origin = {}
+            self._by_destination = {}
+            for r in rows:
+                self._add(dict(r))
+            self._built_at = time.time()
+            self._stats["builds"] += 1
+
+    def refresh_flight(self, flight_number: int): #Re-read one flight after a write and add, replace or drop it
+        if self._built_at is None:
+            return
+        row = query_one("search_index_flight", (flight_number,))
+        with self._lock:
+            self._remove(flight_number)
+            if row and row["status"] == "ACTIVE":
+                row = dict(row)
+                del row["status"]
+                self._add(row)
+            self._stats["updates"] += 1
+
+    def _ensure_fresh(self):
+        if self._built_at is None or time.time() - self._built_at > self.max_age:
+            self.rebuild()
+
+    @staticmethod
+    def _airports_match(buckets: dict, airports) -> set: #Flights from/to any of the given airports
+        found = set()
+        for code in airports:
+            found |= buckets.get(code, set())
+        return found
+
+    def search(self, departure_date: str | None = None, origin_airports=None, destination_airports=None, from_today: bool = False) -> list[dict]: #Return matching upcoming flights ordered by departure time, None means no filter
+        self._ensure_fresh()
+        with self._lock:
+            self._stats["searches"] += 1
+            candidates = None
+            for found in (
+                self._by_date.get(departure_date, set()) if departure_date else None,
+                self._airports_match(self._by_origin, origin_airports) if origin_airports is not None else None,
+                self._airports_match(self._by_destination, destination_airports) if destination_airports is not None else None,
+            ):
+                if found is not None:
+                    candidates = set(found) if candidates is None else candidates & found
+            rows = list(self._flights.values()) if candidates is None else [self._flights[fn] for fn in candidates]
+
+        # results shows today's flights too (>= CURRENT_DATE), the country searches only flights that did not leave yet
+        now = _utc_now_str()
+        cutoff = now[:10] if from_today else now
+        rows = [r for r in rows if str(r["departure_datetime"]) >= cutoff]
+        rows.sort(key=_sort_key)
+        return rows
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(
+                self._stats,
+                flights=len(self._flights),
+                age_seconds=None if self._built_at is None else round(time.time() - self._built_at, 1)
+            )
+
+
+def encode_cursor(row: dict) -> str: #Opaque keyset cursor pointing at the last row of a page
+    raw = f"{row['departure_datetime']}|{row['flight_number']}"
+    return base64.urlsafe_b64encode(raw.encode("utf8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str): #Return (departure_datetime, flight_number) of a cursor, ValueError if it is not one of ours
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf8")
+    departure, flight_number = raw.rsplit("|", 1)
+    return departure, int(flight_number)
+
+
+def keyset_page(rows: list, after: str | None, limit: int): #Return (page, next cursor) of search results, continuing after the given cursor
+    start = bisect.bisect_right(rows, decode_cursor(after), key=_sort_key) if after else 0
+    page = rows[start:start + limit]
+    next_cursor = encode_cursor(page[-1]) if start + limit < len(rows) else None
+    return page, next_cursor
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").casefold().split())
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AirportResolver: #Turn what the user typed (country or airport code) into a set of airport codes
+    def __init__(self, max_age: float = SEARCH_INDEX_MAX_AGE, min_similarity: float = 0.25, max_suggestions: int = 3):
+        self.max_age = max_age
+        self.min_similarity = min_similarity
+        self.max_suggestions = max_suggestions
+        self._lock = threading.Lock()
+        self._codes = {}
+        self._countries = {}
+        self._country_names = {}
+        self._trigram_index = {}
+        self._loaded_at = None
+
+    def load(self): #Read the airport table into normalized lookups
+        codes, countries, names, trigram_index = {}, {}, {}, {}
+        for r in query_all("airports_all"):
+            codes[_normalize(r["airport_name"])] = r["airport_name"]
+            key = _normalize(r["country"])
+            if key:
+                countries.setdefault(key, set()).add(r["airport_name"])
+                names[key] = r["country"]
+        for key in countries:
+            for gram in _trigrams(key):
+                trigram_index.setdefault(gram, set()).add(key)
+        with self._lock:
+            self._codes, self._countries, self._country_names, self._trigram_index = codes, countries, names, trigram_index
+            self._loaded_at = time.time()
+
+    def invalidate(self, **_): #Forget the lookups so the next resolve reads the airport table again
+        self._loaded_at = None
+
+    def ensure_loaded(self): #Load the lookups if they were never loaded or are older than max_age
+        if self._loaded_at is None or time.time() - self._loaded_at > self.max_age:
+            self.load()
+
+    def _similar(self, text: str) -> list[str]: #Countries that share enough trigrams with text, most similar first
+        grams = _trigrams(text)
+        candidates = set()
+        for gram in grams:
+            candidates |= self._trigram_index.get(gram, set())
+        scored = []
+        for key in candidates:
+            key_grams = _trigrams(key)
+            score = len(grams & key_grams) / len(grams | key_grams)
+            if score >= self.min_similarity:
+                scored.append((-score, key))
+        return [key for _, key in sorted(scored)[:self.max_suggestions]]
+
+    def resolve(self, text: str | None): #Return (airport codes, suggestions). Codes is None when nothing was typed
+        needle = _normalize(text)
+        if not needle:
+            return None, []
+        self.ensure_loaded()
+        with self._lock:
+            if needle in self._codes:
+                return {self._codes[needle]}, []
+            if needle in self._countries:
+                return set(self._countries[needle]), []
+
+            matches = [key for key in self._countries if key.startswith(needle)]
+            if not matches:
+                matches = [key for key in self._countries if needle in key]
+            if matches:
+                airports = set()
+                for key in matches:
+                    airports |= self._countries[key]
+                suggestions = [self._country_names[key] for key in sorted(matches)] if len(matches) > 1 else []
+                return airports, suggestions
+
+            # nothing contains the text (typo): no flights, but offer the closest countries
+            return set(), [self._country_names[key] for key in self._similar(needle)]
+
+
+_TOKEN_PUNCTUATION = str.maketrans("", "", "\"'׳״-.")
+
+
+def _tokens(name: str) -> set: #The whole name and each of its words, so both "ארצות הברית" and "הברית" match
+    text = _normalize(name).translate(_TOKEN_PUNCTUATION)
+    return {text, *text.split()} - {""}
+
+
+class _TrieNode:
+    __slots__ = ("children", "matches")
+
+    def __init__(self):
+        self.children = {}
+        self.matches = {"airport": [], "country": []}
+
+
+class PlaceTrie: #Prefix trie over airport codes, countries and their other names (place_name table) for keystroke autocomplete
+    def __init__(self, max_age: float = SEARCH_INDEX_MAX_AGE, max_matches: int = 20):
+        self.max_age = max_age
+        self.max_matches = max_matches
+        self._lock = threading.Lock()
+        self._root = _TrieNode()
+        self._built_at = None
+        self._stats = {"builds": 0, "lookups": 0}
+
+    def rebuild(self, **_): #Build a new trie from the airport and place_name tables and swap it in
+        other_names = {}
+        for r in query_all("place_names_all"):
+            other_names.setdefault(r["place"], []).append(r["name"])
+        entries = []
+        for r in query_all("airports_all"):
+            code, country = r["airport_name"], r["country"]
+            entries.append(("airport", code, country, [code, country, *other_names.get(code, []), *other_names.get(country, [])]))
+        for country in sorted({e[2] for e in entries if e[2]}):
+            entries.append(("country", country, country, [country, *other_names.get(country, [])]))
+        entries.sort(key=lambda e: (e[0], e[1]))
+
+        root = _TrieNode()
+        for kind, value, country, names in entries:
+            item = {"kind": kind, "value": value, "country": country, "hebrew": (other_names.get(value) or [None])[0]}
+            tokens = set()
+            for name in names:
+                if name:
+                    tokens |= _tokens(name)
+            reached = set()
+            for token in tokens:
+                node = root
+                for ch in token:
+                    node = node.children.setdefault(ch, _TrieNode())
+                    # a place reaches a node through several tokens ("ארצות הברית" and "ארה\"ב"), list it there once
+                    if id(node) not in reached:
+                        reached.add(id(node))
+                        # capped per kind, so the many airports under a country name cannot crowd out the countries
+                        matches = node.matches[kind]
+                        if len(matches) < self.max_matches:
+                            matches.append(item)
+        with self._lock:
+            self._root = root
+            self._built_at = time.time()
+            self._stats["builds"] += 1
+
+    def complete(self, prefix: str, kind: str | None = None, limit: int = 8) -> list[dict]: #Places with a name starting with prefix, airports and countries in name order
+        if self._built_at is None or time.time() - self._built_at > self.max_age:
+            self.rebuild()
+        with self._lock:
+            self._stats["lookups"] += 1
+            # a built trie is never changed, a rebuild swaps in a new root, so the walk needs no lock
+            node = self._root
+        text = _normalize(prefix).translate(_TOKEN_PUNCTUATION)
+        if not text:
+            return []
+        for ch in text:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        if kind is not None:
+            return node.matches[kind][:limit]
+        return (node.matches["airport"] + node.matches["country"])[:limit]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, age_seconds=None if self._built_at is None else round(time.time() - self._built_at, 1))
+
+
+class FareCalendar: #Lowest free ECONOMY/BUSINESS fare per day around a date, cached per route and window until the route's seats change
+    def __init__(self, max_age: float = SEARCH_INDEX_MAX_AGE, max_entries: int = 256):
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, origin_airports, destination_airports, center_date, days: int) -> list[dict]: #One entry per day of the window: {"date", "ECONOMY", "BUSINESS"} with None where nothing is free
+        key = (frozenset(origin_airports), frozenset(destination_airports), center_date, days)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and time.time() - cached[0] <= self.max_age:
+                self._stats["hits"] += 1
+                return cached[1]
+            self._stats["misses"] += 1
+
+        first_day = center_date - timedelta(days=days)
+        calendar = [{"date": (first_day + timedelta(days=i)).isoformat(), "ECONOMY": None, "BUSINESS": None} for i in range(2 * days + 1)]
+        if origin_airports and destination_airports:
+            rows = query_all("fare_calendar", {
+                "origin_airports": json.dumps(sorted(origin_airports)),
+                "destination_airports": json.dumps(sorted(destination_airports)),
+                "window_start": first_day.isoformat(),
+                "window_end": (center_date + timedelta(days=days + 1)).isoformat()
+            })
+            by_day = {d["date"]: d for d in calendar}
+            for r in rows:
+                day = by_day.get(r["day"])
+                if day is not None and (r["class_type"] or "").upper() in ("ECONOMY", "BUSINESS"):
+                    day[r["class_type"].upper()] = r["lowest_price"]
+
+        with self._lock:
+            if len(self._cache) >= self.max_entries:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = (time.time(), calendar)
+        return calendar
+
+    def invalidate_flight(self, flight_number: int): #Drop the cached windows of the route this flight flies
+        route = query_one("flight_route", (flight_number,))
+        if not route:
+            return
+        with self._lock:
+            for key in [k for k in self._cache if route["origin_airport"] in k[0] and route["destination_airport"] in k[1]]:
+                del self._cache[key]
+                self._stats["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, entries=len(self._cache))
+
+
+def _parse_dt(value) -> datetime:
+    return datetime.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S")
+
+
+class ConnectionGraph: #Time-expanded graph of upcoming ACTIVE flights: per airport its departures sorted by time, for itineraries with connections
+    def __init__(self, max_age: float = SEARCH_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._departures = {}
+        self._edges = {}
+        self._built_at = None
+        self._stats = {"builds": 0, "updates": 0, "searches": 0}
+
+    def _add(self, row):
+        if row["arrival_datetime"] is None:
+            return
+        leg = {
+            "flight_number": row["flight_number"],
+            "origin_airport": row["origin_airport"],
+            "destination_airport": row["destination_airport"],
+            "departure_datetime": str(row["departure_datetime"])[:19],
+            "arrival_datetime": str(row["arrival_datetime"])[:19],
+            "departure": _parse_dt(row["departure_datetime"]),
+            "arrival": _parse_dt(row["arrival_datetime"]),
+        }
+        self._flights[leg["flight_number"]] = leg
+        bisect.insort(self._departures.setdefault(leg["origin_airport"], []), (leg["departure"], leg["flight_number"]))
+        edge = (leg["origin_airport"], leg["destination_airport"])
+        self._edges[edge] = self._edges.get(edge, 0) + 1
+
+    def _remove(self, flight_number: int):
+        leg = self._flights.pop(flight_number, None)
+        if leg is None:
+            return
+        departures = self._departures[leg["origin_airport"]]
+        departures.pop(bisect.bisect_left(departures, (leg["departure"], flight_number)))
+        edge = (leg["origin_airport"], leg["destination_airport"])
+        self._edges[edge] -= 1
+        if not self._edges[edge]:
+            del self._edges[edge]
+
+    def rebuild(self): #Load every upcoming ACTIVE flight that has an arrival time
+        rows = query_all("connection_graph_flights")
+        with self._lock:
+            self._flights, self._departures, self._edges = {}, {}, {}
+            for r in rows:
+                self._add(r)
+            self._built_at = time.time()
+            self._stats["builds"] += 1
+
+    def refresh_flight(self, flight_number: int): #Re-read one flight after a write and add, replace or drop it
+        if self._built_at is None:
+            return
+        row = query_one("connection_graph_flight", (flight_number,))
+        with self._lock:
+            self._remove(flight_number)
+            if row and row["status"] == "ACTIVE":
+                self._add(row)
+            self._stats["updates"] += 1
+
+    def _hops_to(self, destination_airports) -> dict: #Fewest legs from every airport to the destinations (backwards BFS over airport pairs that have flights)
+        incoming = {}
+        for origin, destination in self._edges:
+            incoming.setdefault(destination, []).append(origin)
+        hops = {code: 0 for code in destination_airports}
+        frontier = list(hops)
+        while frontier:
+            next_frontier = []
+            for airport in frontier:
+                for origin in incoming.get(airport, []):
+                    if origin not in hops:
+                        hops[origin] = hops[airport] + 1
+                        next_frontier.append(origin)
+            frontier = next_frontier
+        return hops
+
+    def _extend(self, legs: list, destination_airports, hops: dict, max_legs: int, min_gap: timedelta, max_gap: timedelta, found: list):
+        last = legs[-1]
+        if last["destination_airport"] in destination_airports:
+            found.append(list(legs))
+            return
+        visited = {leg["origin_airport"] for leg in legs}
+        departures = self._departures.get(last["destination_airport"], [])
+        # only departures inside the connection window, found by bisecting the airport's sorted departures
+        i = bisect.bisect_left(departures, (last["arrival"] + min_gap, 0))
+        latest = last["arrival"] + max_gap
+        while i < len(departures) and departures[i][0] <= latest:
+            leg = self._flights[departures[i][1]]
+            i += 1
+            remaining = hops.get(leg["destination_airport"])
+            if remaining is None or leg["destination_airport"] in visited or len(legs) + 1 + remaining > max_legs:
+                continue
+            legs.append(leg)
+            self._extend(legs, destination_airports, hops, max_legs, min_gap, max_gap, found)
+            legs.pop()
+
+    def search(self, origin_airports, destination_airports, departure_date: str | None = None, max_legs: int = 3,
+               min_connection_minutes: int = 60, max_connection_minutes: int = 1440, limit: int = 20, min_legs: int = 1) -> list[dict]: #Itineraries of up to max_legs flights, earliest arrival first
+        if self._built_at is None or time.time() - self._built_at > self.max_age:
+            self.rebuild()
+        now = _parse_dt(_utc_now_str())
+        found = []
+        with self._lock:
+            self._stats["searches"] += 1
+            hops = self._hops_to(set(destination_airports))
+            for origin in origin_airports:
+                for departure, flight_number in self._departures.get(origin, []):
+                    leg = self._flights[flight_number]
+                    if departure < now or (departure_date and leg["departure_datetime"][:10] != departure_date):
+                        continue
+                    remaining = hops.get(leg["destination_airport"])
+                    if remaining is None or 1 + remaining > max_legs:
+                        continue
+                    self._extend([leg], set(destination_airports), hops, max_legs,
+                                 timedelta(minutes=min_connection_minutes), timedelta(minutes=max_connection_minutes), found)
+
+        itineraries = []
+        for legs in found:
+            if len(legs) < min_legs:
+                continue
+            itineraries.append({
+                "legs": [{k: v for k, v in leg.items() if k not in ("departure", "arrival")} for leg in legs],
+                "departure_datetime": legs[0]["departure_datetime"],
+                "arrival_datetime": legs[-1]["arrival_datetime"],
+                "total_minutes": int((legs[-1]["arrival"] - legs[0]["departure"]).total_seconds() // 60),
+                "connection_minutes": [int((b["departure"] - a["arrival"]).total_seconds() // 60) for a, b in zip(legs, legs[1:])],
+            })
+        itineraries.sort(key=lambda it: (it["arrival_datetime"], len(it["legs"]), it["departure_datetime"]))
+        return itineraries[:limit]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, flights=len(self._flights), airport_pairs=len(self._edges))
+
+
+class DepartureBoard: #Next departures per origin airport with occupancy, the first per_airport of each origin kept in memory
+    def __init__(self, per_airport: int = 50):
+        self.per_airport = per_airport
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._by_origin = {}
+        self._full = set()
+        self._built_at = None
+        self._stats = {"builds": 0, "updates": 0, "reads": 0, "fallbacks": 0}
+
+    def _row(self, r) -> dict:
+        total, taken = r["total_seats"], r["taken_seats"]
+        return {
+            "flight_number": r["flight_number"],
+            "origin_airport": r["origin_airport"],
+            "destination_airport": r["destination_airport"],
+            "destination_country": r["destination_country"],
+            "departure_datetime": str(r["departure_datetime"])[:19],
+            "arrival_datetime": None if r["arrival_datetime"] is None else str(r["arrival_datetime"])[:19],
+            "total_seats": total,
+            "taken_seats": taken,
+            "occupancy_percent": round(100 * taken / total) if total else 0,
+            "is_full": bool(total) and taken >= total,
+        }
+
+    def rebuild(self): #Load the next per_airport departures of every origin however far away they are, called every minute by the refresher
+        rows = [self._row(r) for r in query_all("departure_board_next", (self.per_airport,))]
+        flights, by_origin = {}, {}
+        for row in rows:
+            flights[row["flight_number"]] = row
+            by_origin.setdefault(row["origin_airport"], []).append(row)
+        for airport_rows in by_origin.values():
+            airport_rows.sort(key=_sort_key)
+        with self._lock:
+            self._flights, self._by_origin = flights, by_origin
+            # origins with more departures than the board keeps, a short read of those goes to the database
+            self._full = {airport for airport, airport_rows in by_origin.items() if len(airport_rows) >= self.per_airport}
+            self._built_at = time.time()
+            self._stats["builds"] += 1
+
+    def refresh_flight(self, flight_number: int): #Re-read one flight after a create, cancel or booking and update its line
+        if self._built_at is None:
+            return
+        r = query_one("departure_board_flight", (flight_number,))
+        with self._lock:
+            old = self._flights.pop(flight_number, None)
+            if old is not None:
+                self._by_origin[old["origin_airport"]].remove(old)
+            if r and r["status"] == "ACTIVE" and _utc_now_str() <= str(r["departure_datetime"]):
+                row = self._row(r)
+                airport_rows = self._by_origin.setdefault(row["origin_airport"], [])
+                # a full origin only takes flights that leave before its last kept one, the rest are past the board
+                if row["origin_airport"] not in self._full or (airport_rows and _sort_key(row) < _sort_key(airport_rows[-1])):
+                    self._flights[flight_number] = row
+                    airport_rows.append(row)
+                    airport_rows.sort(key=_sort_key)
+                    if len(airport_rows) > self.per_airport:
+                        del self._flights[airport_rows.pop()["flight_number"]]
+                    if len(airport_rows) >= self.per_airport:
+                        self._full.add(row["origin_airport"])
+            self._stats["updates"] += 1
+
+    def get(self, airport: str, limit: int = 20) -> list[dict]: #The next departures from airport that have not left yet
+        if self._built_at is None:
+            self.rebuild()
+        now = _utc_now_str()
+        with self._lock:
+            self._stats["reads"] += 1
+            rows = self._by_origin.get(airport, [])
+            # rows that left since the last refresh are skipped, the next rebuild drops them
+            start = bisect.bisect_left(rows, (now, 0), key=_sort_key)
+            page = rows[start:start + limit]
+            if len(page) == limit or airport not in self._full:
+                return page
+            self._stats["fallbacks"] += 1
+        # the board cut this origin short (a larger limit, or kept flights left or were cancelled since the rebuild)
+        return [self._row(r) for r in query_all("departure_board_origin", (airport, limit))]
+
+    def start_refresher(self, interval: float = 60): #Rebuild the board in a background thread every interval seconds
+        def run():
+            while True:
+                try:
+                    self.rebuild()
+                except sqlite3.Error:
+                    pass
+                time.sleep(interval)
+        thread = threading.Thread(target=run, name="departure-board-refresher", daemon=True)
+        thread.start()
+        return thread
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(
+                self._stats,
+                flights=len(self._flights),
+                age_seconds=None if self._built_at is None else round(time.time() - self._built_at, 1)
+            )
+
+
+search_index = FlightSearchIndex()
+fare_calendar = FareCalendar()
+connection_graph = ConnectionGraph()
+airport_resolver = AirportResolver()
+place_trie = PlaceTrie()
+departure_board = DepartureBoard()
+subscribe("flight_created", search_index.refresh_flight)
+subscribe("flight_cancelled", search_index.refresh_flight)
+subscribe("flight_created", connection_graph.refresh_flight)
+subscribe("flight_cancelled", connection_graph.refresh_flight)
+for _event in ("reservations_changed", "flight_created", "flight_cancelled"):
+    subscribe(_event, departure_board.refresh_flight)
+subscribe("reference_data_changed", airport_resolver.invalidate)
+subscribe("reference_data_changed", place_trie.rebuild)
+for _event in ("reservations_changed", "flight_created", "flight_cancelled"):
+    subscribe(_event, fare_calendar.invalidate_flight)
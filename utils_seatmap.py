@@ -0,0 +1,87 @@
+import base64
+
+
+class SeatMap: #Taken seats of one class on one flight as a bitmap, seat (row, column) is bit (row - 1) * columns + (column - 1)
+    __slots__ = ("rows", "columns", "bits")
+
+    def __init__(self, rows: int, columns: int, bits: bytes | None = None):
+        self.rows = rows
+        self.columns = columns
+        size = (rows * columns + 7) // 8
+        self.bits = bytearray(bits) if bits is not None else bytearray(size)
+        if len(self.bits) != size:
+            raise ValueError("seat map size does not match rows and columns")
+
+    def _index(self, row: int, column: int) -> int:
+        if not (1 <= row <= self.rows and 1 <= column <= self.columns):
+            raise IndexError(f"seat {row}-{column} is outside a {self.rows}x{self.columns} class")
+        return (row - 1) * self.columns + (column - 1)
+
+    @classmethod
+    def full(cls, rows: int, columns: int) -> "SeatMap": #Every seat set, the bits past the last seat stay clear
+        seat_map = cls(rows, columns, b"\xff" * ((rows * columns + 7) // 8))
+        if rows * columns % 8:
+            seat_map.bits[-1] = (1 << (rows * columns % 8)) - 1
+        return seat_map
+
+    def set_taken(self, row: int, column: int):
+        i = self._index(row, column)
+        self.bits[i >> 3] |= 1 << (i & 7)
+
+    def clear(self, row: int, column: int):
+        i = self._index(row, column)
+        self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def union(self, other: "SeatMap") -> "SeatMap":
+        return SeatMap(self.rows, self.columns, bytes(a | b for a, b in zip(self.bits, other.bits)))
+
+    def is_taken(self, row: int, column: int) -> bool:
+        i = self._index(row, column)
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def taken_count(self) -> int:
+        return int.from_bytes(self.bits, "little").bit_count()
+
+    def free_count(self) -> int:
+        return self.rows * self.columns - self.taken_count()
+
+    def to_base64(self) -> str: #A few bytes of text for templates and JSON, read back with from_base64
+        return base64.b64encode(bytes(self.bits)).decode("ascii")
+
+    @classmethod
+    def from_base64(cls, rows: int, columns: int, data: str) -> "SeatMap":
+        return cls(rows, columns, base64.b64decode(data))
+
+    def to_dict(self) -> dict:
+        return {"rows": self.rows, "columns": self.columns, "taken": self.to_base64()}
+
+
+def build_seat_maps(classes, taken_rows) -> dict: #{class_type: SeatMap} from the class rows (type, number_of_rows, number_of_columns) and the taken seat rows
+    seat_maps = {c["type"]: SeatMap(c["number_of_rows"], c["number_of_columns"]) for c in classes}
+    for r in taken_rows:
+        seat_map = seat_maps.get(r["class_type"])
+        if seat_map is not None:
+            seat_map.set_taken(r["row_number"], r["column_number"])
+    return seat_maps
+
+
+def seat_map_payload(seat_page) -> dict: #What the seat pages draw from: the flight, its layout URL, a price per class and a bitmap per class of seats that cannot be picked (sold, held or not on sale)
+    flight = seat_page["flight"]
+    prices, unavailable = {}, {}
+    for c in seat_page["classes"]:
+        seats = seat_page["seats_by_class"].get(c["type"], [])
+        # seats the flight does not sell (no seats_in_flights row) cannot be picked either
+        not_sold = SeatMap.full(c["number_of_rows"], c["number_of_columns"])
+        for s in seats:
+            not_sold.clear(s["row_number"], s["column_number"])
+        # seats another checkout holds are out too until the hold is bought, released or expires
+        unavailable[c["type"]] = not_sold.union(seat_page["seat_maps"][c["type"]]).union(seat_page["hold_maps"][c["type"]]).to_base64()
+        # create_flight_with_crew_and_prices gives every seat of a class the same price, review_order prices each seat again anyway
+        prices[c["type"]] = seats[0]["price"] if seats else None
+    return {
+        "flight": {k: flight[k] for k in ("flight_number", "departure_datetime", "origin_airport", "destination_airport", "aircraft_id_number", "status")},
+        "classes": [c["type"] for c in seat_page["classes"]],
+        "layout_url": f"/api/aircraft/{flight['aircraft_id_number']}/layout",
+        "prices": prices,
+        "unavailable": unavailable,
+    }